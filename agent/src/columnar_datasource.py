@@ -0,0 +1,142 @@
+import os
+from datetime import datetime, timedelta
+from typing import List
+
+import numpy as np
+
+from domain.aggregated_data import AggregatedData
+from domain.accelerometer import Accelerometer
+from domain.gps import Gps
+
+
+def load_columns(filename: str, dtype) -> np.ndarray:
+    """
+    Load a CSV file with a header row into a 2D typed array.
+    A binary `.npy` copy is cached next to the CSV, so subsequent runs
+    memory-map it instead of parsing text again.
+    """
+    cache_filename = f"{filename}.npy"
+    if os.path.exists(cache_filename) and os.path.getmtime(cache_filename) >= os.path.getmtime(filename):
+        return np.load(cache_filename, mmap_mode='r')
+
+    columns = np.loadtxt(filename, delimiter=',', skiprows=1, dtype=dtype, ndmin=2)
+    try:
+        np.save(cache_filename, columns)
+    except OSError:
+        # Read-only data directory, keep the parsed copy in memory
+        pass
+    return columns
+
+
+class ColumnarDatasource:
+    """
+    Datasource that serves samples from preloaded sensor columns.
+    Every tick has one shared index, each sensor maps it onto its own
+    rows with wrap-around, so streams of different length never drift apart.
+    """
+
+    def __init__(self, accelerometer_filename: str, gps_filename: str, offset: int = 0, user_id: int = 0):
+        self.accelerometer_filename = accelerometer_filename
+        self.gps_filename = gps_filename
+        self.offset = offset
+        self.user_id = user_id
+
+        self.accelerometer = None
+        self.gps = None
+        self.index = offset
+
+
+    def __len__(self) -> int:
+        """Number of ticks before the longest sensor stream wraps"""
+        return max(len(self.accelerometer), len(self.gps))
+
+
+    def read(self) -> AggregatedData:
+        data = self.read_at(self.index)
+        self.index += 1
+        return data
+
+
+    def read_slice(self, count: int) -> List[AggregatedData]:
+        """Read the next `count` samples in one vectorized lookup"""
+        indexes = np.arange(self.index, self.index + count)
+        self.index += count
+
+        accelerometer = self.accelerometer[indexes % len(self.accelerometer)].tolist()
+        gps = self.gps[indexes % len(self.gps)].tolist()
+        timestamp = datetime.now()
+
+        return [
+            AggregatedData(
+                Accelerometer(x=x, y=y, z=z),
+                Gps(longitude=longitude, latitude=latitude, timestamp=timestamp),
+                timestamp,
+                self.user_id
+            )
+            for (x, y, z), (longitude, latitude) in zip(accelerometer, gps)
+        ]
+
+
+    def read_timed(
+        self, start: int, count: int, accelerometer_rate: float, gps_rate: float, origin: datetime
+    ) -> List[AggregatedData]:
+        """
+        Read accelerometer samples `start`..`start + count` of a stream sampled at `accelerometer_rate`.
+        GPS positions for the sample times are interpolated over the track sampled at `gps_rate`,
+        GPS timestamps are the times of the latest fix.
+        """
+        indexes = np.arange(start, start + count)
+        seconds = indexes / accelerometer_rate
+        fixes = np.floor(seconds * gps_rate) / gps_rate
+
+        accelerometer = self.accelerometer[(indexes + self.offset) % len(self.accelerometer)].tolist()
+        gps = self.interpolate_gps(seconds * gps_rate + self.offset).tolist()
+        timestamps = [origin + timedelta(microseconds=offset) for offset in np.rint(seconds * 1e6).tolist()]
+        fix_timestamps = [origin + timedelta(microseconds=offset) for offset in np.rint(fixes * 1e6).tolist()]
+
+        return [
+            AggregatedData(
+                Accelerometer(x=x, y=y, z=z),
+                Gps(longitude=longitude, latitude=latitude, timestamp=fix_timestamp),
+                timestamp,
+                self.user_id
+            )
+            for (x, y, z), (longitude, latitude), fix_timestamp, timestamp
+            in zip(accelerometer, gps, fix_timestamps, timestamps)
+        ]
+
+
+    def interpolate_gps(self, positions: np.ndarray) -> np.ndarray:
+        """Linearly interpolate the GPS track at fractional row positions, wrapping at the end of the track"""
+        rows = np.floor(positions).astype(np.int64)
+        fraction = (positions - rows)[:, np.newaxis]
+        start = self.gps[rows % len(self.gps)]
+        end = self.gps[(rows + 1) % len(self.gps)]
+        return start + (end - start) * fraction
+
+
+    def read_at(self, index: int) -> AggregatedData:
+        x, y, z = self.accelerometer[index % len(self.accelerometer)].tolist()
+        longitude, latitude = self.gps[index % len(self.gps)].tolist()
+        timestamp = datetime.now()
+
+        return AggregatedData(
+            Accelerometer(x=x, y=y, z=z),
+            Gps(longitude=longitude, latitude=latitude, timestamp=timestamp),
+            timestamp,
+            self.user_id
+        )
+
+
+    def startReading(self):
+        if self.accelerometer is None:
+            self.accelerometer = load_columns(self.accelerometer_filename, np.int32)
+        if self.gps is None:
+            self.gps = load_columns(self.gps_filename, np.float64)
+
+        self.index = self.offset
+
+
+    def stopReading(self):
+        # Columns stay loaded, so restarting the stream costs no parsing
+        self.index = self.offset
@@ -10,6 +10,39 @@ def try_parse(type, value: str):
 MQTT_BROKER_HOST = os.environ.get('MQTT_BROKER_HOST') or 'mqtt'
 MQTT_BROKER_PORT = try_parse(int, os.environ.get('MQTT_BROKER_PORT')) or 1883
 MQTT_TOPIC = os.environ.get('MQTT_TOPIC') or 'agent'
+# Vehicles publish on their own topics, hashed into shards that edge processes subscribe to (must match edge)
+VEHICLE_SHARDS = try_parse(int, os.environ.get('VEHICLE_SHARDS')) or 64
+# Vehicle id of a single agent, fleet agents are numbered from 0
+USER_ID = try_parse(int, os.environ.get('USER_ID')) or 0
 
 # Delay for sending data to mqtt in seconds
-DELAY = try_parse(float, os.environ.get('DELAY')) or 1
\ No newline at end of file
+DELAY = try_parse(float, os.environ.get('DELAY')) or 1
+
+# Sensor sampling rates in Hz, by default both sensors are sampled every DELAY
+ACCELEROMETER_RATE = try_parse(float, os.environ.get('ACCELEROMETER_RATE')) or 1 / DELAY
+GPS_RATE = try_parse(float, os.environ.get('GPS_RATE')) or ACCELEROMETER_RATE
+
+# Wire codec for single-sample messages: json, msgpack or struct, optionally with +zlib or +zstd
+WIRE_CODEC = os.environ.get('WIRE_CODEC') or 'json'
+
+# Batched envelopes: samples per message and max window in seconds (1 and 0 disable batching)
+BATCH_SIZE = try_parse(int, os.environ.get('BATCH_SIZE')) or 1
+BATCH_WINDOW = try_parse(float, os.environ.get('BATCH_WINDOW')) or 0
+
+# Fleet mode: number of simulated vehicles driven from this process (0 runs a single agent)
+FLEET_SIZE = try_parse(int, os.environ.get('FLEET_SIZE')) or 0
+# Samples per second sent by each fleet agent
+FLEET_RATE = try_parse(float, os.environ.get('FLEET_RATE')) or 1 / DELAY
+FLEET_WORKERS = try_parse(int, os.environ.get('FLEET_WORKERS')) or 4
+# Interval between fleet throughput reports in seconds
+FLEET_REPORT_INTERVAL = try_parse(float, os.environ.get('FLEET_REPORT_INTERVAL')) or 5
+
+
+# Store-and-forward spool for messages that could not be published (empty disables spooling)
+SPOOL_DIR = os.environ.get('SPOOL_DIR') or ''
+SPOOL_SEGMENT_BYTES = try_parse(int, os.environ.get('SPOOL_SEGMENT_BYTES')) or 4 * 1024 * 1024
+SPOOL_MAX_BYTES = try_parse(int, os.environ.get('SPOOL_MAX_BYTES')) or 256 * 1024 * 1024
+# Longest time in seconds spooled messages may stay unsynced to disk
+SPOOL_SYNC_INTERVAL = try_parse(float, os.environ.get('SPOOL_SYNC_INTERVAL')) or 1
+# Messages republished per drain batch after reconnect
+SPOOL_DRAIN_BATCH = try_parse(int, os.environ.get('SPOOL_DRAIN_BATCH')) or 1000
@@ -11,4 +11,5 @@ class AggregatedData:
     gps: Gps
     # parking: Parking
     timestamp: datetime
+    user_id: int = 0
     
\ No newline at end of file
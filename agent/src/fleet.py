@@ -0,0 +1,186 @@
+import heapq
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from schema.aggregated_data_schema import AggregatedDataSchema
+from schema.aggregated_data_envelope import dump_envelope
+from codec import Codec, get_codec, topic_for, vehicle_topic
+from columnar_datasource import ColumnarDatasource
+
+
+@dataclass(order=True)
+class VirtualAgent:
+    """Simulated vehicle replaying the shared datasource from its own phase offset"""
+    next_deadline: float
+    agent_id: int = field(compare=False)
+    index: int = field(compare=False)
+    period: float = field(compare=False)
+    # Wall time of sample 0 of the replayed stream, the sample at `index` is stamped `index / rate` seconds later
+    origin: datetime = field(compare=False)
+    # Per-vehicle topic, with the batch or codec suffix
+    topic: str = field(compare=False)
+
+
+class FleetStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.published = 0
+        self.failed = 0
+
+    def add(self, published: int, failed: int):
+        with self.lock:
+            self.published += published
+            self.failed += failed
+
+    def snapshot(self):
+        with self.lock:
+            return self.published, self.failed
+
+
+class Fleet:
+    """
+    Drives many virtual agents from one process.
+    Agents are split between worker threads, each worker owns an MQTT client
+    and a deadline heap of its agents, so the publish rate of one agent does
+    not depend on how many others share the process.
+    """
+
+    def __init__(
+        self,
+        connect: Callable,
+        topic: str,
+        datasource: ColumnarDatasource,
+        size: int,
+        rate: float,
+        gps_rate: float = None,
+        shards: int = 64,
+        workers: int = 4,
+        report_interval: float = 5,
+        batch_size: int = 1,
+        batch_window: float = 0,
+        codec: Codec = None,
+    ):
+        self.connect = connect
+        self.topic = topic
+        self.datasource = datasource
+        self.size = size
+        self.rate = rate
+        self.gps_rate = gps_rate or rate
+        self.shards = shards
+        self.workers = max(1, min(workers, size))
+        self.report_interval = report_interval
+        self.batch_size = max(1, batch_size)
+        self.batch_window = max(0, batch_window)
+        self.batching = self.batch_size > 1 or self.batch_window > 0
+        # Like a single agent, every deadline publishes one window, split into envelopes of batch_size samples
+        self.samples = max(1, round(self.batch_window * rate)) if self.batch_window > 0 else self.batch_size
+        self.codec = codec or get_codec("json")
+
+        self.stats = FleetStats()
+        self.running = threading.Event()
+        self.threads: List[threading.Thread] = []
+
+
+    def start(self):
+        self.datasource.startReading()
+        self.running.set()
+
+        # In batch mode every deadline publishes the samples of one window or one envelope
+        period = self.samples / self.rate
+        start = time.monotonic()
+        origin = datetime.now()
+        stride = max(1, len(self.datasource) // self.size)
+        agents = []
+        for agent_id in range(self.size):
+            # Spread first deadlines over one period to avoid bursts
+            delay = period * agent_id / self.size
+            index = agent_id * stride
+            agents.append(VirtualAgent(
+                next_deadline=start + delay,
+                agent_id=agent_id,
+                index=index,
+                period=period,
+                origin=origin + timedelta(seconds=delay - index / self.rate),
+                topic=self._topic(agent_id),
+            ))
+
+        for worker_id in range(self.workers):
+            thread = threading.Thread(
+                target=self._run_worker,
+                args=(agents[worker_id::self.workers],),
+                name=f"fleet-worker-{worker_id}",
+                daemon=True,
+            )
+            thread.start()
+            self.threads.append(thread)
+
+
+    def stop(self):
+        self.running.clear()
+        for thread in self.threads:
+            thread.join()
+        self.threads.clear()
+        self.datasource.stopReading()
+
+
+    def report(self):
+        """Print aggregate publish rate and failure counters until stopped"""
+        last_published, _ = self.stats.snapshot()
+        last_time = time.monotonic()
+
+        while self.running.is_set():
+            time.sleep(self.report_interval)
+            published, failed = self.stats.snapshot()
+            now = time.monotonic()
+            rate = (published - last_published) / (now - last_time)
+            print(f"Fleet of {self.size} agents: {rate:.1f} msgs/sec, {published} published, {failed} failed")
+            last_published, last_time = published, now
+
+
+    def _topic(self, agent_id: int) -> str:
+        topic = vehicle_topic(self.topic, agent_id, self.shards)
+        return f"{topic}/batch" if self.batching else topic_for(topic, self.codec)
+
+
+    def _run_worker(self, agents: List[VirtualAgent]):
+        client = self.connect()
+        schema = AggregatedDataSchema()
+        heapq.heapify(agents)
+
+        while self.running.is_set():
+            now = time.monotonic()
+            published = failed = 0
+
+            while agents[0].next_deadline <= now:
+                agent = agents[0]
+                # Samples are stamped at the agent rate like a real sensor, not with the time they are read
+                batch = self.datasource.read_timed(agent.index, self.samples, self.rate, self.gps_rate, agent.origin)
+                for data in batch:
+                    data.user_id = agent.agent_id
+                if self.batching:
+                    size = self.batch_size if self.batch_size > 1 else len(batch)
+                    messages = [dump_envelope(batch[i:i + size]) for i in range(0, len(batch), size)]
+                else:
+                    messages = [self.codec.encode([schema.dump(batch[0])])]
+                for msg in messages:
+                    result = client.publish(agent.topic, msg)
+                    if result[0] == 0:
+                        published += 1
+                    else:
+                        failed += 1
+
+                agent.index += self.samples
+                # Advance from the previous deadline, not from now, so lateness does not accumulate
+                agent.next_deadline += agent.period
+                heapq.heapreplace(agents, agent)
+
+            self.stats.add(published, failed)
+            delay = agents[0].next_deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        client.loop_stop()
+        client.disconnect()
@@ -1,8 +1,11 @@
 from paho.mqtt import client as mqtt_client
-import json
-import time
 from schema.aggregated_data_schema import AggregatedDataSchema
-from file_datasource import FileDatasource
+from schema.aggregated_data_envelope import dump_envelope
+from codec import get_codec, topic_for, vehicle_topic
+from columnar_datasource import ColumnarDatasource
+from fleet import Fleet
+from scheduler import SensorScheduler
+from spool import Spool, SpooledPublisher
 import config
 
 
@@ -25,13 +28,18 @@ def connect_mqtt(broker, port):
     return client
     
 
-def publish(client, topic, datasource, delay):
-    datasource.startReading()
+def publish(client, topic, scheduler, batch_size=1, batch_window=0, codec=None):
+    codec = codec or get_codec("json")
+    batching = batch_size > 1 or batch_window > 0
+    if batching:
+        # Batched envelopes go to a topic suffix, so edge knows how to decode them
+        topic = f"{topic}/batch"
+    else:
+        topic = topic_for(topic, codec)
 
-    while True:
-        time.sleep(delay)
-        data = datasource.read()
-        msg = AggregatedDataSchema().dumps(data)
+    schema = AggregatedDataSchema()
+
+    def send(msg):
         result = client.publish(topic, msg) # result: [0, 1]
         status = result[0]
 
@@ -41,16 +49,66 @@ def publish(client, topic, datasource, delay):
         else:
             print(f"Failed to send message to topic {topic}")
 
+    def emit(batch):
+        if not batching:
+            for data in batch:
+                send(codec.encode([schema.dump(data)]))
+            return
+
+        size = batch_size if batch_size > 1 else len(batch)
+        for start in range(0, len(batch), size):
+            send(dump_envelope(batch[start:start + size]))
+
+    # Infinity publish data
+    scheduler.run(emit)
+
+
+def run_fleet():
+    fleet = Fleet(
+        connect=lambda: connect_mqtt(config.MQTT_BROKER_HOST, config.MQTT_BROKER_PORT),
+        topic=config.MQTT_TOPIC,
+        datasource=ColumnarDatasource("data/accelerometer.csv", "data/gps.csv"),
+        size=config.FLEET_SIZE,
+        shards=config.VEHICLE_SHARDS,
+        rate=config.FLEET_RATE,
+        gps_rate=config.GPS_RATE,
+        workers=config.FLEET_WORKERS,
+        report_interval=config.FLEET_REPORT_INTERVAL,
+        batch_size=config.BATCH_SIZE,
+        batch_window=config.BATCH_WINDOW,
+        codec=get_codec(config.WIRE_CODEC),
+    )
+    fleet.start()
+    try:
+        fleet.report()
+    except KeyboardInterrupt:
+        fleet.stop()
+
 
 def run():
+    if config.FLEET_SIZE > 0:
+        return run_fleet()
+
     # Prepare mqtt client
     client = connect_mqtt(config.MQTT_BROKER_HOST, config.MQTT_BROKER_PORT)
+    if config.SPOOL_DIR:
+        # Park messages on disk while the broker is unreachable
+        spool = Spool(config.SPOOL_DIR, config.SPOOL_SEGMENT_BYTES, config.SPOOL_MAX_BYTES, config.SPOOL_SYNC_INTERVAL)
+        client = SpooledPublisher(client, spool, config.SPOOL_DRAIN_BATCH)
+        client.start()
 
     # Prepare datasource
-    datasource = FileDatasource("data/accelerometer.csv", "data/gps.csv")
+    datasource = ColumnarDatasource("data/accelerometer.csv", "data/gps.csv", user_id=config.USER_ID)
 
-    # Infinity publish data
-    publish(client, config.MQTT_TOPIC, datasource, config.DELAY)
+    # Each tick publishes one sample, one envelope of BATCH_SIZE samples or one BATCH_WINDOW
+    if config.BATCH_WINDOW > 0:
+        interval = config.BATCH_WINDOW
+    else:
+        interval = config.BATCH_SIZE / config.ACCELEROMETER_RATE
+    scheduler = SensorScheduler(datasource, config.ACCELEROMETER_RATE, config.GPS_RATE, interval)
+
+    topic = vehicle_topic(config.MQTT_TOPIC, config.USER_ID, config.VEHICLE_SHARDS)
+    publish(client, topic, scheduler, config.BATCH_SIZE, config.BATCH_WINDOW, get_codec(config.WIRE_CODEC))
 
 if __name__ == '__main__':
     run()
\ No newline at end of file
@@ -0,0 +1,50 @@
+import time
+from datetime import datetime
+from typing import Callable, List
+
+from domain.aggregated_data import AggregatedData
+from columnar_datasource import ColumnarDatasource
+
+
+class SensorScheduler:
+    """
+    Emits sensor samples at their own rates against a monotonic deadline clock.
+    Every `interval` seconds all accelerometer samples that became due are read at once,
+    deadlines are computed from the start time, so processing time never accumulates as drift.
+    """
+
+    def __init__(self, datasource: ColumnarDatasource, accelerometer_rate: float, gps_rate: float, interval: float):
+        self.datasource = datasource
+        self.accelerometer_rate = accelerometer_rate
+        self.gps_rate = gps_rate
+        self.interval = interval
+        self.running = False
+
+
+    def run(self, emit: Callable[[List[AggregatedData]], None]):
+        self.datasource.startReading()
+        self.running = True
+
+        origin = datetime.now()
+        start = time.monotonic()
+        emitted = 0
+        tick = 1
+
+        while self.running:
+            deadline = start + tick * self.interval
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            # Samples due by this deadline, the epsilon absorbs float rounding of exact multiples
+            due = int(tick * self.interval * self.accelerometer_rate + 1e-9)
+            if due > emitted:
+                emit(self.datasource.read_timed(emitted, due - emitted, self.accelerometer_rate, self.gps_rate, origin))
+                emitted = due
+            tick += 1
+
+        self.datasource.stopReading()
+
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,51 @@
+import base64
+import json
+import sys
+import time
+from array import array
+from typing import List
+
+from domain.aggregated_data import AggregatedData
+
+
+def pack(values: list, typecode: str):
+    """
+    Encode a column once when all values are equal,
+    otherwise as a base64 little-endian packed array.
+    """
+    if all(value == values[0] for value in values):
+        return values[0]
+
+    packed = array(typecode, values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode('ascii')
+
+
+def dump_envelope(batch: List[AggregatedData]) -> str:
+    """
+    Serialize a window of samples into one message.
+    Timestamps are stored as microsecond offsets from the first sample.
+    """
+    base = batch[0].timestamp
+
+    def offsets(timestamps):
+        return pack([round((timestamp - base).total_seconds() * 1_000_000) for timestamp in timestamps], 'q')
+
+    return json.dumps({
+        'samples': len(batch),
+        'trace': {'agent': time.time()},
+        'user_id': batch[0].user_id,
+        'timestamp': base.isoformat(),
+        'offsets': offsets([data.timestamp for data in batch]),
+        'accelerometer': {
+            'x': pack([data.accelerometer.x for data in batch], 'i'),
+            'y': pack([data.accelerometer.y for data in batch], 'i'),
+            'z': pack([data.accelerometer.z for data in batch], 'i'),
+        },
+        'gps': {
+            'longitude': pack([data.gps.longitude for data in batch], 'd'),
+            'latitude': pack([data.gps.latitude for data in batch], 'd'),
+            'offsets': offsets([data.gps.timestamp for data in batch]),
+        },
+    })
@@ -1,4 +1,6 @@
-from marshmallow import Schema, fields
+import time
+
+from marshmallow import Schema, fields, post_dump
 from schema.accelerometer_schema import AccelerometerSchema
 from schema.gps_schema import GpsSchema
 from schema.parking_schema import ParkingSchema
@@ -9,4 +11,10 @@ class AggregatedDataSchema(Schema):
     gps = fields.Nested(GpsSchema)
     # parking = fields.Nested(ParkingSchema)
     timestamp = fields.DateTime('iso')
-    
\ No newline at end of file
+    user_id = fields.Int()
+
+    @post_dump
+    def add_trace(self, data, **kwargs):
+        # Trace context: unix time each hop sent the record, edge and hub add their own
+        data['trace'] = {'agent': time.time()}
+        return data
@@ -0,0 +1,279 @@
+import os
+import struct
+import threading
+import time
+from typing import List, Optional, Tuple
+
+
+class Spool:
+    """
+    Bounded on-disk append-only queue of MQTT messages.
+    Messages are appended to numbered segment files as length-prefixed records,
+    a checkpoint file stores the segment and byte offset of the first undelivered message.
+    When a new segment is started and the spool is past `max_bytes`, the oldest segments are dropped.
+    Appends are synced to disk at most every `sync_interval` seconds and when a segment is closed,
+    a record torn by a crash is truncated from the last segment when the spool is opened.
+    """
+
+    RECORD_HEADER = struct.Struct("<I")
+    CHECKPOINT = struct.Struct("<QQ")
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 4 * 1024 * 1024,
+        max_bytes: int = 256 * 1024 * 1024,
+        sync_interval: float = 1,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self.checkpoint_filename = os.path.join(directory, "checkpoint")
+        self.segments = sorted(
+            int(name.split(".")[0]) for name in os.listdir(directory) if name.endswith(".segment")
+        ) or [0]
+        self.read_segment, self.read_offset = self._load_checkpoint()
+        if self.read_segment not in self.segments:
+            self.read_segment, self.read_offset = self.segments[0], 0
+
+        self.write_file = open(self._segment_filename(self.segments[-1]), "ab")
+        self._truncate_torn_record()
+        self.synced = time.monotonic()
+        self.drained = 0
+        self.drained_since = time.monotonic()
+
+
+    def append(self, topic: str, payload) -> None:
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        topic = topic.encode("utf-8")
+        record = self.RECORD_HEADER.pack(len(topic)) + topic + self.RECORD_HEADER.pack(len(payload)) + payload
+
+        with self.lock:
+            if self.write_file.tell() + len(record) > self.segment_bytes and self.write_file.tell() > 0:
+                self._roll()
+                self._enforce_limit()
+            self.write_file.write(record)
+            self.write_file.flush()
+            if time.monotonic() - self.synced >= self.sync_interval:
+                self._sync()
+
+
+    def peek(self, count: int) -> Tuple[List[Tuple[str, bytes]], Tuple[int, int]]:
+        """
+        Read up to `count` oldest messages without removing them.
+        Returns the messages and the position to `commit` once they are delivered.
+        """
+        with self.lock:
+            messages = []
+            segment, offset = self.read_segment, self.read_offset
+            while len(messages) < count:
+                with open(self._segment_filename(segment), "rb") as file:
+                    file.seek(offset)
+                    while len(messages) < count:
+                        start = file.tell()
+                        record = self._read_record(file)
+                        if record is None:
+                            # End of the segment, or a damaged tail that is skipped with the rest of it
+                            file.seek(start)
+                            break
+                        messages.append(record)
+                    offset = file.tell()
+
+                next_segments = [s for s in self.segments if s > segment]
+                if len(messages) >= count or not next_segments:
+                    break
+                segment, offset = next_segments[0], 0
+            return messages, (segment, offset)
+
+
+    def commit(self, position: Tuple[int, int], count: int) -> None:
+        """Mark messages up to `position` as delivered and delete fully drained segments"""
+        with self.lock:
+            segment, offset = position
+            # Segments may have been dropped by the size limit while messages were in flight
+            if segment not in self.segments:
+                return
+            for drained in [s for s in self.segments if s < segment]:
+                os.remove(self._segment_filename(drained))
+                self.segments.remove(drained)
+            self.read_segment, self.read_offset = segment, offset
+            self._save_checkpoint()
+            self.drained += count
+
+
+    def backlog_bytes(self) -> int:
+        with self.lock:
+            total = sum(os.path.getsize(self._segment_filename(segment)) for segment in self.segments)
+            return total - self.read_offset
+
+
+    def drain_rate(self) -> float:
+        """Messages per second drained since the previous call"""
+        with self.lock:
+            now = time.monotonic()
+            rate = self.drained / (now - self.drained_since)
+            self.drained, self.drained_since = 0, now
+            return rate
+
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            self.write_file.close()
+
+
+    def _roll(self):
+        self._sync()
+        self.write_file.close()
+        self.segments.append(self.segments[-1] + 1)
+        self.write_file = open(self._segment_filename(self.segments[-1]), "ab")
+
+
+    def _enforce_limit(self):
+        total = sum(os.path.getsize(self._segment_filename(segment)) for segment in self.segments)
+        while total > self.max_bytes and len(self.segments) > 1:
+            dropped = self.segments.pop(0)
+            total -= os.path.getsize(self._segment_filename(dropped))
+            os.remove(self._segment_filename(dropped))
+            print(f"Spool is full, dropped segment {dropped}")
+            if self.read_segment == dropped:
+                self.read_segment, self.read_offset = self.segments[0], 0
+                self._save_checkpoint()
+
+
+    def _sync(self):
+        os.fsync(self.write_file.fileno())
+        self.synced = time.monotonic()
+
+
+    def _read_record(self, file) -> Optional[Tuple[str, bytes]]:
+        """Read the record at the file position, None at the end of the file or for a torn record"""
+        topic = self._read_field(file)
+        payload = self._read_field(file) if topic is not None else None
+        if payload is None:
+            return None
+        try:
+            return topic.decode("utf-8"), payload
+        except UnicodeDecodeError:
+            return None
+
+
+    def _read_field(self, file) -> Optional[bytes]:
+        header = file.read(self.RECORD_HEADER.size)
+        if len(header) < self.RECORD_HEADER.size:
+            return None
+        size = self.RECORD_HEADER.unpack(header)[0]
+        field = file.read(size)
+        return field if len(field) == size else None
+
+
+    def _truncate_torn_record(self):
+        """Cut a record the process did not finish writing off the end of the last segment"""
+        filename = self._segment_filename(self.segments[-1])
+        with open(filename, "rb") as file:
+            end = 0
+            while self._read_record(file) is not None:
+                end = file.tell()
+        if end < self.write_file.tell():
+            print(f"Spool segment {self.segments[-1]} has a torn record, truncated to {end} bytes")
+            self.write_file.truncate(end)
+            if self.read_segment == self.segments[-1] and self.read_offset > end:
+                self.read_offset = end
+                self._save_checkpoint()
+
+
+    def _segment_filename(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:012d}.segment")
+
+
+    def _load_checkpoint(self) -> Tuple[int, int]:
+        try:
+            with open(self.checkpoint_filename, "rb") as file:
+                return self.CHECKPOINT.unpack(file.read(self.CHECKPOINT.size))
+        except (OSError, struct.error):
+            return self.segments[0], 0
+
+
+    def _save_checkpoint(self):
+        # Write and rename, so a crash never leaves a torn checkpoint
+        temporary_filename = f"{self.checkpoint_filename}.tmp"
+        with open(temporary_filename, "wb") as file:
+            file.write(self.CHECKPOINT.pack(self.read_segment, self.read_offset))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_filename, self.checkpoint_filename)
+
+
+class SpooledPublisher:
+    """
+    Publishes through an MQTT client and parks messages in a spool when the broker is unreachable.
+    A background thread drains the spool in bulk batches after reconnect while live data keeps flowing.
+    """
+
+    def __init__(self, client, spool: Spool, drain_batch: int = 1000, report_interval: float = 10):
+        self.client = client
+        self.spool = spool
+        self.drain_batch = drain_batch
+        self.report_interval = report_interval
+        self.running = threading.Event()
+        self.thread = None
+
+
+    def publish(self, topic: str, payload):
+        if self.client.is_connected():
+            result = self.client.publish(topic, payload)
+            if result[0] == 0:
+                return result
+        self.spool.append(topic, payload)
+        # The message is safe on disk, report success like a queued publish
+        return (0, None)
+
+
+    def start(self):
+        self.running.set()
+        self.thread = threading.Thread(target=self._drain, name="spool-drain", daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+        self.running.clear()
+        if self.thread:
+            self.thread.join()
+        self.spool.close()
+
+
+    def _drain(self):
+        last_report = time.monotonic()
+
+        while self.running.is_set():
+            try:
+                if time.monotonic() - last_report >= self.report_interval:
+                    backlog = self.spool.backlog_bytes()
+                    if backlog:
+                        print(f"Spool backlog: {backlog} bytes, draining {self.spool.drain_rate():.1f} msgs/sec")
+                    last_report = time.monotonic()
+
+                if not self.client.is_connected():
+                    time.sleep(0.5)
+                    continue
+
+                messages, position = self.spool.peek(self.drain_batch)
+                if not messages:
+                    time.sleep(0.5)
+                    continue
+
+                delivered = all(self.client.publish(topic, payload)[0] == 0 for topic, payload in messages)
+                if delivered:
+                    self.spool.commit(position, len(messages))
+                else:
+                    # Connection dropped mid-batch, the whole batch is resent after reconnect
+                    time.sleep(0.5)
+            except Exception as e:
+                # Keep draining, the spool keeps undelivered messages until they are committed
+                print(f"Error draining spool: {e}")
+                time.sleep(0.5)
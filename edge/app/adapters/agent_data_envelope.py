@@ -0,0 +1,79 @@
+import base64
+import binascii
+import json
+import sys
+from array import array
+from datetime import datetime, timedelta
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app.entities.agent_data import AgentData
+
+agent_data_list = TypeAdapter(List[AgentData])
+
+
+def unpack(value, typecode: str, count: int) -> list:
+    """
+    Decode a column written by the agent envelope encoder:
+    either a single shared value or a base64 little-endian packed array.
+    """
+    if not isinstance(value, str):
+        return [value] * count
+
+    unpacked = array(typecode)
+    unpacked.frombytes(base64.b64decode(value))
+    if sys.byteorder == "big":
+        unpacked.byteswap()
+    if len(unpacked) != count:
+        raise ValueError(f"Envelope column has {len(unpacked)} values, expected {count}")
+    return unpacked.tolist()
+
+
+def load_envelope(payload: str) -> List[AgentData]:
+    """
+    Expand one batched MQTT envelope from the agent into agent data samples.
+    Parameters:
+        payload (str): JSON envelope with shared fields and packed sample columns.
+    Returns:
+        agent_data_batch (List[AgentData]): One AgentData per sample in the envelope.
+    Raises:
+        ValueError: The envelope is malformed or a sample does not validate.
+    """
+    try:
+        envelope = json.loads(payload)
+        count = envelope["samples"]
+        if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+            raise ValueError(f"Envelope sample count must be a positive integer, got {count!r}")
+        base = datetime.fromisoformat(envelope["timestamp"])
+
+        def timestamps(offsets):
+            return [base + timedelta(microseconds=offset) for offset in unpack(offsets, "q", count)]
+
+        trace = envelope.get("trace")
+        user_id = envelope.get("user_id")
+        accelerometer = envelope["accelerometer"]
+        gps = envelope["gps"]
+        columns = zip(
+            unpack(accelerometer["x"], "i", count),
+            unpack(accelerometer["y"], "i", count),
+            unpack(accelerometer["z"], "i", count),
+            unpack(gps["longitude"], "d", count),
+            unpack(gps["latitude"], "d", count),
+            timestamps(gps["offsets"]),
+            timestamps(envelope["offsets"]),
+        )
+    except (KeyError, TypeError, AttributeError, OverflowError, binascii.Error) as e:
+        raise ValueError(f"Malformed agent data envelope: {e!r}")
+
+    # MQTT payloads are untrusted, the whole batch is validated in one call
+    return agent_data_list.validate_python([
+        {
+            "accelerometer": {"x": x, "y": y, "z": z},
+            "gps": {"latitude": latitude, "longitude": longitude, "timestamp": gps_timestamp},
+            "timestamp": timestamp,
+            "user_id": user_id,
+            "trace": trace,
+        }
+        for x, y, z, longitude, latitude, gps_timestamp, timestamp in columns
+    ])
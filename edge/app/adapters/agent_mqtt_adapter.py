@@ -1,8 +1,19 @@
 import logging
+import queue
+import threading
+import time
+from typing import List
+
 import paho.mqtt.client as mqtt
 from app.interfaces.agent_gateway import AgentGateway
 from app.entities.agent_data import AgentData
-from app.usecases.data_processing import process_agent_data
+from app.adapters.agent_data_envelope import load_envelope
+from codec import codec_for_topic, parse_vehicle_topic, shard_subscription
+from metrics import metrics
+from app.usecases.data_processing import RoadSurfaceClassifier
+from app.usecases.road_events import RoadEventClusterer
+from app.usecases.road_segments import RoadSegmenter
+from app.entities.road_event import RoadEvent, RoadSummary
 from app.interfaces.hub_gateway import HubGateway
 from app.adapters.hub_http_adapter import HubHttpAdapter
 from app.adapters.hub_mqtt_adapter import HubMqttAdapter
@@ -26,51 +37,191 @@ class AgentMQTTAdapter(AgentGateway):
         topic,
         hub_gateway: HubGateway,
         batch_size=10,
+        max_latency=0.5,
+        queue_size=10000,
+        workers=1,
+        process_index=0,
+        processes=1,
+        shards=64,
+        road_events: RoadEventClusterer = None,
+        road_segments: RoadSegmenter = None,
     ):
+        # Batching: agent data is queued by the MQTT thread and flushed to the hub by workers
+        # when `batch_size` samples are collected or the oldest one waited `max_latency` seconds
         self.batch_size = batch_size
+        self.max_latency = max_latency
+        # Every worker has its own queue and classifier, a vehicle always goes to the same worker
+        # so windows see its samples in order and carry context across batches
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.classifiers = [RoadSurfaceClassifier() for _ in range(workers)]
+        self.workers = [
+            threading.Thread(target=self._run_worker, args=(i,), name=f"edge-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        self.running = threading.Event()
         # MQTT
         self.broker_host = broker_host
         self.broker_port = broker_port
         self.topic = topic
+        self.processes = processes
+        # Vehicles are hashed into shards by the agents and every edge process owns a fixed set of shards,
+        # so all samples of a vehicle reach the same process in order
+        if processes > 1:
+            self.subscriptions = [shard_subscription(topic, shard) for shard in range(process_index, shards, processes)]
+        else:
+            self.subscriptions = [shard_subscription(topic)]
+        # Agents without per-vehicle topics publish to the shared topic, only the first process consumes it
+        if process_index == 0:
+            self.subscriptions += [topic, f"{topic}/+"]
         self.client = mqtt.Client()
         # Hub
         self.hub_gateway = hub_gateway
+        # In event and segment modes only road events, summaries and segments are sent to the hub, not samples
+        self.road_events = road_events
+        self.road_segments = road_segments
 
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             logging.info("Connected to MQTT broker")
-            self.client.subscribe(self.topic)
+            # Batched envelopes and non-JSON codecs arrive on topic suffixes
+            if self.subscriptions:
+                self.client.subscribe([(subscription, 0) for subscription in self.subscriptions])
         else:
             logging.info(f"Failed to connect to MQTT broker with code: {rc}")
 
     def on_message(self, client, userdata, msg):
-        """Processing agent data and sent it to hub gateway"""
+        """Decode agent data and queue it for the workers, never blocking the MQTT network thread"""
         try:
-            payload: str = msg.payload.decode("utf-8")
-            # Create AgentData instance with the received data
-            agent_data = AgentData.model_validate_json(payload, strict=True)
+            # Per-vehicle topics carry the same payloads as the shared topic and its suffixes
+            user_id, topic = None, msg.topic
+            vehicle = parse_vehicle_topic(msg.topic, self.topic)
+            if vehicle is not None:
+                user_id, topic = vehicle
 
-            # Process the received data (you can call a use case here if needed)
-            processed_data = process_agent_data(agent_data)
+            # Create AgentData instances with the received data
+            with metrics.timer("decode"):
+                if topic == self.topic:
+                    agent_data_batch = [AgentData.model_validate_json(msg.payload, strict=True)]
+                elif topic == f"{self.topic}/batch":
+                    agent_data_batch = load_envelope(msg.payload.decode("utf-8"))
+                else:
+                    codec = codec_for_topic(topic, self.topic)
+                    agent_data_batch = [AgentData.model_validate(record) for record in codec.decode(msg.payload)]
+            # The topic names the vehicle, legacy payloads have no user id
+            if user_id is not None:
+                for agent_data in agent_data_batch:
+                    agent_data.user_id = user_id
+            metrics.count("records_received", len(agent_data_batch))
+            metrics.observe_hops([agent_data_batch[0].trace], {"agent": "agent_to_edge"})
 
-            # Store the agent_data in the database (you can send it to the data processing module)
-            if not self.hub_gateway.save_data(processed_data):
-                logging.error("Hub is not available")
-                
-            logging.info("Agent data sent to hub")
+            # Ids of one process mostly share a remainder modulo the process count, divide it out for the workers
+            for agent_data in agent_data_batch:
+                self.queues[(agent_data.user_id or 0) // self.processes % len(self.queues)].put_nowait(agent_data)
+        except queue.Full:
+            metrics.count("records_dropped")
+            logging.error("Edge queue is full, dropping agent data")
         except Exception as e:
             logging.info(f"Error processing MQTT message: {e}")
 
+    def _run_worker(self, index: int):
+        """Collect queued agent data into batches, process them and send them to the hub gateway"""
+        agent_data_queue = self.queues[index]
+        classifier = self.classifiers[index]
+        batch: List[AgentData] = []
+        deadline = 0
+        next_expiry = time.monotonic() + self.max_latency
+
+        while self.running.is_set() or not agent_data_queue.empty():
+            timeout = max(0, deadline - time.monotonic()) if batch else self.max_latency
+            try:
+                batch.append(agent_data_queue.get(timeout=timeout))
+                if len(batch) == 1:
+                    deadline = time.monotonic() + self.max_latency
+            except queue.Empty:
+                pass
+
+            if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                self._flush(classifier, batch)
+                batch = []
+
+            # Road events and segments are shared by all workers, the first one closes those of idle vehicles
+            if index == 0 and time.monotonic() >= next_expiry:
+                self._expire()
+                next_expiry = time.monotonic() + self.max_latency
+
+        if batch:
+            self._flush(classifier, batch)
+
+    def _flush(self, classifier: RoadSurfaceClassifier, batch: List[AgentData]):
+        try:
+            # Process the received data
+            with metrics.timer("classify"):
+                processed_data_batch = classifier.process(batch)
+
+            if self.road_events is not None or self.road_segments is not None:
+                if self.road_events is not None:
+                    self._send_events(*self.road_events.add(processed_data_batch))
+                if self.road_segments is not None:
+                    self._send_segments(self.road_segments.add(processed_data_batch))
+                return
+
+            # Extend the trace context, samples of one envelope share the agent trace
+            now = time.time()
+            for processed_data in processed_data_batch:
+                agent_data = processed_data.agent_data
+                agent_data.trace = {**(agent_data.trace or {}), "edge": now}
+
+            # Send the whole batch to the hub in one call
+            with metrics.timer("send"):
+                saved = self.hub_gateway.save_batch(processed_data_batch)
+            # Sent records are counted by the hub gateway once the hub has them
+            if not saved:
+                logging.error("Hub is not available")
+                return
+            logging.info(f"{len(processed_data_batch)} agent data passed to hub gateway")
+        except Exception as e:
+            logging.info(f"Error processing agent data batch: {e}")
+
+    def _expire(self):
+        try:
+            if self.road_events is not None:
+                self._send_events(*self.road_events.expire())
+            if self.road_segments is not None:
+                self._send_segments(self.road_segments.expire())
+        except Exception as e:
+            logging.info(f"Error expiring road data: {e}")
+
+    def _send_events(self, road_events: List[RoadEvent], road_summaries: List[RoadSummary]):
+        if road_events and not self.hub_gateway.save_road_events(road_events):
+            logging.error("Hub is not available")
+        if road_summaries and not self.hub_gateway.save_road_summaries(road_summaries):
+            logging.error("Hub is not available")
+
+    def _send_segments(self, road_segments):
+        if road_segments and not self.hub_gateway.save_road_segments(road_segments):
+            logging.error("Hub is not available")
+
     def connect(self):
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.connect(self.broker_host, self.broker_port, 60)
 
     def start(self):
+        self.running.set()
+        for worker in self.workers:
+            worker.start()
         self.client.loop_start()
 
     def stop(self):
+        # Stop receiving first, then let the workers drain queued agent data
         self.client.loop_stop()
+        self.running.clear()
+        for worker in self.workers:
+            worker.join()
+        if self.road_events is not None:
+            self._send_events(*self.road_events.flush())
+        if self.road_segments is not None:
+            self._send_segments(self.road_segments.flush())
 
 
 if __name__ == "__main__":
@@ -85,8 +236,7 @@ if __name__ == "__main__":
     adapter.start()
     try:
         # Keep the adapter running in the background
-        while True:
-            pass
+        threading.Event().wait()
     except KeyboardInterrupt:
         adapter.stop()
         logging.info("Adapter stopped.")
@@ -1,14 +1,54 @@
+import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple
 
 import requests as requests
+from requests.adapters import HTTPAdapter
 
 from app.entities.processed_agent_data import ProcessedAgentData
+from app.entities.road_event import RoadEvent, RoadSummary
+from app.entities.road_segment import RoadSegment
 from app.interfaces.hub_gateway import HubGateway
+from codec import Codec, CompressedCodec, get_codec
+from metrics import metrics
 
 
 class HubHttpAdapter(HubGateway):
-    def __init__(self, api_base_url):
+    def __init__(
+        self,
+        api_base_url,
+        codec: Codec = None,
+        gzip=True,
+        connect_timeout=3.05,
+        read_timeout=10,
+        max_in_flight=4,
+        retries=3,
+        retry_backoff=0.5,
+    ):
         self.api_base_url = api_base_url
+        self.url = f"{api_base_url}/processed_agent_data/"
+        self.codec = codec or get_codec("json")
+        if gzip and not self.codec.content_encoding:
+            self.codec = CompressedCodec(self.codec, "gzip")
+        self.headers = {"Content-Type": self.codec.content_type}
+        if self.codec.content_encoding:
+            self.headers["Content-Encoding"] = self.codec.content_encoding
+        self.timeout = (connect_timeout, read_timeout)
+        # Failed batch requests are retried with exponential backoff, rejected ones (4xx) are not
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+
+        # Keep-alive connections are reused across requests, one per in-flight batch
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight))
+
+        # With more than one batch in flight, batches are posted in the background
+        self.executor = ThreadPoolExecutor(max_in_flight, "hub-http") if max_in_flight > 1 else None
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
 
     def save_data(self, processed_data: ProcessedAgentData):
         """
@@ -18,13 +58,111 @@ class HubHttpAdapter(HubGateway):
         Returns:
             bool: True if the data is successfully saved, False otherwise.
         """
-        url = f"{self.api_base_url}/processed_agent_data/"
-        response = requests.post(url, data=processed_data.model_dump_json())
-        if response.status_code != 200:
-            logging.info(
-                f"Invalid Hub response\nData: {processed_data.model_dump_json()}\nResponse: {response}"
-            )
+        return self._send(self.codec.encode([processed_data.model_dump()]), 1)
+
+    def save_batch(self, processed_data_batch: List[ProcessedAgentData]):
+        """
+        Save a batch of processed road data to the Hub in one request.
+        With several batches in flight the request is sent in the background,
+        this call only blocks while all in-flight slots are taken. A background batch keeps its slot
+        while it is retried, so a failing hub slows the workers down instead of losing batches.
+        Parameters:
+            processed_data_batch (List[ProcessedAgentData]): Processed road data to be saved.
+        Returns:
+            bool: True if the data is saved, or queued for sending in background mode, False otherwise.
+                The outcome of background batches is counted in the "records_sent" and "records_failed" metrics.
+        """
+        payload = self.codec.encode([processed_data.model_dump() for processed_data in processed_data_batch])
+        if self.executor is None:
+            return self._send(payload, len(processed_data_batch))
+
+        self.in_flight.acquire()
+        try:
+            future = self.executor.submit(self._send, payload, len(processed_data_batch))
+        except RuntimeError:
+            # The executor is shut down
+            self.in_flight.release()
             return False
-        logging.info("Data saved to Hub")
+        future.add_done_callback(lambda _: self.in_flight.release())
         return True
-    
\ No newline at end of file
+
+    def save_road_events(self, road_events: List[RoadEvent]):
+        """
+        Save road defect events to the Hub.
+        Parameters:
+            road_events (List[RoadEvent]): Closed road defect events.
+        Returns:
+            bool: True if the events are successfully saved, False otherwise.
+        """
+        return self._post_json("road_events", [road_event.model_dump(mode="json") for road_event in road_events])
+
+    def save_road_summaries(self, road_summaries: List[RoadSummary]):
+        """
+        Save periodic road summaries to the Hub.
+        Parameters:
+            road_summaries (List[RoadSummary]): Completed summaries.
+        Returns:
+            bool: True if the summaries are successfully saved, False otherwise.
+        """
+        return self._post_json("road_summaries", [summary.model_dump(mode="json") for summary in road_summaries])
+
+    def save_road_segments(self, road_segments: List[RoadSegment]):
+        """
+        Save run-length compressed road segments to the Hub.
+        Parameters:
+            road_segments (List[RoadSegment]): Closed road segments.
+        Returns:
+            bool: True if the segments are successfully saved, False otherwise.
+        """
+        return self._post_json("road_segments", [segment.model_dump(mode="json") for segment in road_segments])
+
+    def close(self):
+        """Wait for in-flight batches and close pooled connections"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def _send(self, payload: bytes, count: int) -> bool:
+        """Post a batch, retrying failed requests, and count its records as sent or failed"""
+        if self._retry(lambda: self._post(self.url, payload, self.headers, f"{count} records")):
+            metrics.count("records_sent", count)
+            return True
+        metrics.count("records_failed", count)
+        logging.error(f"Hub did not save {count} records")
+        return False
+
+    def _post_json(self, resource: str, records: List[dict]) -> bool:
+        """Post road events, summaries or segments, retrying failed requests like batches"""
+        url = f"{self.api_base_url}/{resource}/"
+        payload = json.dumps(records)
+        headers = {"Content-Type": "application/json"}
+        if self._retry(lambda: self._post(url, payload, headers, f"{len(records)} {resource}")):
+            return True
+        logging.error(f"Hub did not save {len(records)} {resource}")
+        return False
+
+    def _retry(self, post: Callable[[], Tuple[bool, bool]]) -> bool:
+        """Call `post` until it succeeds, it fails for good or the retries run out"""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            saved, retry = post()
+            if saved:
+                return True
+            if not retry:
+                break
+        return False
+
+    def _post(self, url: str, payload, headers: dict, description: str) -> Tuple[bool, bool]:
+        """Post once, returns whether the hub saved the payload and whether a failure may be retried"""
+        try:
+            with metrics.timer("hub_post"):
+                response = self.session.post(url, data=payload, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            logging.error(f"Hub request for {description} failed: {e}")
+            return False, True
+        if response.status_code != 200:
+            logging.info(f"Invalid Hub response for {description}\nResponse: {response}")
+            return False, response.status_code >= 500
+        logging.info(f"{description} saved to Hub")
+        return True, False
@@ -1,17 +1,25 @@
+import json
 import logging
+from typing import List
 
 import requests as requests
 from paho.mqtt import client as mqtt_client
 
 from app.entities.processed_agent_data import ProcessedAgentData
+from app.entities.road_event import RoadEvent, RoadSummary
+from app.entities.road_segment import RoadSegment
 from app.interfaces.hub_gateway import HubGateway
+from codec import Codec, get_codec, topic_for
+from metrics import metrics
 
 
 class HubMqttAdapter(HubGateway):
-    def __init__(self, broker, port, topic):
+    def __init__(self, broker, port, topic, codec: Codec = None):
         self.broker = broker
         self.port = port
-        self.topic = topic
+        self.codec = codec or get_codec("json")
+        self.base_topic = topic
+        self.topic = topic_for(topic, self.codec)
         self.mqtt_client = self._connect_mqtt(broker, port)
 
     def save_data(self, processed_data: ProcessedAgentData):
@@ -22,7 +30,7 @@ class HubMqttAdapter(HubGateway):
         Returns:
             bool: True if the data is successfully saved, False otherwise.
         """
-        msg = processed_data.model_dump_json()
+        msg = self.codec.encode([processed_data.model_dump()])
         result = self.mqtt_client.publish(self.topic, msg)
         status = result[0]
         if status == 0:
@@ -31,6 +39,66 @@ class HubMqttAdapter(HubGateway):
             print(f"Failed to send message to topic {self.topic}")
             return False
 
+    def save_batch(self, processed_data_batch: List[ProcessedAgentData]):
+        """
+        Publish a batch of processed road data to the Hub as one message.
+        Parameters:
+            processed_data_batch (List[ProcessedAgentData]): Processed road data to be saved.
+        Returns:
+            bool: True if the data is successfully saved, False otherwise.
+        """
+        msg = self.codec.encode([processed_data.model_dump() for processed_data in processed_data_batch])
+        result = self.mqtt_client.publish(self.topic, msg)
+        status = result[0]
+        if status == 0:
+            metrics.count("records_sent", len(processed_data_batch))
+            return True
+        else:
+            print(f"Failed to send message to topic {self.topic}")
+            return False
+
+    def save_road_events(self, road_events: List[RoadEvent]):
+        """
+        Publish road defect events to the Hub on the "/road_events" topic suffix.
+        Parameters:
+            road_events (List[RoadEvent]): Closed road defect events.
+        Returns:
+            bool: True if the events are successfully published, False otherwise.
+        """
+        return self._publish_json("road_events", [road_event.model_dump(mode="json") for road_event in road_events])
+
+    def save_road_summaries(self, road_summaries: List[RoadSummary]):
+        """
+        Publish periodic road summaries to the Hub on the "/road_summaries" topic suffix.
+        Parameters:
+            road_summaries (List[RoadSummary]): Completed summaries.
+        Returns:
+            bool: True if the summaries are successfully published, False otherwise.
+        """
+        return self._publish_json("road_summaries", [summary.model_dump(mode="json") for summary in road_summaries])
+
+    def _publish_json(self, resource: str, records: List[dict]) -> bool:
+        topic = f"{self.base_topic}/{resource}"
+        result = self.mqtt_client.publish(topic, json.dumps(records))
+        if result[0] != 0:
+            print(f"Failed to send message to topic {topic}")
+            return False
+        return True
+
+    def save_road_segments(self, road_segments: List[RoadSegment]):
+        """
+        Publish run-length compressed road segments to the Hub on the "/road_segments" topic suffix.
+        Parameters:
+            road_segments (List[RoadSegment]): Closed road segments.
+        Returns:
+            bool: True if the segments are successfully published, False otherwise.
+        """
+        return self._publish_json("road_segments", [segment.model_dump(mode="json") for segment in road_segments])
+
+    def close(self):
+        self.mqtt_client.loop_stop()
+        self.mqtt_client.disconnect()
+
     @staticmethod
     def _connect_mqtt(broker, port):
         """Create MQTT client"""
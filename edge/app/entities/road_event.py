@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+
+
+class RoadEvent(BaseModel):
+    """Road defect built from nearby consecutive "Bumpy" detections"""
+    latitude: float
+    longitude: float
+    start_timestamp: datetime = Field(..., title="Start timestamp", description="Timestamp of the first hit")
+    end_timestamp: datetime = Field(..., title="End timestamp", description="Timestamp of the last hit")
+    hit_count: int
+    severity: float = Field(..., title="Severity", description="Largest deviation of z from the mean of the recent samples of the vehicle")
+
+
+class RoadSummary(BaseModel):
+    """Sample counts for a period, sent instead of individual samples"""
+    start_timestamp: datetime
+    end_timestamp: datetime
+    smooth_count: int
+    bumpy_count: int
+    event_count: int
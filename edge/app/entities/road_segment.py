@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from datetime import datetime
+
+
+class RoadSegment(BaseModel):
+    """Run of consecutive samples with the same road state"""
+    road_state: str
+    start_timestamp: datetime
+    end_timestamp: datetime
+    start_latitude: float
+    start_longitude: float
+    end_latitude: float
+    end_longitude: float
+    sample_count: int
+    min_z: float
+    max_z: float
+    mean_z: float
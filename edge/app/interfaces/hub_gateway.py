@@ -1,5 +1,8 @@
 from abc import ABC, abstractmethod
+from typing import List
 from app.entities.processed_agent_data import ProcessedAgentData
+from app.entities.road_event import RoadEvent, RoadSummary
+from app.entities.road_segment import RoadSegment
 
 
 class HubGateway(ABC):
@@ -18,4 +21,53 @@ class HubGateway(ABC):
             bool: True if the data is successfully saved, False otherwise.
         """
         pass
-    
\ No newline at end of file
+
+    @abstractmethod
+    def save_batch(self, processed_data_batch: List[ProcessedAgentData]) -> bool:
+        """
+        Method to save a batch of processed agent data in one call.
+        Parameters:
+            processed_data_batch (List[ProcessedAgentData]): The processed agent data to be saved.
+        Returns:
+            bool: True if the batch is successfully saved, False otherwise.
+        """
+        pass
+
+    @abstractmethod
+    def save_road_events(self, road_events: List[RoadEvent]) -> bool:
+        """
+        Method to save road defect events.
+        Parameters:
+            road_events (List[RoadEvent]): Closed road defect events.
+        Returns:
+            bool: True if the events are successfully saved, False otherwise.
+        """
+        pass
+
+    @abstractmethod
+    def save_road_summaries(self, road_summaries: List[RoadSummary]) -> bool:
+        """
+        Method to save periodic road summaries.
+        Parameters:
+            road_summaries (List[RoadSummary]): Completed summaries.
+        Returns:
+            bool: True if the summaries are successfully saved, False otherwise.
+        """
+        pass
+
+    @abstractmethod
+    def save_road_segments(self, road_segments: List[RoadSegment]) -> bool:
+        """
+        Method to save run-length compressed road segments.
+        Parameters:
+            road_segments (List[RoadSegment]): Closed road segments.
+        Returns:
+            bool: True if the segments are successfully saved, False otherwise.
+        """
+        pass
+
+    def close(self):
+        """
+        Method to flush pending data and release connections to the hub.
+        """
+        pass
@@ -1,5 +1,19 @@
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from pydantic import TypeAdapter
+
 from app.entities.agent_data import AgentData
 from app.entities.processed_agent_data import ProcessedAgentData
+from config import (
+    ROAD_WINDOW_SIZE,
+    ROAD_RMS_THRESHOLD,
+    ROAD_PEAK_TO_PEAK_THRESHOLD,
+    ROAD_JERK_THRESHOLD,
+    ROAD_CONTEXT_MAX_GAP,
+)
 
 
 def process_agent_data(agent_data: AgentData) -> ProcessedAgentData:
@@ -17,3 +31,166 @@ def process_agent_data(agent_data: AgentData) -> ProcessedAgentData:
 
     processed_data_batch = ProcessedAgentData(road_state=road_surface_state, agent_data=agent_data)
     return processed_data_batch
+
+
+# Builds a whole list of labelled samples in one validator call, far cheaper than a constructor call per sample
+processed_agent_data_list = TypeAdapter(List[ProcessedAgentData])
+
+
+def label_agent_data(
+    agent_data_batch: Sequence[AgentData], bumpy: Sequence[bool], indexes: Iterable[int]
+) -> List[ProcessedAgentData]:
+    """
+    Wrap classified samples in ProcessedAgentData.
+    Parameters:
+        agent_data_batch (Sequence[AgentData]): Classified agent data samples.
+        bumpy (Sequence[bool]): Classification of every sample, True for "Bumpy".
+        indexes (Iterable[int]): Samples to return.
+    Returns:
+        processed_data_batch (List[ProcessedAgentData]): The samples with their road state, sharing the AgentData objects.
+    """
+    return processed_agent_data_list.validate_python(
+        [{"road_state": "Bumpy" if bumpy[i] else "Smooth", "agent_data": agent_data_batch[i]} for i in indexes]
+    )
+
+
+def road_surface_features(z: np.ndarray, seconds: np.ndarray, window_size: int) -> dict:
+    """
+    Compute road surface features over trailing sliding windows of accelerometer z values.
+    The first samples are padded with the first value, so every sample gets a full window.
+    Parameters:
+        z (np.ndarray): Accelerometer z values.
+        seconds (np.ndarray): Sample timestamps in seconds.
+        window_size (int): Number of samples in a window.
+    Returns:
+        features (dict): Per-sample arrays "z" (mean-removed z), "rms", "peak_to_peak" and "jerk".
+    """
+    padded = np.concatenate([np.full(window_size - 1, z[0]), z])
+    windows = sliding_window_view(padded, window_size)
+    mean = windows.mean(axis=1)
+    centered = windows - mean[:, np.newaxis]
+
+    # Jerk is the z change rate, equal timestamps are clipped to 1 ms to avoid dividing by zero
+    dt = np.maximum(np.diff(seconds, prepend=seconds[0]), 1e-3)
+    jerk = np.abs(np.diff(z, prepend=z[0])) / dt
+    jerk_windows = sliding_window_view(np.concatenate([np.zeros(window_size - 1), jerk]), window_size)
+
+    return {
+        "z": z - mean,
+        "rms": np.sqrt((centered ** 2).mean(axis=1)),
+        "peak_to_peak": np.ptp(windows, axis=1),
+        "jerk": jerk_windows.max(axis=1),
+    }
+
+
+def classify_road_surface(
+    z: np.ndarray,
+    seconds: np.ndarray,
+    window_size: int,
+    rms_threshold: float,
+    peak_to_peak_threshold: float,
+    jerk_threshold: float,
+) -> np.ndarray:
+    """
+    Classify every sample as bumpy when any feature of its trailing window exceeds its threshold.
+    Returns:
+        bumpy (np.ndarray): Boolean array, True for "Bumpy" samples.
+    """
+    features = road_surface_features(z, seconds, window_size)
+    return (
+        (features["rms"] > rms_threshold)
+        | (features["peak_to_peak"] > peak_to_peak_threshold)
+        | (features["jerk"] > jerk_threshold)
+    )
+
+
+def process_agent_data_batch(
+    agent_data_batch: List[AgentData],
+    window_size: int = ROAD_WINDOW_SIZE,
+    per_window: bool = False,
+    rms_threshold: float = ROAD_RMS_THRESHOLD,
+    peak_to_peak_threshold: float = ROAD_PEAK_TO_PEAK_THRESHOLD,
+    jerk_threshold: float = ROAD_JERK_THRESHOLD,
+) -> List[ProcessedAgentData]:
+    """
+    Classify the state of the road surface for a window of agent data at once.
+    A sample is "Bumpy" when any feature of its trailing window exceeds its threshold.
+    Parameters:
+        agent_data_batch (List[AgentData]): Consecutive agent data samples of one vehicle.
+        window_size (int): Number of samples in a feature window.
+        per_window (bool): Return one result per non-overlapping window (labelled by its last sample) instead of per sample.
+        rms_threshold (float): Threshold for RMS of mean-removed z.
+        peak_to_peak_threshold (float): Threshold for peak-to-peak z.
+        jerk_threshold (float): Threshold for z change rate per second.
+    Returns:
+        processed_data_batch (List[ProcessedAgentData]): Processed data with the classified state of the road surface.
+    """
+    if not agent_data_batch:
+        return []
+
+    z = np.fromiter((agent_data.accelerometer.z for agent_data in agent_data_batch), dtype=np.float64)
+    seconds = np.fromiter((agent_data.timestamp.timestamp() for agent_data in agent_data_batch), dtype=np.float64)
+    window_size = max(1, min(window_size, len(z)))
+    bumpy = classify_road_surface(
+        z, seconds, window_size, rms_threshold, peak_to_peak_threshold, jerk_threshold
+    ).tolist()
+
+    indexes = range(len(agent_data_batch))
+    if per_window:
+        # Trailing features of the last sample cover the whole window
+        indexes = range(window_size - 1, len(agent_data_batch), window_size)
+
+    return label_agent_data(agent_data_batch, bumpy, indexes)
+
+
+class RoadSurfaceClassifier:
+    """
+    Classifies micro-batches of a stream of agent data, vehicle by vehicle.
+    The last `window_size - 1` samples of every vehicle are kept as trailing context for its next batch,
+    so windows span batch boundaries. Context older than `max_gap` seconds, or newer than the batch, is dropped.
+    A sample is "Bumpy" when the RMS, peak-to-peak or jerk of its trailing window exceeds its threshold.
+    Not thread-safe, each edge worker owns one.
+    """
+
+    def __init__(
+        self,
+        window_size: int = ROAD_WINDOW_SIZE,
+        max_gap: float = ROAD_CONTEXT_MAX_GAP,
+        rms_threshold: float = ROAD_RMS_THRESHOLD,
+        peak_to_peak_threshold: float = ROAD_PEAK_TO_PEAK_THRESHOLD,
+        jerk_threshold: float = ROAD_JERK_THRESHOLD,
+    ):
+        self.window_size = window_size
+        self.max_gap = timedelta(seconds=max_gap)
+        self.rms_threshold = rms_threshold
+        self.peak_to_peak_threshold = peak_to_peak_threshold
+        self.jerk_threshold = jerk_threshold
+        self.context: Dict[Optional[int], List[AgentData]] = {}
+
+    def process(self, agent_data_batch: List[AgentData]) -> List[ProcessedAgentData]:
+        """
+        Classify a batch of agent data from any number of vehicles.
+        Returns:
+            processed_data_batch (List[ProcessedAgentData]): Processed data grouped by vehicle, in time order per vehicle.
+        """
+        vehicles: Dict[Optional[int], List[AgentData]] = {}
+        for agent_data in agent_data_batch:
+            vehicles.setdefault(agent_data.user_id, []).append(agent_data)
+
+        processed_data_batch = []
+        for user_id, samples in vehicles.items():
+            context = self.context.get(user_id, [])
+            if context:
+                gap = samples[0].timestamp - context[-1].timestamp
+                if gap < timedelta(0) or gap > self.max_gap:
+                    context = []
+            samples = context + samples
+            z = np.fromiter((agent_data.accelerometer.z for agent_data in samples), dtype=np.float64)
+            seconds = np.fromiter((agent_data.timestamp.timestamp() for agent_data in samples), dtype=np.float64)
+            # The window is not clamped to the batch, a vehicle's first samples are padded as at the start of a stream
+            bumpy = classify_road_surface(
+                z, seconds, self.window_size, self.rms_threshold, self.peak_to_peak_threshold, self.jerk_threshold
+            ).tolist()
+            processed_data_batch.extend(label_agent_data(samples, bumpy, range(len(context), len(samples))))
+            self.context[user_id] = samples[max(0, len(samples) - self.window_size + 1):] if self.window_size > 1 else []
+        return processed_data_batch
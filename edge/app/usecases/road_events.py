@@ -0,0 +1,175 @@
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from app.entities.processed_agent_data import ProcessedAgentData
+from app.entities.road_event import RoadEvent, RoadSummary
+
+# Meters per degree of latitude
+METERS_PER_DEGREE = 111_320
+
+
+class VehicleEvents:
+    """Open events, the current summary and recent z values of one vehicle"""
+
+    def __init__(self, baseline_size: int):
+        self.open_events: Dict[Tuple[int, int], RoadEvent] = {}
+        self.summary: Optional[RoadSummary] = None
+        self.recent_z = deque(maxlen=baseline_size)
+        # Monotonic time the vehicle last sent a sample
+        self.last_seen = time.monotonic()
+
+
+class RoadEventClusterer:
+    """
+    Groups "Bumpy" detections into road defect events.
+    Hits are indexed on a grid of `cell_size` meter cells, a hit joins an open event in its own
+    or a neighbouring cell when the event was hit less than `time_window` seconds before.
+    Events are closed once they receive no hits for `time_window` seconds, and a summary of
+    sample counts is produced every `summary_interval` seconds of data time.
+    Every vehicle has its own events and summaries, so interleaved batches of different vehicles do not mix.
+    The severity of a hit is its z deviation from the mean of the vehicle's last `baseline_size` samples,
+    whatever batches they arrived in. A vehicle that sent nothing for `idle_timeout` seconds of wall time
+    has its events and summary closed by `expire`.
+    """
+
+    def __init__(
+        self,
+        cell_size: float = 10,
+        time_window: float = 30,
+        summary_interval: float = 60,
+        baseline_size: int = 50,
+        idle_timeout: float = 30,
+    ):
+        self.cell_size = cell_size
+        self.time_window = timedelta(seconds=time_window)
+        self.summary_interval = timedelta(seconds=summary_interval)
+        self.baseline_size = baseline_size
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+
+        self.vehicles: Dict[Optional[int], VehicleEvents] = {}
+
+    def cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        latitude_step = self.cell_size / METERS_PER_DEGREE
+        longitude_step = latitude_step / max(math.cos(math.radians(latitude)), 1e-6)
+        return math.floor(latitude / latitude_step), math.floor(longitude / longitude_step)
+
+    def add(self, processed_data_batch: List[ProcessedAgentData]) -> Tuple[List[RoadEvent], List[RoadSummary]]:
+        """
+        Add processed samples, in time order per vehicle.
+        Returns:
+            (closed_events, summaries): Events that received no hits for the time window and completed summaries.
+        """
+        if not processed_data_batch:
+            return [], []
+        batches: Dict[Optional[int], List[ProcessedAgentData]] = {}
+        for processed_data in processed_data_batch:
+            batches.setdefault(processed_data.agent_data.user_id, []).append(processed_data)
+        closed_events: List[RoadEvent] = []
+        summaries: List[RoadSummary] = []
+
+        with self.lock:
+            for user_id, batch in batches.items():
+                vehicle = self.vehicles.get(user_id)
+                if vehicle is None:
+                    vehicle = self.vehicles[user_id] = VehicleEvents(self.baseline_size)
+                vehicle.last_seen = time.monotonic()
+                vehicle_closed: List[RoadEvent] = []
+                for processed_data in batch:
+                    agent_data = processed_data.agent_data
+                    timestamp = agent_data.timestamp
+                    z = agent_data.accelerometer.z
+                    summaries.extend(self._count(vehicle, processed_data.road_state, timestamp))
+                    if processed_data.road_state == "Bumpy":
+                        baseline = sum(vehicle.recent_z) / len(vehicle.recent_z) if vehicle.recent_z else z
+                        gps = agent_data.gps
+                        severity = abs(z - baseline)
+                        vehicle_closed.extend(self._hit(vehicle, gps.latitude, gps.longitude, timestamp, severity))
+                    vehicle.recent_z.append(z)
+                vehicle_closed.extend(self._close_expired(vehicle, batch[-1].agent_data.timestamp))
+                vehicle.summary.event_count += len(vehicle_closed)
+                closed_events.extend(vehicle_closed)
+
+        return closed_events, summaries
+
+    def flush(self) -> Tuple[List[RoadEvent], List[RoadSummary]]:
+        """Close all open events and the current summaries"""
+        with self.lock:
+            vehicles = list(self.vehicles.values())
+            self.vehicles.clear()
+        return self._close_vehicles(vehicles)
+
+    def expire(self) -> Tuple[List[RoadEvent], List[RoadSummary]]:
+        """Close open events and summaries of vehicles idle for `idle_timeout` seconds, e.g. at the end of a trip"""
+        now = time.monotonic()
+        with self.lock:
+            idle = [
+                user_id for user_id, vehicle in self.vehicles.items() if now - vehicle.last_seen >= self.idle_timeout
+            ]
+            vehicles = [self.vehicles.pop(user_id) for user_id in idle]
+        return self._close_vehicles(vehicles)
+
+    @staticmethod
+    def _close_vehicles(vehicles: List[VehicleEvents]) -> Tuple[List[RoadEvent], List[RoadSummary]]:
+        closed_events: List[RoadEvent] = []
+        summaries: List[RoadSummary] = []
+        for vehicle in vehicles:
+            vehicle_closed = list(vehicle.open_events.values())
+            closed_events.extend(vehicle_closed)
+            if vehicle.summary is not None:
+                vehicle.summary.event_count += len(vehicle_closed)
+                summaries.append(vehicle.summary)
+        return closed_events, summaries
+
+    def _hit(
+        self, vehicle: VehicleEvents, latitude: float, longitude: float, timestamp: datetime, severity: float
+    ) -> List[RoadEvent]:
+        row, column = self.cell(latitude, longitude)
+        for neighbour in [(row + i, column + j) for i in (-1, 0, 1) for j in (-1, 0, 1)]:
+            event = vehicle.open_events.get(neighbour)
+            if event is not None and timestamp - event.end_timestamp <= self.time_window:
+                # Merge the hit into the event, moving its centroid
+                event.latitude += (latitude - event.latitude) / (event.hit_count + 1)
+                event.longitude += (longitude - event.longitude) / (event.hit_count + 1)
+                event.hit_count += 1
+                event.end_timestamp = max(event.end_timestamp, timestamp)
+                event.severity = max(event.severity, severity)
+                return []
+
+        # An expired event in the same cell is closed before a new one replaces it
+        closed = vehicle.open_events.pop((row, column), None)
+        vehicle.open_events[(row, column)] = RoadEvent(
+            latitude=latitude,
+            longitude=longitude,
+            start_timestamp=timestamp,
+            end_timestamp=timestamp,
+            hit_count=1,
+            severity=severity,
+        )
+        return [closed] if closed is not None else []
+
+    def _close_expired(self, vehicle: VehicleEvents, now: datetime) -> List[RoadEvent]:
+        expired = [cell for cell, event in vehicle.open_events.items() if now - event.end_timestamp > self.time_window]
+        return [vehicle.open_events.pop(cell) for cell in expired]
+
+    def _count(self, vehicle: VehicleEvents, road_state: str, timestamp: datetime) -> List[RoadSummary]:
+        completed = []
+        summary = vehicle.summary
+        if summary is not None and timestamp - summary.start_timestamp >= self.summary_interval:
+            completed.append(summary)
+            summary = None
+        if summary is None:
+            summary = vehicle.summary = RoadSummary(
+                start_timestamp=timestamp, end_timestamp=timestamp, smooth_count=0, bumpy_count=0, event_count=0
+            )
+
+        summary.end_timestamp = timestamp
+        if road_state == "Bumpy":
+            summary.bumpy_count += 1
+        else:
+            summary.smooth_count += 1
+        return completed
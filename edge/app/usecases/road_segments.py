@@ -0,0 +1,87 @@
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from app.entities.processed_agent_data import ProcessedAgentData
+from app.entities.road_segment import RoadSegment
+
+
+class RoadSegmenter:
+    """
+    Run-length compresses a stream of processed samples into road segments.
+    A segment is closed when the road state changes or it spans `max_duration` seconds.
+    Every vehicle has its own open segment, so interleaved batches of different vehicles do not mix.
+    The segment of a vehicle that sent nothing for `idle_timeout` seconds of wall time is closed by `expire`.
+    """
+
+    def __init__(self, max_duration: float = 60, idle_timeout: float = 30):
+        self.max_duration = timedelta(seconds=max_duration)
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.segments: Dict[Optional[int], RoadSegment] = {}
+        # Monotonic time every vehicle with an open segment last sent a sample
+        self.last_seen: Dict[Optional[int], float] = {}
+
+    def add(self, processed_data_batch: List[ProcessedAgentData]) -> List[RoadSegment]:
+        """
+        Add processed samples, in time order per vehicle.
+        Returns:
+            closed_segments (List[RoadSegment]): Segments closed by a state change or their duration.
+        """
+        closed_segments: List[RoadSegment] = []
+        now = time.monotonic()
+        with self.lock:
+            for processed_data in processed_data_batch:
+                agent_data = processed_data.agent_data
+                self.last_seen[agent_data.user_id] = now
+                segment = self.segments.get(agent_data.user_id)
+                if segment is not None and (
+                    segment.road_state != processed_data.road_state
+                    or agent_data.timestamp - segment.start_timestamp >= self.max_duration
+                ):
+                    closed_segments.append(segment)
+                    segment = None
+
+                z = agent_data.accelerometer.z
+                if segment is None:
+                    self.segments[agent_data.user_id] = RoadSegment(
+                        road_state=processed_data.road_state,
+                        start_timestamp=agent_data.timestamp,
+                        end_timestamp=agent_data.timestamp,
+                        start_latitude=agent_data.gps.latitude,
+                        start_longitude=agent_data.gps.longitude,
+                        end_latitude=agent_data.gps.latitude,
+                        end_longitude=agent_data.gps.longitude,
+                        sample_count=1,
+                        min_z=z,
+                        max_z=z,
+                        mean_z=z,
+                    )
+                    continue
+
+                segment.end_timestamp = agent_data.timestamp
+                segment.end_latitude = agent_data.gps.latitude
+                segment.end_longitude = agent_data.gps.longitude
+                segment.sample_count += 1
+                segment.min_z = min(segment.min_z, z)
+                segment.max_z = max(segment.max_z, z)
+                segment.mean_z += (z - segment.mean_z) / segment.sample_count
+        return closed_segments
+
+    def flush(self) -> List[RoadSegment]:
+        """Close the current segments"""
+        with self.lock:
+            segments = list(self.segments.values())
+            self.segments.clear()
+            self.last_seen.clear()
+        return segments
+
+    def expire(self) -> List[RoadSegment]:
+        """Close the segments of vehicles idle for `idle_timeout` seconds, e.g. at the end of a trip"""
+        now = time.monotonic()
+        with self.lock:
+            idle = [user_id for user_id, last_seen in self.last_seen.items() if now - last_seen >= self.idle_timeout]
+            for user_id in idle:
+                del self.last_seen[user_id]
+            return [self.segments.pop(user_id) for user_id in idle]
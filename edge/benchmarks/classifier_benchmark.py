@@ -0,0 +1,126 @@
+"""
+Compare road surface classification throughput of the per-sample and batch paths, with the same windowed
+features computed sample by sample as the baseline the vectorised path replaces.
+Run from the edge directory: python -m benchmarks.classifier_benchmark [samples]
+"""
+import gc
+import math
+import sys
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import List
+
+import numpy as np
+
+from app.entities.agent_data import AgentData
+from app.entities.processed_agent_data import ProcessedAgentData
+from app.usecases.data_processing import (
+    RoadSurfaceClassifier,
+    classify_road_surface,
+    process_agent_data,
+    process_agent_data_batch,
+)
+from config import ROAD_WINDOW_SIZE, ROAD_RMS_THRESHOLD, ROAD_PEAK_TO_PEAK_THRESHOLD, ROAD_JERK_THRESHOLD
+
+
+def make_agent_data(count: int) -> List[AgentData]:
+    """Smooth road with noise around 1g and a short bump every 200 samples"""
+    rng = np.random.default_rng(0)
+    z = 16500 + rng.normal(0, 150, count)
+    for start in range(100, count, 200):
+        z[start:start + 5] += rng.normal(0, 6000, len(z[start:start + 5]))
+
+    start = datetime.now()
+    return [
+        AgentData(
+            accelerometer={"x": 0, "y": 0, "z": z[i]},
+            gps={"latitude": 30.5245, "longitude": 50.4503, "timestamp": start + timedelta(milliseconds=10 * i)},
+            timestamp=start + timedelta(milliseconds=10 * i),
+        )
+        for i in range(count)
+    ]
+
+
+def process_sample_by_sample(agent_data_batch: List[AgentData]) -> List[ProcessedAgentData]:
+    """The windowed classification of process_agent_data_batch, one sample at a time in plain Python"""
+    z_window, jerk_window = deque(maxlen=ROAD_WINDOW_SIZE), deque(maxlen=ROAD_WINDOW_SIZE)
+    previous_z = previous_seconds = None
+    processed_data_batch = []
+    for agent_data in agent_data_batch:
+        z, seconds = agent_data.accelerometer.z, agent_data.timestamp.timestamp()
+        if previous_z is None:
+            # Padded like road_surface_features
+            z_window.extend([z] * (ROAD_WINDOW_SIZE - 1))
+            jerk_window.extend([0.0] * (ROAD_WINDOW_SIZE - 1))
+            jerk = 0.0
+        else:
+            jerk = abs(z - previous_z) / max(seconds - previous_seconds, 1e-3)
+        previous_z, previous_seconds = z, seconds
+        z_window.append(z)
+        jerk_window.append(jerk)
+
+        mean = sum(z_window) / ROAD_WINDOW_SIZE
+        rms = math.sqrt(sum((value - mean) ** 2 for value in z_window) / ROAD_WINDOW_SIZE)
+        bumpy = (
+            rms > ROAD_RMS_THRESHOLD
+            or max(z_window) - min(z_window) > ROAD_PEAK_TO_PEAK_THRESHOLD
+            or max(jerk_window) > ROAD_JERK_THRESHOLD
+        )
+        processed_data_batch.append(
+            ProcessedAgentData(road_state="Bumpy" if bumpy else "Smooth", agent_data=agent_data)
+        )
+    return processed_data_batch
+
+
+def measure(function, repeat: int = 3) -> float:
+    """Best wall time of several runs in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    agent_data_batch = make_agent_data(count)
+    # The input stays alive for the whole run, so the collector does not rescan it on every pass.
+    # Every path drops its results batch by batch like an edge worker, so none is slowed by a growing heap.
+    gc.collect()
+    gc.freeze()
+
+    print(f"{'path':<36} {'samples/sec':>14} {'bumpy':>8}")
+    # The old single-sample z check, only building results costs time and it labels every sample "Bumpy"
+    elapsed = measure(lambda: [process_agent_data(agent_data).road_state for agent_data in agent_data_batch])
+    bumpy = sum(data.road_state == "Bumpy" for data in map(process_agent_data, agent_data_batch))
+    print(f"{'per-sample z check':<36} {count / elapsed:>14,.0f} {bumpy:>8}")
+
+    for batch_size in (100, 1000, count):
+        batches = [agent_data_batch[i:i + batch_size] for i in range(0, count, batch_size)]
+        # The same windows classified one sample at a time
+        elapsed = measure(lambda: [len(process_sample_by_sample(batch)) for batch in batches])
+        bumpy = sum(data.road_state == "Bumpy" for batch in batches for data in process_sample_by_sample(batch))
+        print(f"{f'sample by sample, batches of {batch_size}':<36} {count / elapsed:>14,.0f} {bumpy:>8}")
+        for per_window in (False, True):
+            elapsed = measure(lambda: [len(process_agent_data_batch(batch, per_window=per_window)) for batch in batches])
+            results = [data for batch in batches for data in process_agent_data_batch(batch, per_window=per_window)]
+            bumpy = sum(data.road_state == "Bumpy" for data in results)
+            name = f"batch of {batch_size}" + (", per window" if per_window else "")
+            print(f"{name:<36} {count / elapsed:>14,.0f} {bumpy:>8}")
+
+        # The edge worker path, with trailing context carried across batches
+        classifier = RoadSurfaceClassifier()
+        elapsed = measure(lambda: [len(classifier.process(batch)) for batch in batches])
+        classifier = RoadSurfaceClassifier()
+        bumpy = sum(data.road_state == "Bumpy" for batch in batches for data in classifier.process(batch))
+        print(f"{f'classifier, batches of {batch_size}':<36} {count / elapsed:>14,.0f} {bumpy:>8}")
+
+    # Features and labels only, without building ProcessedAgentData models
+    z = np.array([agent_data.accelerometer.z for agent_data in agent_data_batch])
+    seconds = np.array([agent_data.timestamp.timestamp() for agent_data in agent_data_batch])
+    thresholds = (ROAD_RMS_THRESHOLD, ROAD_PEAK_TO_PEAK_THRESHOLD, ROAD_JERK_THRESHOLD)
+    elapsed = measure(lambda: classify_road_surface(z, seconds, ROAD_WINDOW_SIZE, *thresholds))
+    bumpy = int(classify_road_surface(z, seconds, ROAD_WINDOW_SIZE, *thresholds).sum())
+    print(f"{'features only':<36} {count / elapsed:>14,.0f} {bumpy:>8}")
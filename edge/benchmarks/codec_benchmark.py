@@ -0,0 +1,85 @@
+"""
+Compare wire codecs on AgentData and ProcessedAgentData records.
+Run from the edge directory: python -m benchmarks.codec_benchmark [records]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app.entities.agent_data import AgentData
+from app.entities.processed_agent_data import ProcessedAgentData
+from codec import get_codec, zstandard
+
+CODECS = ["json", "json+zlib", "msgpack", "msgpack+zlib", "struct", "struct+zlib"]
+if zstandard is not None:
+    CODECS += ["msgpack+zstd", "struct+zstd"]
+
+
+def make_records(count: int) -> List[ProcessedAgentData]:
+    start = datetime.now()
+    return [
+        ProcessedAgentData(
+            road_state="Bumpy" if i % 7 == 0 else "Smooth",
+            agent_data=AgentData(
+                accelerometer={"x": -17 + i % 50, "y": 4 - i % 30, "z": 16516 + i % 200},
+                gps={
+                    "latitude": 30.524547100067142 + i * 1e-5,
+                    "longitude": 50.450386085935094 + i * 1e-5,
+                    "timestamp": start + timedelta(milliseconds=100 * i),
+                },
+                timestamp=start + timedelta(milliseconds=100 * i),
+            ),
+        )
+        for i in range(count)
+    ]
+
+
+def measure(function, repeat: int = 5) -> float:
+    """Best wall time of several runs in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name: str, models: list, model_type, batch_size: int):
+    """Encode and decode models in batches, including the pydantic dump and validation cost"""
+    adapter = TypeAdapter(List[model_type])
+    batches = [models[i:i + batch_size] for i in range(0, len(models), batch_size)]
+
+    # Baseline: the pydantic JSON path used before codecs were introduced
+    payloads = [adapter.dump_json(batch) for batch in batches]
+    encode = measure(lambda: [adapter.dump_json(batch) for batch in batches])
+    decode = measure(lambda: [adapter.validate_json(payload) for payload in payloads])
+    print_row(f"{name} pydantic-json", len(models), encode, decode, payloads)
+
+    for codec_name in CODECS:
+        codec = get_codec(codec_name)
+        payloads = [codec.encode([model.model_dump() for model in batch]) for batch in batches]
+        encode = measure(lambda: [codec.encode([model.model_dump() for model in batch]) for batch in batches])
+        decode = measure(lambda: [adapter.validate_python(codec.decode(payload)) for payload in payloads])
+        print_row(f"{name} {codec_name}", len(models), encode, decode, payloads)
+
+
+def print_row(name: str, count: int, encode: float, decode: float, payloads: List[bytes]):
+    size = sum(len(payload) for payload in payloads)
+    print(
+        f"{name:<40} {encode / count * 1e6:>10.2f} {decode / count * 1e6:>10.2f} {size / count:>10.1f}"
+    )
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    processed = make_records(count)
+    agent_data = [record.agent_data for record in processed]
+
+    for batch_size in (1, 100):
+        print(f"\n{count} records, {batch_size} per message")
+        print(f"{'codec':<40} {'enc us/rec':>10} {'dec us/rec':>10} {'bytes/rec':>10}")
+        report("AgentData", agent_data, AgentData, batch_size)
+        report("ProcessedAgentData", processed, ProcessedAgentData, batch_size)
@@ -6,6 +6,12 @@ def try_parse_int(value: str):
     except Exception:
         return None
 
+def try_parse_float(value: str):
+    try:
+        return float(value)
+    except Exception:
+        return None
+
 # Configuration for agent MQTT
 MQTT_BROKER_HOST = os.environ.get("MQTT_BROKER_HOST") or "localhost"
 MQTT_BROKER_PORT = try_parse_int(os.environ.get("MQTT_BROKER_PORT")) or 1883
@@ -20,3 +26,55 @@ HUB_MQTT_TOPIC = os.environ.get("HUB_MQTT_TOPIC") or "processed_agent_data_topic
 HUB_HOST = os.environ.get("HUB_HOST") or "localhost"
 HUB_PORT = try_parse_int(os.environ.get("HUB_PORT")) or 12000
 HUB_URL = f"http://{HUB_HOST}:{HUB_PORT}"
+# Hub HTTP client: gzip request bodies, timeouts in seconds and concurrent batch requests
+HUB_GZIP = (os.environ.get("HUB_GZIP") or "true").lower() == "true"
+HUB_CONNECT_TIMEOUT = try_parse_float(os.environ.get("HUB_CONNECT_TIMEOUT")) or 3.05
+HUB_READ_TIMEOUT = try_parse_float(os.environ.get("HUB_READ_TIMEOUT")) or 10
+HUB_MAX_IN_FLIGHT = try_parse_int(os.environ.get("HUB_MAX_IN_FLIGHT")) or 4
+# Retries of a failed hub batch request and the first retry delay in seconds, doubled on every retry
+HUB_RETRIES = try_parse_int(os.environ.get("HUB_RETRIES")) or 3
+HUB_RETRY_BACKOFF = try_parse_float(os.environ.get("HUB_RETRY_BACKOFF")) or 0.5
+
+# Wire codec for data sent to the hub: json, msgpack or struct, optionally with +zlib or +zstd
+WIRE_CODEC = os.environ.get("WIRE_CODEC") or "json"
+
+# Batching of agent data sent to the hub: batch size, max seconds a sample waits and queue bound
+BATCH_SIZE = try_parse_int(os.environ.get("BATCH_SIZE")) or 10
+BATCH_MAX_LATENCY = try_parse_float(os.environ.get("BATCH_MAX_LATENCY")) or 0.5
+QUEUE_SIZE = try_parse_int(os.environ.get("QUEUE_SIZE")) or 10000
+# Worker threads, every vehicle is assigned to one worker so its samples stay in order
+WORKERS = try_parse_int(os.environ.get("WORKERS")) or 1
+
+# Edge worker processes, each one subscribes to every PROCESSES-th vehicle shard
+PROCESSES = try_parse_int(os.environ.get("PROCESSES")) or 1
+# Vehicle shards in agent topics, must match the agents and be at least PROCESSES
+VEHICLE_SHARDS = try_parse_int(os.environ.get("VEHICLE_SHARDS")) or 64
+
+# Road surface classification: samples per feature window and "Bumpy" thresholds in raw accelerometer units
+ROAD_WINDOW_SIZE = try_parse_int(os.environ.get("ROAD_WINDOW_SIZE")) or 10
+ROAD_RMS_THRESHOLD = try_parse_float(os.environ.get("ROAD_RMS_THRESHOLD")) or 1000
+ROAD_PEAK_TO_PEAK_THRESHOLD = try_parse_float(os.environ.get("ROAD_PEAK_TO_PEAK_THRESHOLD")) or 4000
+# Threshold for z change rate in units per second
+ROAD_JERK_THRESHOLD = try_parse_float(os.environ.get("ROAD_JERK_THRESHOLD")) or 200000
+# Seconds between batches of a vehicle after which its windows start over without trailing context
+ROAD_CONTEXT_MAX_GAP = try_parse_float(os.environ.get("ROAD_CONTEXT_MAX_GAP")) or 5
+
+# Road event mode: send clustered "Bumpy" events and periodic summaries instead of samples
+ROAD_EVENTS = (os.environ.get("ROAD_EVENTS") or "false").lower() == "true"
+# Grid cell size in meters and seconds without hits before an event is closed
+ROAD_EVENT_CELL_SIZE = try_parse_float(os.environ.get("ROAD_EVENT_CELL_SIZE")) or 10
+ROAD_EVENT_TIME_WINDOW = try_parse_float(os.environ.get("ROAD_EVENT_TIME_WINDOW")) or 30
+ROAD_SUMMARY_INTERVAL = try_parse_float(os.environ.get("ROAD_SUMMARY_INTERVAL")) or 60
+# Recent samples of a vehicle the z deviation of an event is measured against
+ROAD_EVENT_BASELINE_SIZE = try_parse_int(os.environ.get("ROAD_EVENT_BASELINE_SIZE")) or 50
+
+# Road segment mode: send run-length segments of equal road state instead of samples
+ROAD_SEGMENTS = (os.environ.get("ROAD_SEGMENTS") or "false").lower() == "true"
+# Longest segment in seconds
+ROAD_SEGMENT_MAX_DURATION = try_parse_float(os.environ.get("ROAD_SEGMENT_MAX_DURATION")) or 60
+
+# Seconds without samples from a vehicle after which its open events, summary and segment are sent
+ROAD_IDLE_TIMEOUT = try_parse_float(os.environ.get("ROAD_IDLE_TIMEOUT")) or 30
+
+# Seconds between metrics summaries in the worker log
+METRICS_INTERVAL = try_parse_float(os.environ.get("METRICS_INTERVAL")) or 60
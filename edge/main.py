@@ -1,51 +1,150 @@
 import logging
+import multiprocessing
+import signal
 from app.adapters.agent_mqtt_adapter import AgentMQTTAdapter
 from app.adapters.hub_http_adapter import HubHttpAdapter
 from app.adapters.hub_mqtt_adapter import HubMqttAdapter
+from app.usecases.road_events import RoadEventClusterer
+from app.usecases.road_segments import RoadSegmenter
 from config import (
     MQTT_BROKER_HOST,
     MQTT_BROKER_PORT,
     MQTT_TOPIC,
     HUB_URL,
+    HUB_GZIP,
+    HUB_CONNECT_TIMEOUT,
+    HUB_READ_TIMEOUT,
+    HUB_MAX_IN_FLIGHT,
+    HUB_RETRIES,
+    HUB_RETRY_BACKOFF,
     HUB_MQTT_BROKER_HOST,
     HUB_MQTT_BROKER_PORT,
     HUB_MQTT_TOPIC,
+    WIRE_CODEC,
+    BATCH_SIZE,
+    BATCH_MAX_LATENCY,
+    QUEUE_SIZE,
+    WORKERS,
+    PROCESSES,
+    VEHICLE_SHARDS,
+    ROAD_EVENTS,
+    ROAD_EVENT_CELL_SIZE,
+    ROAD_EVENT_TIME_WINDOW,
+    ROAD_SUMMARY_INTERVAL,
+    ROAD_EVENT_BASELINE_SIZE,
+    ROAD_IDLE_TIMEOUT,
+    ROAD_SEGMENTS,
+    ROAD_SEGMENT_MAX_DURATION,
+    METRICS_INTERVAL,
 )
+from codec import get_codec
+from metrics import metrics
 
-if __name__ == "__main__":
+def configure_logging():
     # Configure logging settings
     logging.basicConfig(
         level=logging.INFO,  # Set the log level to INFO (you can use logging.DEBUG for more detailed logs)
-        format="[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s",
+        format="[%(asctime)s] [%(levelname)s] [%(processName)s] [%(module)s] %(message)s",
         handlers=[
             logging.StreamHandler(),  # Output log messages to the console
             logging.FileHandler("app.log"),  # Save log messages to a file
         ],
     )
+
+
+def run_worker(stop_event, index):
+    """Edge worker process: consume agent data until the supervisor asks to stop"""
+    # Only the supervisor handles signals, workers stop through the shared event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    configure_logging()
+
     # Create an instance of the StoreApiAdapter using the configuration
     # hub_adapter = HubHttpAdapter(
     #     api_base_url=HUB_URL,
+    #     codec=get_codec(WIRE_CODEC),
+    #     gzip=HUB_GZIP,
+    #     connect_timeout=HUB_CONNECT_TIMEOUT,
+    #     read_timeout=HUB_READ_TIMEOUT,
+    #     max_in_flight=HUB_MAX_IN_FLIGHT,
+    #     retries=HUB_RETRIES,
+    #     retry_backoff=HUB_RETRY_BACKOFF,
     # )
     hub_adapter = HubMqttAdapter(
         broker=HUB_MQTT_BROKER_HOST,
         port=HUB_MQTT_BROKER_PORT,
         topic=HUB_MQTT_TOPIC,
+        codec=get_codec(WIRE_CODEC),
     )
+    road_events = None
+    if ROAD_EVENTS:
+        road_events = RoadEventClusterer(
+            ROAD_EVENT_CELL_SIZE,
+            ROAD_EVENT_TIME_WINDOW,
+            ROAD_SUMMARY_INTERVAL,
+            ROAD_EVENT_BASELINE_SIZE,
+            ROAD_IDLE_TIMEOUT,
+        )
+    road_segments = None
+    if ROAD_SEGMENTS:
+        road_segments = RoadSegmenter(ROAD_SEGMENT_MAX_DURATION, ROAD_IDLE_TIMEOUT)
     # Create an instance of the AgentMQTTAdapter using the configuration
     agent_adapter = AgentMQTTAdapter(
         broker_host=MQTT_BROKER_HOST,
         broker_port=MQTT_BROKER_PORT,
         topic=MQTT_TOPIC,
         hub_gateway=hub_adapter,
+        batch_size=BATCH_SIZE,
+        max_latency=BATCH_MAX_LATENCY,
+        queue_size=QUEUE_SIZE,
+        workers=WORKERS,
+        process_index=index,
+        processes=PROCESSES,
+        shards=VEHICLE_SHARDS,
+        road_events=road_events,
+        road_segments=road_segments,
     )
-    try:
-        # Connect to the MQTT broker and start listening for messages
-        agent_adapter.connect()
-        agent_adapter.start()
-        # Keep the system running indefinitely (you can add other logic as needed)
-        while True:
-            pass
-    except KeyboardInterrupt:
-        # Stop the MQTT adapter and exit gracefully if interrupted by the user
-        agent_adapter.stop()
-        logging.info("System stopped.")
\ No newline at end of file
+    # Connect to the MQTT broker and start listening for messages
+    agent_adapter.connect()
+    agent_adapter.start()
+
+    # The edge has no HTTP server, per-stage metrics go to the log
+    while not stop_event.wait(timeout=METRICS_INTERVAL):
+        logging.info(f"Metrics:\n{metrics.summary()}")
+
+    # Drain queued agent data and in-flight hub batches before exiting
+    agent_adapter.stop()
+    hub_adapter.close()
+    logging.info("Worker stopped.")
+
+
+def start_worker(stop_event, index):
+    process = multiprocessing.Process(target=run_worker, args=(stop_event, index), name=f"edge-{index}")
+    process.start()
+    return process
+
+
+if __name__ == "__main__":
+    configure_logging()
+    stop_event = multiprocessing.Event()
+
+    def stop(signum, frame):
+        logging.info("Stopping edge workers...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    if PROCESSES > VEHICLE_SHARDS:
+        logging.warning(f"{PROCESSES - VEHICLE_SHARDS} edge workers own no vehicle shards, raise VEHICLE_SHARDS")
+    processes = [start_worker(stop_event, index) for index in range(PROCESSES)]
+    # Block without spinning, restart workers that exit unexpectedly
+    while not stop_event.wait(timeout=5):
+        for index, process in enumerate(processes):
+            if not process.is_alive():
+                logging.error(f"Edge worker {process.name} exited with code {process.exitcode}, restarting")
+                processes[index] = start_worker(stop_event, index)
+
+    for process in processes:
+        process.join()
+    logging.info("System stopped.")
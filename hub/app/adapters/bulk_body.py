@@ -0,0 +1,57 @@
+import zlib
+from typing import AsyncIterator, List, Optional, Tuple
+
+from codec import DecodeError
+
+# zlib window bits for each supported Content-Encoding, gzip and deflate decompress incrementally
+WINDOW_BITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+def iter_body(chunks: AsyncIterator[bytes], content_encoding: Optional[str]) -> AsyncIterator[bytes]:
+    """
+    Decompress a request body while it streams in.
+    Parameters:
+        chunks (AsyncIterator[bytes]): Raw body chunks, e.g. `request.stream()`.
+        content_encoding (str): Content-Encoding header, "gzip", "deflate", "identity" or None.
+    Returns:
+        AsyncIterator[bytes]: Decompressed body chunks, corrupt compressed data raises DecodeError.
+    """
+    if content_encoding and content_encoding != "identity" and content_encoding not in WINDOW_BITS:
+        raise ValueError(f"Unsupported content encoding: {content_encoding}")
+
+    decompressor = zlib.decompressobj(WINDOW_BITS[content_encoding]) if content_encoding in WINDOW_BITS else None
+    return _decompress(chunks, decompressor)
+
+
+async def _decompress(chunks: AsyncIterator[bytes], decompressor) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in chunks:
+            yield decompressor.decompress(chunk) if decompressor else chunk
+        if decompressor:
+            yield decompressor.flush()
+    except zlib.error as e:
+        raise DecodeError(f"Invalid compressed body: {e}") from e
+
+
+async def iter_line_chunks(chunks: AsyncIterator[bytes], size: int) -> AsyncIterator[List[Tuple[int, bytes]]]:
+    """
+    Split a newline-delimited body into chunks of up to `size` non-empty lines.
+    Lines are yielded with their 1-based line numbers for error reporting.
+    """
+    pending = b""
+    line_number = 0
+    lines = []
+    async for chunk in chunks:
+        pending += chunk
+        *complete, pending = pending.split(b"\n")
+        for line in complete:
+            line_number += 1
+            if line.strip():
+                lines.append((line_number, line))
+            if len(lines) >= size:
+                yield lines
+                lines = []
+    if pending.strip():
+        lines.append((line_number + 1, pending))
+    if lines:
+        yield lines
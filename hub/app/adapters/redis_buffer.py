@@ -0,0 +1,55 @@
+from typing import List
+
+from redis.asyncio import Redis
+
+
+class RedisBuffer:
+    """
+    FIFO buffer of serialized records in a Redis list, drained in full batches.
+    Taking a batch runs in one Lua script, so concurrent flushers never pass
+    the length check together and every record is popped by exactly one caller.
+    """
+
+    # Pop a batch from the head only when the buffer holds a complete one
+    POP_BATCH = """
+    local batch_size = tonumber(ARGV[1])
+    if redis.call('LLEN', KEYS[1]) < batch_size then
+        return {}
+    end
+    local records = redis.call('LRANGE', KEYS[1], 0, batch_size - 1)
+    redis.call('LTRIM', KEYS[1], batch_size, -1)
+    return records
+    """
+
+    # Large pushes are split into several commands
+    MAX_PUSH = 1000
+
+    def __init__(self, redis_client: Redis, key: str, batch_size: int):
+        self.redis_client = redis_client
+        self.key = key
+        self.batch_size = batch_size
+        self.pop_full_batch = redis_client.register_script(self.POP_BATCH)
+
+    async def push(self, records: List[str]) -> int:
+        """
+        Append records to the tail of the buffer.
+        Parameters:
+            records (List[str]): Serialized records, oldest first.
+        Returns:
+            length (int): Records in the buffer after the push.
+        """
+        length = 0
+        for start in range(0, len(records), self.MAX_PUSH):
+            length = await self.redis_client.rpush(self.key, *records[start:start + self.MAX_PUSH])
+        return length
+
+    async def pop_batch(self) -> List[bytes]:
+        """Take the `batch_size` oldest records, nothing while the buffer holds fewer"""
+        return await self.pop_full_batch(keys=[self.key], args=[self.batch_size])
+
+    async def pop(self, count: int) -> List[bytes]:
+        """Take up to `count` oldest records, also from an incomplete batch"""
+        return await self.redis_client.lpop(self.key, count) or []
+
+    async def length(self) -> int:
+        return await self.redis_client.llen(self.key)
@@ -0,0 +1,100 @@
+import json
+import random
+import time
+import uuid
+from typing import List, Tuple
+
+from redis.asyncio import Redis
+
+
+class RedisRetryQueue:
+    """
+    Batches the store did not accept, in a Redis sorted set scored by their next attempt time.
+    Delays grow exponentially with jitter from `base_delay` up to `max_delay` seconds,
+    after `max_attempts` failed attempts a batch is moved to a dead-letter list.
+    A taken batch is leased, not removed, so a crashed hub worker never loses it.
+    """
+
+    # Lease due batches by moving their score `lease` seconds ahead
+    TAKE_DUE = """
+    local entries = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+    for _, entry in ipairs(entries) do
+        redis.call('ZADD', KEYS[1], 'XX', ARGV[3], entry)
+    end
+    return entries
+    """
+
+    def __init__(
+        self,
+        redis_client: Redis,
+        key: str,
+        dead_letter_key: str,
+        base_delay: float = 1,
+        max_delay: float = 300,
+        max_attempts: int = 10,
+        lease: float = 60,
+    ):
+        self.redis_client = redis_client
+        self.key = key
+        self.dead_letter_key = dead_letter_key
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.take_due = redis_client.register_script(self.TAKE_DUE)
+
+    def delay(self, attempts: int) -> float:
+        """Exponential backoff with equal jitter, so hub workers do not retry in lockstep"""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempts)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def park(self, records: List[bytes], attempts: int = 0, delay: float = None):
+        """
+        Park a batch for a later attempt.
+        Parameters:
+            records (List[bytes]): Serialized records of the batch.
+            attempts (int): Failed attempts so far.
+            delay (float): Seconds until the next attempt, backoff for `attempts` by default.
+        """
+        entry = json.dumps({
+            "id": uuid.uuid4().hex,
+            "attempts": attempts,
+            "records": [record.decode("utf-8") if isinstance(record, bytes) else record for record in records],
+        })
+        delay = self.delay(attempts) if delay is None else delay
+        await self.redis_client.zadd(self.key, {entry: time.time() + delay})
+
+    async def take(self, count: int) -> List[Tuple[bytes, int, List[str]]]:
+        """Lease up to `count` due batches, returns entries with their attempts and records"""
+        entries = await self.take_due(keys=[self.key], args=[time.time(), count, time.time() + self.lease])
+        batches = []
+        for entry in entries:
+            data = json.loads(entry)
+            batches.append((entry, data["attempts"], data["records"]))
+        return batches
+
+    async def done(self, entry: bytes):
+        await self.redis_client.zrem(self.key, entry)
+
+    async def failed(self, entry: bytes, attempts: int, records: List[str]) -> bool:
+        """
+        Reschedule a batch after another failed attempt.
+        Returns:
+            bool: False if the batch ran out of attempts and was dead-lettered.
+        """
+        attempts += 1
+        pipeline = self.redis_client.pipeline(transaction=True)
+        pipeline.zrem(self.key, entry)
+        if attempts >= self.max_attempts:
+            pipeline.rpush(self.dead_letter_key, json.dumps({"attempts": attempts, "records": records}))
+        else:
+            retry = json.dumps({"id": uuid.uuid4().hex, "attempts": attempts, "records": records})
+            pipeline.zadd(self.key, {retry: time.time() + self.delay(attempts)})
+        await pipeline.execute()
+        return attempts < self.max_attempts
+
+    async def length(self) -> int:
+        return await self.redis_client.zcard(self.key)
+
+    async def dead_letter_length(self) -> int:
+        return await self.redis_client.llen(self.dead_letter_key)
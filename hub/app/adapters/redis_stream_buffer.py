@@ -0,0 +1,66 @@
+from typing import List, Tuple
+
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+
+class RedisStreamBuffer:
+    """
+    Redis Stream of serialized records read through a consumer group.
+    Every hub worker reads its own entries with XREADGROUP, entries stay pending
+    until acknowledged, so a batch the store did not accept is never lost and
+    entries of a crashed worker can be claimed by the others.
+    """
+
+    def __init__(self, redis_client: Redis, key: str, group: str, consumer: str):
+        self.redis_client = redis_client
+        self.key = key
+        self.group = group
+        self.consumer = consumer
+
+    async def create_group(self):
+        """Create the stream and consumer group, shared by all hub workers"""
+        try:
+            await self.redis_client.xgroup_create(self.key, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def add(self, records: List[str]):
+        """Append records in one round trip"""
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for record in records:
+            pipeline.xadd(self.key, {"data": record})
+        await pipeline.execute()
+
+    async def read(self, count: int, block: float) -> List[Tuple[bytes, bytes]]:
+        """
+        Read up to `count` new entries for this consumer.
+        Parameters:
+            count (int): Maximum number of entries.
+            block (float): Seconds to wait when no entries are available.
+        Returns:
+            entries (List[Tuple[bytes, bytes]]): Entry ids and records.
+        """
+        response = await self.redis_client.xreadgroup(
+            self.group, self.consumer, {self.key: ">"}, count=count, block=max(1, int(block * 1000))
+        )
+        return [(entry_id, fields[b"data"]) for _, entries in response for entry_id, fields in entries]
+
+    async def claim(self, min_idle: float, count: int) -> List[Tuple[bytes, bytes]]:
+        """Take over entries pending for longer than `min_idle` seconds, e.g. of a crashed worker"""
+        response = await self.redis_client.xautoclaim(
+            self.key, self.group, self.consumer, int(min_idle * 1000), start_id="0-0", count=count
+        )
+        # Entries deleted from the stream while pending come back without fields
+        return [(entry_id, fields[b"data"]) for entry_id, fields in response[1] if fields]
+
+    async def ack(self, entry_ids: List[bytes]):
+        """Acknowledge saved entries and delete them, so the stream does not grow"""
+        pipeline = self.redis_client.pipeline(transaction=True)
+        pipeline.xack(self.key, self.group, *entry_ids)
+        pipeline.xdel(self.key, *entry_ids)
+        await pipeline.execute()
+
+    async def length(self) -> int:
+        return await self.redis_client.xlen(self.key)
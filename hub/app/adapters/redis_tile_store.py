@@ -0,0 +1,102 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+from redis.asyncio import Redis
+
+from app.entities.processed_agent_data import ProcessedAgentData
+from app.entities.road_tile import RoadTile
+from app.usecases import geohash
+
+
+class RedisTileStore:
+    """
+    Road quality per geohash cell at several precisions, one Redis hash per cell.
+    A received batch is aggregated per cell first, then every cell is updated by one Lua call.
+    The severity of a cell is an exponentially weighted share of "Bumpy" samples,
+    each sample moves it by `smoothing` towards 1 when bumpy and towards 0 when smooth.
+    """
+
+    # Per cell arguments: smooth count, bumpy count, last seen unix time, decay of the old severity
+    UPDATE = """
+    for i, key in ipairs(KEYS) do
+        local smooth = tonumber(ARGV[i * 4 - 3])
+        local bumpy = tonumber(ARGV[i * 4 - 2])
+        local last_seen = tonumber(ARGV[i * 4 - 1])
+        local decay = tonumber(ARGV[i * 4])
+        redis.call('HINCRBY', key, 'smooth_count', smooth)
+        redis.call('HINCRBY', key, 'bumpy_count', bumpy)
+        if last_seen > tonumber(redis.call('HGET', key, 'last_seen') or '0') then
+            redis.call('HSET', key, 'last_seen', ARGV[i * 4 - 1])
+        end
+        -- A new cell starts at the share of its first batch
+        local severity = bumpy / (smooth + bumpy)
+        local previous = redis.call('HGET', key, 'severity')
+        if previous then
+            severity = tonumber(previous) * decay + severity * (1 - decay)
+        end
+        redis.call('HSET', key, 'severity', string.format('%.6f', severity))
+    end
+    return #KEYS
+    """
+
+    # Cells per Lua call
+    MAX_CELLS = 1000
+
+    def __init__(self, redis_client: Redis, precisions: List[int], smoothing: float = 0.05):
+        self.redis_client = redis_client
+        self.precisions = precisions
+        self.smoothing = smoothing
+        self.update_cells = redis_client.register_script(self.UPDATE)
+
+    def key(self, cell: str) -> str:
+        return f"road_tile:{len(cell)}:{cell}"
+
+    async def update(self, processed_agent_data_batch: List[ProcessedAgentData]):
+        """Add a batch of processed samples to the cells containing them at every precision"""
+        counts: Dict[str, List[float]] = defaultdict(lambda: [0, 0, 0.0])
+        for processed_agent_data in processed_agent_data_batch:
+            gps = processed_agent_data.agent_data.gps
+            bumpy = processed_agent_data.road_state == "Bumpy"
+            last_seen = processed_agent_data.agent_data.timestamp.timestamp()
+            # Longer geohashes extend shorter ones, so the longest is encoded once
+            cell = geohash.encode(gps.latitude, gps.longitude, max(self.precisions))
+            for precision in self.precisions:
+                cell_counts = counts[cell[:precision]]
+                cell_counts[1 if bumpy else 0] += 1
+                cell_counts[2] = max(cell_counts[2], last_seen)
+
+        cells = list(counts)
+        for start in range(0, len(cells), self.MAX_CELLS):
+            chunk = cells[start:start + self.MAX_CELLS]
+            args = []
+            for cell in chunk:
+                smooth, bumpy, last_seen = counts[cell]
+                args.extend([smooth, bumpy, last_seen, (1 - self.smoothing) ** (smooth + bumpy)])
+            await self.update_cells(keys=[self.key(cell) for cell in chunk], args=args)
+
+    async def get_tiles(
+        self, min_latitude: float, min_longitude: float, max_latitude: float, max_longitude: float, precision: int
+    ) -> List[RoadTile]:
+        """Cells with data inside a bounding box, one pipelined HGETALL per covering cell"""
+        cells = geohash.cover(min_latitude, min_longitude, max_latitude, max_longitude, precision)
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for cell in cells:
+            pipeline.hgetall(self.key(cell))
+        tiles = []
+        for cell, values in zip(cells, await pipeline.execute()):
+            if not values:
+                continue
+            cell_min_latitude, cell_min_longitude, cell_max_latitude, cell_max_longitude = geohash.bounds(cell)
+            tiles.append(RoadTile(
+                geohash=cell,
+                min_latitude=cell_min_latitude,
+                min_longitude=cell_min_longitude,
+                max_latitude=cell_max_latitude,
+                max_longitude=cell_max_longitude,
+                smooth_count=int(values.get(b"smooth_count", 0)),
+                bumpy_count=int(values.get(b"bumpy_count", 0)),
+                last_seen=datetime.fromtimestamp(float(values[b"last_seen"])) if b"last_seen" in values else None,
+                severity=float(values.get(b"severity", 0)),
+            ))
+        return tiles
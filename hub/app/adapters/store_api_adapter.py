@@ -2,17 +2,30 @@ import json
 import logging
 from typing import List
 
-import requests
+import httpx
 
 from app.entities.processed_agent_data import ProcessedAgentData
+from app.entities.road_event import RoadEvent, RoadSummary
+from app.entities.road_segment import RoadSegment
 from app.interfaces.store_gateway import StoreGateway
+from codec import Codec, get_codec
 
 
 class StoreApiAdapter(StoreGateway):
-    def __init__(self, api_base_url):
+    def __init__(self, api_base_url, codec: Codec = None, max_connections=20, timeout=10):
         self.api_base_url = api_base_url
+        self.codec = codec or get_codec("json")
+        self.headers = {"Content-Type": self.codec.content_type}
+        if self.codec.content_encoding:
+            self.headers["Content-Encoding"] = self.codec.content_encoding
+        # Keep-alive connections to the store are shared by all concurrent flushes
+        self.client = httpx.AsyncClient(
+            base_url=api_base_url,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+        )
 
-    def save_data(self, processed_agent_data_batch: List[ProcessedAgentData]):
+    async def save_data(self, processed_agent_data_batch: List[ProcessedAgentData]):
         """
         Save the processed road data to the Store API.
         Parameters:
@@ -20,14 +33,15 @@ class StoreApiAdapter(StoreGateway):
         Returns:
             bool: True if the data is successfully saved, False otherwise.
         """
-        processed_agent_data_json_batch = json.dumps(
-            [processed_agent_data.model_dump(mode='json') for processed_agent_data in processed_agent_data_batch]
+        payload = self.codec.encode(
+            [processed_agent_data.model_dump() for processed_agent_data in processed_agent_data_batch]
         )
 
-        response = requests.post(
-            f"{self.api_base_url}/processed_agent_data/",
-            data=processed_agent_data_json_batch,
-        )
+        try:
+            response = await self.client.post("/processed_agent_data/", content=payload, headers=self.headers)
+        except httpx.HTTPError as e:
+            logging.error(f"Failed to save processed agent data: {e}")
+            return False
 
         if response.status_code in [200, 201]:
             logging.info(
@@ -39,3 +53,52 @@ class StoreApiAdapter(StoreGateway):
                 f"Failed to save processed agent data. Status code: {response.status_code}."
             )
             return False
+
+    async def save_road_events(self, road_events: List[RoadEvent]):
+        """
+        Save road defect events to the Store API.
+        Parameters:
+            road_events (List[RoadEvent]): Road defect events to be saved.
+        Returns:
+            bool: True if the events are successfully saved, False otherwise.
+        """
+        return await self._post_json("road_events", [road_event.model_dump(mode="json") for road_event in road_events])
+
+    async def save_road_summaries(self, road_summaries: List[RoadSummary]):
+        """
+        Save periodic road summaries to the Store API.
+        Parameters:
+            road_summaries (List[RoadSummary]): Road summaries to be saved.
+        Returns:
+            bool: True if the summaries are successfully saved, False otherwise.
+        """
+        return await self._post_json("road_summaries", [summary.model_dump(mode="json") for summary in road_summaries])
+
+    async def save_road_segments(self, road_segments: List[RoadSegment]):
+        """
+        Save run-length compressed road segments to the Store API.
+        Parameters:
+            road_segments (List[RoadSegment]): Road segments to be saved.
+        Returns:
+            bool: True if the segments are successfully saved, False otherwise.
+        """
+        return await self._post_json("road_segments", [segment.model_dump(mode="json") for segment in road_segments])
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def _post_json(self, resource: str, records: List[dict]) -> bool:
+        try:
+            response = await self.client.post(
+                f"/{resource}/",
+                content=json.dumps(records),
+                headers={"Content-Type": "application/json"},
+            )
+        except httpx.HTTPError as e:
+            logging.error(f"Failed to save {resource}: {e}")
+            return False
+        if response.status_code in [200, 201]:
+            logging.info(f"Successfully saved {len(records)} {resource}.")
+            return True
+        logging.error(f"Failed to save {resource}. Status code: {response.status_code}.")
+        return False
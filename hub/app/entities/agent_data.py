@@ -1,5 +1,6 @@
 from pydantic import BaseModel, field_validator, Field
 from datetime import datetime
+from typing import Dict, Optional
 
 
 # FastAPI models
@@ -19,6 +20,8 @@ class AgentData(BaseModel):
     accelerometer: AccelerometerData
     gps: GpsData
     timestamp: datetime = Field(..., title="Timestamp", description="Timestamp of the data")
+    # Unix time each hop sent the record, see metrics.py
+    trace: Optional[Dict[str, float]] = None
 
     @classmethod
     @field_validator('timestamp', mode='before')
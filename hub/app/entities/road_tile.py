@@ -0,0 +1,18 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class RoadTile(BaseModel):
+    """Road quality aggregate of one geohash cell"""
+    geohash: str
+    min_latitude: float
+    min_longitude: float
+    max_latitude: float
+    max_longitude: float
+    smooth_count: int
+    bumpy_count: int
+    last_seen: Optional[datetime] = None
+    # Share of "Bumpy" samples, weighted towards the most recent ones
+    severity: float
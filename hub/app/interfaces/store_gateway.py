@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 from typing import List
 from app.entities.processed_agent_data import ProcessedAgentData
+from app.entities.road_event import RoadEvent, RoadSummary
+from app.entities.road_segment import RoadSegment
 
 
 class StoreGateway(ABC):
@@ -10,7 +12,7 @@ class StoreGateway(ABC):
     """
 
     @abstractmethod
-    def save_data(self, processed_agent_data_batch: List[ProcessedAgentData]) -> bool:
+    async def save_data(self, processed_agent_data_batch: List[ProcessedAgentData]) -> bool:
         """
         Method to save the processed agent data in the database.
         Parameters:
@@ -18,4 +20,41 @@ class StoreGateway(ABC):
         Returns:
             bool: True if the data is successfully saved, False otherwise.
         """
-        pass
\ No newline at end of file
+        pass
+
+    @abstractmethod
+    async def save_road_events(self, road_events: List[RoadEvent]) -> bool:
+        """
+        Method to save road defect events in the database.
+        Parameters:
+            road_events (List[RoadEvent]): Road defect events to be saved.
+        Returns:
+            bool: True if the events are successfully saved, False otherwise.
+        """
+        pass
+
+    @abstractmethod
+    async def save_road_summaries(self, road_summaries: List[RoadSummary]) -> bool:
+        """
+        Method to save periodic road summaries in the database.
+        Parameters:
+            road_summaries (List[RoadSummary]): Road summaries to be saved.
+        Returns:
+            bool: True if the summaries are successfully saved, False otherwise.
+        """
+        pass
+
+    @abstractmethod
+    async def save_road_segments(self, road_segments: List[RoadSegment]) -> bool:
+        """
+        Method to save run-length compressed road segments in the database.
+        Parameters:
+            road_segments (List[RoadSegment]): Road segments to be saved.
+        Returns:
+            bool: True if the segments are successfully saved, False otherwise.
+        """
+        pass
+
+    async def close(self):
+        """Release connections held by the gateway"""
+        pass
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List
+
+from app.adapters.redis_buffer import RedisBuffer
+
+
+class BatchFlusher:
+    """
+    Bounds how long records wait in the hub buffer and sizes batches to the load.
+    Requests only push records to the buffer and wake the flusher, which pops complete batches
+    and flushes them in the background, at most `max_in_flight` at a time. While every slot is busy
+    complete batches stay in Redis, so a slow store never slows ingest down, and a finished flush
+    wakes the flusher for the next batch. Whatever is buffered is flushed once `max_latency` seconds
+    passed since the last flush.
+    The batch size stays between `min_batch_size` and `max_batch_size`, large enough
+    that flushing keeps up with the inflow rate at the measured store response time.
+    """
+
+    # Flushing capacity kept above the inflow rate
+    HEADROOM = 2
+    # Weight of the newest measurement in inflow rate and store time averages
+    SMOOTHING = 0.2
+
+    def __init__(
+        self,
+        redis_buffer: RedisBuffer,
+        save: Callable[[List[bytes]], Awaitable[bool]],
+        min_batch_size: int = 20,
+        max_batch_size: int = 1000,
+        max_latency: float = 1,
+        max_in_flight: int = 20,
+    ):
+        self.redis_buffer = redis_buffer
+        self.save = save
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.max_in_flight = max_in_flight
+        self.redis_buffer.batch_size = min_batch_size
+        self.in_flight = set()
+
+        self.inflow = 0
+        self.inflow_rate = 0.0
+        self.store_time = 0.0
+        self.last_flush = time.monotonic()
+        self.wake = None
+        self.stopping = None
+        self.task = None
+
+    def received(self, count: int):
+        """Count records pushed to the buffer for the inflow rate and wake the flusher"""
+        self.inflow += count
+        if self.wake is not None:
+            self.wake.set()
+
+    async def flush(self, records: List[bytes]) -> bool:
+        """Save records popped from the buffer and measure the store response time"""
+        start = time.perf_counter()
+        try:
+            return await self.save(records)
+        finally:
+            self.store_time += self.SMOOTHING * (time.perf_counter() - start - self.store_time)
+            self.last_flush = time.monotonic()
+
+    def _submit(self, records: List[bytes]):
+        task = asyncio.create_task(self._flush_in_background(records))
+        self.in_flight.add(task)
+        task.add_done_callback(self._flushed)
+
+    def _flushed(self, task: asyncio.Task):
+        self.in_flight.discard(task)
+        self.wake.set()
+
+    async def _flush_in_background(self, records: List[bytes]):
+        try:
+            await self.flush(records)
+        except Exception as e:
+            logging.error(f"Error flushing hub batch: {e}")
+
+    def start(self):
+        self.wake = asyncio.Event()
+        self.stopping = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and flush everything left in the buffer"""
+        # The task is not cancelled, so a running flush never loses popped records
+        if self.task:
+            self.stopping.set()
+            self.wake.set()
+            await self.task
+        await asyncio.gather(*self.in_flight, return_exceptions=True)
+        await self.drain()
+
+    async def drain(self):
+        while True:
+            records = await self.redis_buffer.pop(self.max_batch_size)
+            if not records:
+                break
+            await self.flush(records)
+
+    async def _run(self):
+        tick = self.max_latency / 4
+        last_tick = time.monotonic()
+
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout=tick)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            if self.stopping.is_set():
+                break
+            now = time.monotonic()
+            try:
+                if now - last_tick >= tick:
+                    self._adapt(now - last_tick)
+                    last_tick = now
+                await self._fill_slots()
+            except Exception as e:
+                logging.error(f"Error flushing hub buffer: {e}")
+
+    async def _fill_slots(self):
+        """Pop batches while flush slots are free, an incomplete one only after `max_latency`"""
+        while len(self.in_flight) < self.max_in_flight:
+            records = await self.redis_buffer.pop_batch()
+            if not records and time.monotonic() - self.last_flush >= self.max_latency:
+                records = await self.redis_buffer.pop(self.redis_buffer.batch_size)
+                # An empty buffer counts as flushed, so the next record waits at most `max_latency`
+                self.last_flush = time.monotonic()
+            if not records:
+                return
+            self._submit(records)
+
+    def _adapt(self, elapsed: float):
+        rate = self.inflow / elapsed if elapsed > 0 else 0
+        self.inflow = 0
+        self.inflow_rate += self.SMOOTHING * (rate - self.inflow_rate)
+        needed = int(self.inflow_rate * self.store_time * self.HEADROOM)
+        self.redis_buffer.batch_size = max(self.min_batch_size, min(self.max_batch_size, needed))
@@ -0,0 +1,82 @@
+from typing import List, Tuple
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(latitude: float, longitude: float, precision: int) -> str:
+    """Geohash of a point with `precision` characters"""
+    latitude_range, longitude_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash = []
+    bits, value, even = 0, 0, True
+    while len(geohash) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        coordinate, bounds = (longitude, longitude_range) if even else (latitude, latitude_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        if coordinate >= middle:
+            value = value * 2 + 1
+            bounds[0] = middle
+        else:
+            value = value * 2
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            geohash.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(geohash)
+
+
+def bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """Minimum latitude, minimum longitude, maximum latitude and maximum longitude of a geohash cell"""
+    latitude_range, longitude_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for character in geohash:
+        value = BASE32.index(character)
+        for shift in range(4, -1, -1):
+            range_ = longitude_range if even else latitude_range
+            middle = (range_[0] + range_[1]) / 2
+            if value >> shift & 1:
+                range_[0] = middle
+            else:
+                range_[1] = middle
+            even = not even
+    return latitude_range[0], longitude_range[0], latitude_range[1], longitude_range[1]
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """Latitude and longitude extent in degrees of a cell with `precision` characters"""
+    longitude_bits = (5 * precision + 1) // 2
+    latitude_bits = 5 * precision // 2
+    return 180.0 / 2 ** latitude_bits, 360.0 / 2 ** longitude_bits
+
+
+def _grid(min_latitude: float, min_longitude: float, max_latitude: float, max_longitude: float, precision: int):
+    latitude_step, longitude_step = cell_size(precision)
+    rows = range(
+        int((max(min_latitude, -90) + 90) // latitude_step),
+        int((min(max_latitude, 90 - latitude_step / 2) + 90) // latitude_step) + 1,
+    )
+    columns = range(
+        int((max(min_longitude, -180) + 180) // longitude_step),
+        int((min(max_longitude, 180 - longitude_step / 2) + 180) // longitude_step) + 1,
+    )
+    return latitude_step, longitude_step, rows, columns
+
+
+def cell_count(min_latitude: float, min_longitude: float, max_latitude: float, max_longitude: float, precision: int) -> int:
+    """Number of cells `cover` returns for a bounding box"""
+    _, _, rows, columns = _grid(min_latitude, min_longitude, max_latitude, max_longitude, precision)
+    return len(rows) * len(columns)
+
+
+def cover(min_latitude: float, min_longitude: float, max_latitude: float, max_longitude: float, precision: int) -> List[str]:
+    """Geohashes of all cells intersecting a bounding box, row by row from the south-west corner"""
+    latitude_step, longitude_step, rows, columns = _grid(
+        min_latitude, min_longitude, max_latitude, max_longitude, precision
+    )
+    return [
+        # Encode the cell center, so float rounding at cell edges never picks a neighbour
+        encode(-90 + (row + 0.5) * latitude_step, -180 + (column + 0.5) * longitude_step, precision)
+        for row in rows
+        for column in columns
+    ]
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List
+
+from app.adapters.redis_retry_queue import RedisRetryQueue
+from metrics import metrics
+
+
+class RetryWorker:
+    """
+    Resends parked batches to the store at no more than `rate` batches per second.
+    Batches are taken one at a time, the first failure ends the round,
+    so a store that is still down costs one request per `interval`.
+    """
+
+    def __init__(
+        self,
+        retry_queue: RedisRetryQueue,
+        save: Callable[[List[bytes]], Awaitable[bool]],
+        rate: float = 5,
+        interval: float = 1,
+    ):
+        self.retry_queue = retry_queue
+        self.save = save
+        self.rate = rate
+        self.interval = interval
+        self.stopping = None
+        self.task = None
+
+    def start(self):
+        self.stopping = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.stopping.set()
+            await self.task
+
+    async def _run(self):
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=self.interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self._retry(max(1, int(self.rate * self.interval)))
+            except Exception as e:
+                logging.error(f"Error retrying parked batches: {e}")
+
+    async def _retry(self, budget: int):
+        for _ in range(budget):
+            taken = await self.retry_queue.take(1)
+            if not taken:
+                return
+            entry, attempts, records = taken[0]
+            if await self.save([record.encode("utf-8") for record in records]):
+                await self.retry_queue.done(entry)
+                metrics.count("retry_saved", len(records))
+                continue
+
+            if not await self.retry_queue.failed(entry, attempts, records):
+                metrics.count("dead_lettered", len(records))
+                logging.error(f"Batch of {len(records)} records failed {attempts + 1} times, moved to dead letters")
+            return
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Tuple
+
+from app.adapters.redis_stream_buffer import RedisStreamBuffer
+
+
+class StreamConsumer:
+    """
+    Reads batches from a Redis Stream consumer group and acknowledges them once saved.
+    A batch is collected until `min_batch_size` entries arrived or `max_latency` seconds passed,
+    under load one read fills it up to `max_batch_size`. Entries left pending for
+    `claim_idle` seconds, by a failed save here or a crashed worker elsewhere, are claimed and saved again.
+    """
+
+    def __init__(
+        self,
+        stream_buffer: RedisStreamBuffer,
+        save: Callable[[List[bytes]], Awaitable[bool]],
+        min_batch_size: int = 20,
+        max_batch_size: int = 1000,
+        max_latency: float = 1,
+        claim_idle: float = 30,
+    ):
+        self.stream_buffer = stream_buffer
+        self.save = save
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.claim_idle = claim_idle
+        self.stopping = None
+        self.task = None
+
+    async def start(self):
+        await self.stream_buffer.create_group()
+        self.stopping = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop reading and wait for the batch in progress, unread entries stay for other workers"""
+        if self.task:
+            self.stopping.set()
+            await self.task
+
+    async def _run(self):
+        last_claim = time.monotonic()
+
+        while not self.stopping.is_set():
+            try:
+                if time.monotonic() - last_claim >= self.claim_idle / 2:
+                    last_claim = time.monotonic()
+                    claimed = await self.stream_buffer.claim(self.claim_idle, self.max_batch_size)
+                    if claimed:
+                        logging.info(f"Claimed {len(claimed)} pending stream entries")
+                        await self._flush(claimed)
+
+                entries = await self._collect()
+                if entries:
+                    await self._flush(entries)
+            except Exception as e:
+                logging.error(f"Error consuming hub stream: {e}")
+                await asyncio.sleep(self.max_latency)
+
+    async def _collect(self) -> List[Tuple[bytes, bytes]]:
+        entries = []
+        deadline = time.monotonic() + self.max_latency
+        while len(entries) < self.min_batch_size and not self.stopping.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            entries.extend(await self.stream_buffer.read(self.max_batch_size - len(entries), remaining))
+        return entries
+
+    async def _flush(self, entries: List[Tuple[bytes, bytes]]):
+        if await self.save([record for _, record in entries]):
+            await self.stream_buffer.ack([entry_id for entry_id, _ in entries])
+        else:
+            # Left pending, the entries are claimed again after `claim_idle` seconds
+            logging.error(f"Store did not save {len(entries)} stream entries, they stay pending")
@@ -1,4 +1,5 @@
 import os
+import socket
 
 
 def try_parse_int(value: str):
@@ -8,19 +9,66 @@ def try_parse_int(value: str):
         return None
 
 
+def try_parse_float(value: str):
+    try:
+        return float(value)
+    except Exception:
+        return None
+
+
 # Configuration for the Store API
 STORE_API_HOST = os.environ.get("STORE_API_HOST") or "localhost"
 STORE_API_PORT = try_parse_int(os.environ.get("STORE_API_PORT")) or 8000
 STORE_API_BASE_URL = f"http://{STORE_API_HOST}:{STORE_API_PORT}"
+# Pooled connections to the Store API and request timeout in seconds
+STORE_MAX_CONNECTIONS = try_parse_int(os.environ.get("STORE_MAX_CONNECTIONS")) or 20
+STORE_TIMEOUT = try_parse_float(os.environ.get("STORE_TIMEOUT")) or 10
 
 # Configure for Redis
 REDIS_HOST = os.environ.get("REDIS_HOST") or "localhost"
 REDIS_PORT = try_parse_int(os.environ.get("REDIS_PORT")) or 6379
 
 # Configure for hub logic
+# Batches adapt to the inflow rate between BATCH_SIZE and BATCH_MAX_SIZE records,
+# buffered records are flushed at the latest BATCH_MAX_LATENCY seconds after the previous flush
 BATCH_SIZE = try_parse_int(os.environ.get("BATCH_SIZE")) or 20
+BATCH_MAX_SIZE = try_parse_int(os.environ.get("BATCH_MAX_SIZE")) or 1000
+BATCH_MAX_LATENCY = try_parse_float(os.environ.get("BATCH_MAX_LATENCY")) or 1
+
+# Buffer mode: "list" flushes batches from a Redis list, "stream" reads a Redis Stream
+# through a consumer group, so several hub workers share the load with at-least-once delivery.
+# In stream mode hub workers also share one MQTT subscription named after STREAM_GROUP
+BUFFER_MODE = os.environ.get("BUFFER_MODE") or "list"
+STREAM_GROUP = os.environ.get("STREAM_GROUP") or "hub"
+STREAM_CONSUMER = os.environ.get("STREAM_CONSUMER") or f"{socket.gethostname()}-{os.getpid()}"
+# Seconds an entry stays pending before another consumer claims it
+STREAM_CLAIM_IDLE = try_parse_float(os.environ.get("STREAM_CLAIM_IDLE")) or 30
+
+# NDJSON lines validated and buffered together by the bulk endpoint
+BULK_CHUNK_SIZE = try_parse_int(os.environ.get("BULK_CHUNK_SIZE")) or 1000
+
+# Road quality tiles: per geohash cell aggregates at several precisions, updated as data is received
+ROAD_TILES = (os.environ.get("ROAD_TILES") or "true").lower() == "true"
+ROAD_TILE_PRECISIONS = [int(precision) for precision in (os.environ.get("ROAD_TILE_PRECISIONS") or "5,6,7").split(",")]
+# Weight of one sample in the rolling severity and most cells one bounding box query may cover
+ROAD_TILE_SMOOTHING = try_parse_float(os.environ.get("ROAD_TILE_SMOOTHING")) or 0.05
+ROAD_TILE_MAX_CELLS = try_parse_int(os.environ.get("ROAD_TILE_MAX_CELLS")) or 10000
+
+# Batches the store did not accept are retried with exponential backoff between
+# RETRY_BASE_DELAY and RETRY_MAX_DELAY seconds, at most RETRY_RATE batches per second,
+# and moved to a dead-letter list after RETRY_MAX_ATTEMPTS failures
+RETRY_BASE_DELAY = try_parse_float(os.environ.get("RETRY_BASE_DELAY")) or 1
+RETRY_MAX_DELAY = try_parse_float(os.environ.get("RETRY_MAX_DELAY")) or 300
+RETRY_MAX_ATTEMPTS = try_parse_int(os.environ.get("RETRY_MAX_ATTEMPTS")) or 10
+RETRY_RATE = try_parse_float(os.environ.get("RETRY_RATE")) or 5
+
+# Wire codec for data sent to the store: json, msgpack or struct, optionally with +zlib or +zstd
+WIRE_CODEC = os.environ.get("WIRE_CODEC") or "json"
 
 # MQTT
 MQTT_BROKER_HOST = os.environ.get("MQTT_BROKER_HOST") or "localhost"
 MQTT_BROKER_PORT = try_parse_int(os.environ.get("MQTT_BROKER_PORT")) or 1883
 MQTT_TOPIC = os.environ.get("MQTT_TOPIC") or "processed_agent_data_topic"
+# MQTT messages waiting for the event loop and tasks processing them concurrently
+MQTT_QUEUE_SIZE = try_parse_int(os.environ.get("MQTT_QUEUE_SIZE")) or 10000
+MQTT_CONSUMERS = try_parse_int(os.environ.get("MQTT_CONSUMERS")) or 4
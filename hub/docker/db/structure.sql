@@ -7,5 +7,76 @@ CREATE TABLE processed_agent_data (
     z FLOAT,
     latitude FLOAT,
     longitude FLOAT,
-    timestamp TIMESTAMP
-);
\ No newline at end of file
+    timestamp TIMESTAMP,
+    grid_cell BIGINT
+);
+
+CREATE INDEX ix_processed_agent_data_timestamp_id ON processed_agent_data (timestamp, id);
+CREATE INDEX ix_processed_agent_data_grid_cell ON processed_agent_data (grid_cell);
+
+CREATE TABLE road_events (
+    id SERIAL PRIMARY KEY,
+    latitude FLOAT,
+    longitude FLOAT,
+    start_timestamp TIMESTAMP,
+    end_timestamp TIMESTAMP,
+    hit_count INTEGER,
+    severity FLOAT
+);
+
+CREATE TABLE road_summaries (
+    id SERIAL PRIMARY KEY,
+    start_timestamp TIMESTAMP,
+    end_timestamp TIMESTAMP,
+    smooth_count INTEGER,
+    bumpy_count INTEGER,
+    event_count INTEGER
+);
+
+CREATE TABLE road_segments (
+    id SERIAL PRIMARY KEY,
+    road_state VARCHAR(255),
+    start_timestamp TIMESTAMP,
+    end_timestamp TIMESTAMP,
+    start_latitude FLOAT,
+    start_longitude FLOAT,
+    end_latitude FLOAT,
+    end_longitude FLOAT,
+    sample_count INTEGER,
+    min_z FLOAT,
+    max_z FLOAT,
+    mean_z FLOAT
+);
+
+CREATE TABLE road_rollups_minute (
+    bucket_start TIMESTAMP,
+    grid_cell BIGINT,
+    road_state VARCHAR(255),
+    sample_count INTEGER,
+    min_z FLOAT,
+    max_z FLOAT,
+    sum_z FLOAT,
+    PRIMARY KEY (bucket_start, grid_cell, road_state)
+);
+
+CREATE TABLE road_rollups_hour (
+    bucket_start TIMESTAMP,
+    grid_cell BIGINT,
+    road_state VARCHAR(255),
+    sample_count INTEGER,
+    min_z FLOAT,
+    max_z FLOAT,
+    sum_z FLOAT,
+    PRIMARY KEY (bucket_start, grid_cell, road_state)
+);
+
+CREATE TABLE road_rollups_day (
+    bucket_start TIMESTAMP,
+    grid_cell BIGINT,
+    road_state VARCHAR(255),
+    sample_count INTEGER,
+    min_z FLOAT,
+    max_z FLOAT,
+    sum_z FLOAT,
+    PRIMARY KEY (bucket_start, grid_cell, road_state)
+);
@@ -1,20 +1,60 @@
+import asyncio
 import logging
-from typing import List
+import time
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import List, Tuple
 
-from fastapi import FastAPI
-from redis import Redis
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from redis.asyncio import Redis
 import paho.mqtt.client as mqtt
 
+from app.adapters.bulk_body import iter_body, iter_line_chunks
+from app.adapters.redis_buffer import RedisBuffer
+from app.adapters.redis_retry_queue import RedisRetryQueue
+from app.adapters.redis_stream_buffer import RedisStreamBuffer
+from app.adapters.redis_tile_store import RedisTileStore
 from app.adapters.store_api_adapter import StoreApiAdapter
 from app.entities.processed_agent_data import ProcessedAgentData
+from app.entities.road_event import RoadEvent, RoadSummary
+from app.entities.road_segment import RoadSegment
+from app.entities.road_tile import RoadTile
+from app.usecases import geohash
+from app.usecases.batch_flusher import BatchFlusher
+from app.usecases.retry_worker import RetryWorker
+from app.usecases.stream_consumer import StreamConsumer
+from codec import DecodeError, codec_for_http, codec_for_topic, get_codec
+from metrics import metrics
 from config import (
     STORE_API_BASE_URL,
     REDIS_HOST,
     REDIS_PORT,
     BATCH_SIZE,
+    BATCH_MAX_SIZE,
+    BATCH_MAX_LATENCY,
     MQTT_TOPIC,
     MQTT_BROKER_HOST,
     MQTT_BROKER_PORT,
+    WIRE_CODEC,
+    STORE_MAX_CONNECTIONS,
+    STORE_TIMEOUT,
+    MQTT_QUEUE_SIZE,
+    MQTT_CONSUMERS,
+    BUFFER_MODE,
+    STREAM_GROUP,
+    STREAM_CONSUMER,
+    STREAM_CLAIM_IDLE,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_RATE,
+    BULK_CHUNK_SIZE,
+    ROAD_TILES,
+    ROAD_TILE_PRECISIONS,
+    ROAD_TILE_SMOOTHING,
+    ROAD_TILE_MAX_CELLS,
 )
 
 # Configure logging settings
@@ -28,29 +68,309 @@ logging.basicConfig(
 )
 # Create an instance of the Redis using the configuration
 redis_client = Redis(host=REDIS_HOST, port=REDIS_PORT)
+redis_buffer = RedisBuffer(redis_client, "processed_agent_data", BATCH_SIZE)
+stream_buffer = RedisStreamBuffer(redis_client, "processed_agent_data_stream", STREAM_GROUP, STREAM_CONSUMER)
+tile_store = RedisTileStore(redis_client, ROAD_TILE_PRECISIONS, ROAD_TILE_SMOOTHING)
+
+
+def create_retry_queue(resource: str) -> RedisRetryQueue:
+    return RedisRetryQueue(
+        redis_client,
+        f"{resource}_retry",
+        f"{resource}_dead_letter",
+        base_delay=RETRY_BASE_DELAY,
+        max_delay=RETRY_MAX_DELAY,
+        max_attempts=RETRY_MAX_ATTEMPTS,
+    )
+
+
+retry_queue = create_retry_queue("processed_agent_data")
 # Create an instance of the StoreApiAdapter using the configuration
-store_adapter = StoreApiAdapter(api_base_url=STORE_API_BASE_URL)
+store_adapter = StoreApiAdapter(
+    api_base_url=STORE_API_BASE_URL,
+    codec=get_codec(WIRE_CODEC),
+    max_connections=STORE_MAX_CONNECTIONS,
+    timeout=STORE_TIMEOUT,
+)
 # Create an instance of the AgentMQTTAdapter using the configuration
 
+processed_agent_data_list = TypeAdapter(List[ProcessedAgentData])
+
+
+def trace_received(processed_agent_data_batch: List[ProcessedAgentData]):
+    """Observe hop latencies of received data and extend its trace context with the hub"""
+    now = time.time()
+    traces = [processed_agent_data.agent_data.trace for processed_agent_data in processed_agent_data_batch]
+    metrics.observe_hops(traces, {"agent": "agent_to_hub", "edge": "edge_to_hub"}, now)
+    metrics.count("records_received", len(processed_agent_data_batch))
+    for processed_agent_data, trace in zip(processed_agent_data_batch, traces):
+        processed_agent_data.agent_data.trace = {**(trace or {}), "hub": now}
+
+
+async def save(records: List[bytes]) -> bool:
+    """Save records popped from the Redis buffer to the store"""
+    processed_agent_data_batch = [ProcessedAgentData.model_validate_json(record) for record in records]
+    traces = [processed_agent_data.agent_data.trace for processed_agent_data in processed_agent_data_batch]
+    metrics.observe_hops(traces, {"hub": "buffer_dwell"})
+    with metrics.timer("store_post"):
+        saved = await store_adapter.save_data(processed_agent_data_batch=processed_agent_data_batch)
+    if saved:
+        metrics.count("records_flushed", len(processed_agent_data_batch))
+    return saved
+
+
+async def save_or_park(records: List[bytes]) -> bool:
+    """Save records to the store, park them in the retry queue when the store does not accept them"""
+    if not await save(records):
+        await retry_queue.park(records)
+        metrics.count("retry_parked", len(records))
+    return True
+
+
+batch_flusher = BatchFlusher(
+    redis_buffer, save_or_park, BATCH_SIZE, BATCH_MAX_SIZE, BATCH_MAX_LATENCY, max_in_flight=STORE_MAX_CONNECTIONS
+)
+stream_consumer = StreamConsumer(
+    stream_buffer, save_or_park, BATCH_SIZE, BATCH_MAX_SIZE, BATCH_MAX_LATENCY, STREAM_CLAIM_IDLE
+)
+retry_worker = RetryWorker(retry_queue, save, RETRY_RATE)
+
+# Road events, summaries and segments are already aggregated by the edge and skip the buffer,
+# those the store does not accept are parked in a retry queue per resource
+road_data = {
+    "road_events": (RoadEvent, store_adapter.save_road_events),
+    "road_summaries": (RoadSummary, store_adapter.save_road_summaries),
+    "road_segments": (RoadSegment, store_adapter.save_road_segments),
+}
+road_retry_queues = {resource: create_retry_queue(resource) for resource in road_data}
+
+
+async def save_road_data(resource: str, records: List[bytes]) -> bool:
+    """Save parked road events, summaries or segments to the store"""
+    model, save_to_store = road_data[resource]
+    return await save_to_store([model.model_validate_json(record) for record in records])
+
+
+async def save_or_park_road_data(resource: str, items: List[BaseModel]):
+    """Save road events, summaries or segments to the store, park them when the store does not accept them"""
+    _, save_to_store = road_data[resource]
+    if not await save_to_store(items):
+        await road_retry_queues[resource].park([item.model_dump_json() for item in items])
+        metrics.count("retry_parked", len(items))
+
+
+road_retry_workers = [
+    RetryWorker(road_retry_queues[resource], partial(save_road_data, resource), RETRY_RATE) for resource in road_data
+]
+
+
+async def buffer(processed_agent_data_batch: List[ProcessedAgentData]):
+    """Push received data to the Redis buffer, the batch flusher or stream consumers save it"""
+    trace_received(processed_agent_data_batch)
+    if ROAD_TILES:
+        try:
+            with metrics.timer("tile_update"):
+                await tile_store.update(processed_agent_data_batch)
+        except Exception as e:
+            logging.error(f"Error updating road tiles: {e}")
+    records = [processed_agent_data.model_dump_json() for processed_agent_data in processed_agent_data_batch]
+    if BUFFER_MODE == "stream":
+        # Saved by the stream consumers of all hub workers
+        with metrics.timer("redis_push"):
+            await stream_buffer.add(records)
+        return
+
+    with metrics.timer("redis_push"):
+        await redis_buffer.push(records)
+    # Complete batches wait in Redis for a free flush slot, so ingest never waits for the store
+    batch_flusher.received(len(processed_agent_data_batch))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # MQTT messages arrive on the paho network thread and are handed to the event loop through a queue
+    loop = asyncio.get_running_loop()
+    mqtt_queue = asyncio.Queue(maxsize=MQTT_QUEUE_SIZE)
+    client.on_message = lambda client, userdata, msg: loop.call_soon_threadsafe(enqueue_message, mqtt_queue, msg)
+    consumers = [asyncio.create_task(consume_messages(mqtt_queue)) for _ in range(MQTT_CONSUMERS)]
+    if BUFFER_MODE == "stream":
+        await stream_consumer.start()
+    else:
+        batch_flusher.start()
+    retry_worker.start()
+    for road_retry_worker in road_retry_workers:
+        road_retry_worker.start()
+    client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT)
+    client.loop_start()
+    yield
+    # Stop receiving from MQTT, process queued messages, then drain the buffer to the store
+    client.loop_stop()
+    client.disconnect()
+    await mqtt_queue.join()
+    for consumer in consumers:
+        consumer.cancel()
+    if BUFFER_MODE == "stream":
+        await stream_consumer.stop()
+    else:
+        await batch_flusher.stop()
+    await retry_worker.stop()
+    for road_retry_worker in road_retry_workers:
+        await road_retry_worker.stop()
+    await store_adapter.close()
+    await redis_client.close()
+
+
 # FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    return metrics.render("hub")
 
 
 @app.post("/processed_agent_data/")
-async def save_processed_agent_data(processed_agent_data: ProcessedAgentData):
-    redis_client.lpush("processed_agent_data", processed_agent_data.model_dump_json())
-    if redis_client.llen("processed_agent_data") >= BATCH_SIZE:
-        processed_agent_data_batch: List[ProcessedAgentData] = []
-        for _ in range(BATCH_SIZE):
-            processed_agent_data = ProcessedAgentData.model_validate_json(
-                redis_client.lpop("processed_agent_data")
+async def save_processed_agent_data(request: Request):
+    # The body codec is negotiated by Content-Type and Content-Encoding headers,
+    # a body is a single record or a list of records, optionally gzip-compressed
+    try:
+        with metrics.timer("decode"):
+            codec = codec_for_http(
+                request.headers.get("content-type"), request.headers.get("content-encoding")
             )
-            processed_agent_data_batch.append(processed_agent_data)
-        print(processed_agent_data_batch)
-        store_adapter.save_data(processed_agent_data_batch=processed_agent_data_batch)
+            processed_agent_data_batch = processed_agent_data_list.validate_python(
+                codec.decode(await request.body())
+            )
+    except (DecodeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    await buffer(processed_agent_data_batch)
     return {"status": "ok"}
 
 
+def first_invalid_line(lines: List[Tuple[int, bytes]]) -> Tuple[List[ProcessedAgentData], int, str]:
+    """
+    Validate lines of a rejected NDJSON chunk one by one.
+    Returns:
+        (valid, line_number, error): Records of the lines before the first invalid one, its number and error.
+    """
+    valid = []
+    for line_number, line in lines:
+        try:
+            valid.append(ProcessedAgentData.model_validate_json(line))
+        except ValidationError as e:
+            return valid, line_number, str(e)
+    return [], lines[0][0], "Invalid NDJSON chunk"
+
+
+@app.post("/processed_agent_data/bulk/")
+async def save_processed_agent_data_bulk(request: Request):
+    """
+    Bulk ingest of a JSON array or NDJSON, optionally gzip or deflate encoded.
+    A JSON array is validated in one pass, NDJSON is validated and buffered
+    in chunks of BULK_CHUNK_SIZE lines while the body streams in.
+
+    NDJSON records before an invalid line are saved, the response reports the line number
+    "rejected_at" of the first line that was not, and a client resends from that line.
+    It is 422 when no record was accepted and 207 with the "accepted" count otherwise,
+    as a retry of the whole body would duplicate the accepted records.
+    """
+    media_type = (request.headers.get("content-type") or "application/json").split(";")[0].strip()
+    if media_type not in ("application/json", "application/x-ndjson"):
+        raise HTTPException(status_code=415, detail=f"Unsupported content type: {media_type}")
+    try:
+        body = iter_body(request.stream(), request.headers.get("content-encoding"))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+    if media_type == "application/json":
+        try:
+            with metrics.timer("decode"):
+                processed_agent_data_batch = processed_agent_data_list.validate_json(
+                    b"".join([chunk async for chunk in body])
+                )
+        except (DecodeError, ValueError) as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        await buffer(processed_agent_data_batch)
+        return {"status": "ok", "accepted": len(processed_agent_data_batch)}
+
+    accepted = 0
+    rejected_at = 1
+    try:
+        async for lines in iter_line_chunks(body, BULK_CHUNK_SIZE):
+            try:
+                with metrics.timer("decode"):
+                    processed_agent_data_batch = processed_agent_data_list.validate_json(
+                        b"[" + b",".join(line for _, line in lines) + b"]"
+                    )
+            except ValidationError:
+                processed_agent_data_batch, line_number, error = first_invalid_line(lines)
+                if processed_agent_data_batch:
+                    await buffer(processed_agent_data_batch)
+                return partially_accepted(accepted + len(processed_agent_data_batch), line_number, error)
+            await buffer(processed_agent_data_batch)
+            accepted += len(processed_agent_data_batch)
+            rejected_at = lines[-1][0] + 1
+    except DecodeError as e:
+        return partially_accepted(accepted, rejected_at, str(e))
+    return {"status": "ok", "accepted": accepted}
+
+
+def partially_accepted(accepted: int, rejected_at: int, error: str):
+    """Response to a bulk body that was accepted up to line `rejected_at`"""
+    if not accepted:
+        raise HTTPException(status_code=422, detail={"accepted": 0, "rejected_at": rejected_at, "error": error})
+    return JSONResponse(
+        status_code=207,
+        content={"status": "partial", "accepted": accepted, "rejected_at": rejected_at, "error": error},
+    )
+
+
+@app.get("/road_tiles/", response_model=List[RoadTile])
+async def read_road_tiles(
+    min_latitude: float,
+    min_longitude: float,
+    max_latitude: float,
+    max_longitude: float,
+    precision: int = ROAD_TILE_PRECISIONS[0],
+):
+    """Road quality tiles with data inside a bounding box, read per covering cell without scanning samples"""
+    if precision not in ROAD_TILE_PRECISIONS:
+        raise HTTPException(status_code=400, detail=f"Precision must be one of {ROAD_TILE_PRECISIONS}")
+    if min_latitude > max_latitude or min_longitude > max_longitude:
+        raise HTTPException(status_code=400, detail="Bounding box minimum exceeds its maximum")
+    cells = geohash.cell_count(min_latitude, min_longitude, max_latitude, max_longitude, precision)
+    if cells > ROAD_TILE_MAX_CELLS:
+        raise HTTPException(
+            status_code=400, detail=f"Bounding box covers {cells} cells, use a lower precision or a smaller box"
+        )
+    return await tile_store.get_tiles(min_latitude, min_longitude, max_latitude, max_longitude, precision)
+
+
+@app.post("/road_events/")
+async def save_road_events(road_events: List[RoadEvent]):
+    # Events are already aggregated by the edge, so they skip the buffer and are parked when the store fails
+    await save_or_park_road_data("road_events", road_events)
+    return {"status": "ok"}
+
+
+@app.post("/road_summaries/")
+async def save_road_summaries(road_summaries: List[RoadSummary]):
+    await save_or_park_road_data("road_summaries", road_summaries)
+    return {"status": "ok"}
+
+
+@app.post("/road_segments/")
+async def save_road_segments(road_segments: List[RoadSegment]):
+    await save_or_park_road_data("road_segments", road_segments)
+    return {"status": "ok"}
+
+
+road_event_list = TypeAdapter(List[RoadEvent])
+road_summary_list = TypeAdapter(List[RoadSummary])
+road_segment_list = TypeAdapter(List[RoadSegment])
+
+
 # MQTT
 client = mqtt.Client()
 
@@ -58,39 +378,51 @@ client = mqtt.Client()
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         logging.info("Connected to MQTT broker")
-        client.subscribe(MQTT_TOPIC)
+        # Several hub workers consume in stream mode, a shared subscription gives every message to one of them
+        subscription = f"$share/{STREAM_GROUP}/{MQTT_TOPIC}" if BUFFER_MODE == "stream" else MQTT_TOPIC
+        # Non-JSON codecs, road events, summaries and segments arrive on topic suffixes
+        client.subscribe([(subscription, 0), (f"{subscription}/+", 0)])
     else:
         logging.info(f"Failed to connect to MQTT broker with code: {rc}")
 
 
-def on_message(client, userdata, msg):
+def enqueue_message(mqtt_queue: asyncio.Queue, msg):
     try:
-        payload: str = msg.payload.decode("utf-8")
-        # Create ProcessedAgentData instance with the received data
-        processed_agent_data = ProcessedAgentData.model_validate_json(
-            payload, strict=True
-        )
+        mqtt_queue.put_nowait(msg)
+    except asyncio.QueueFull:
+        metrics.count("mqtt_dropped")
+        logging.error("Hub MQTT queue is full, dropping message")
 
-        redis_client.lpush(
-            "processed_agent_data", processed_agent_data.model_dump_json()
-        )
-        processed_agent_data_batch: List[ProcessedAgentData] = []
-        if redis_client.llen("processed_agent_data") >= BATCH_SIZE:
-            for _ in range(BATCH_SIZE):
-                processed_agent_data = ProcessedAgentData.model_validate_json(
-                    redis_client.lpop("processed_agent_data")
-                )
-                processed_agent_data_batch.append(processed_agent_data)
-        store_adapter.save_data(processed_agent_data_batch=processed_agent_data_batch)
-        return {"status": "ok"}
+
+async def consume_messages(mqtt_queue: asyncio.Queue):
+    while True:
+        msg = await mqtt_queue.get()
+        try:
+            await handle_message(msg)
+        finally:
+            mqtt_queue.task_done()
+
+
+async def handle_message(msg):
+    try:
+        if msg.topic == f"{MQTT_TOPIC}/road_events":
+            await save_or_park_road_data("road_events", road_event_list.validate_json(msg.payload))
+            return
+        if msg.topic == f"{MQTT_TOPIC}/road_summaries":
+            await save_or_park_road_data("road_summaries", road_summary_list.validate_json(msg.payload))
+            return
+        if msg.topic == f"{MQTT_TOPIC}/road_segments":
+            await save_or_park_road_data("road_segments", road_segment_list.validate_json(msg.payload))
+            return
+
+        # Create ProcessedAgentData instances with the received data
+        with metrics.timer("decode"):
+            codec = codec_for_topic(msg.topic, MQTT_TOPIC)
+            processed_agent_data_batch = processed_agent_data_list.validate_python(codec.decode(msg.payload))
+        await buffer(processed_agent_data_batch)
     except Exception as e:
         logging.info(f"Error processing MQTT message: {e}")
 
 
-# Connect
+# Connected and started in lifespan, once the event loop runs
 client.on_connect = on_connect
-client.on_message = on_message
-client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT)
-
-# Start
-client.loop_start()
\ No newline at end of file
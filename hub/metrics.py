@@ -0,0 +1,133 @@
+"""
+In-process pipeline metrics: per-stage latency histograms and throughput counters.
+Copied into edge, hub and store from shared/metrics.py by shared/sync.py, edit that file instead.
+
+Records carry a trace context, a "trace" dict with the unix time each hop sent them
+("agent", "edge", "hub"), so every service can also measure the latency of the hops before it.
+Metrics are rendered in the Prometheus text format by /metrics endpoints,
+the MQTT-only edge prints a summary to its log instead.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+# Histogram bucket upper bounds in seconds, 100 microseconds to one minute
+BUCKETS = [
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+]
+
+
+class Histogram:
+    def __init__(self, buckets: List[float] = BUCKETS):
+        self.buckets = buckets
+        # The last count is the overflow bucket above the largest bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            seen += count
+            if seen >= rank and seen > 0:
+                return bound
+        return 0.0
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            self._histogram(stage).observe(seconds)
+
+    def observe_many(self, stage: str, values: Iterable[float]):
+        with self.lock:
+            histogram = self._histogram(stage)
+            for seconds in values:
+                histogram.observe(seconds)
+
+    def count(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Observe the wall time of the block, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe_hops(self, traces: Iterable[Optional[dict]], hops: Dict[str, str], now: float = None):
+        """
+        Observe the age of records since earlier hops of their trace context.
+        `hops` maps a trace key, e.g. "agent", to the stage name to observe, e.g. "agent_to_edge".
+        """
+        now = now or time.time()
+        with self.lock:
+            for trace in traces:
+                if not trace:
+                    continue
+                for hop, stage in hops.items():
+                    if hop in trace:
+                        self._histogram(stage).observe(max(0.0, now - trace[hop]))
+
+    def render(self, prefix: str) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            if self.histograms:
+                lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """One line per stage with count, mean and p50/p90/p99 in milliseconds, then counters"""
+        lines = []
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                if not histogram.count:
+                    continue
+                mean = histogram.sum / histogram.count
+                p50, p90, p99 = (histogram.quantile(q) for q in (0.5, 0.9, 0.99))
+                lines.append(
+                    f"{stage}: count={histogram.count} mean={mean * 1000:.2f}ms "
+                    f"p50<={p50 * 1000:g}ms p90<={p90 * 1000:g}ms p99<={p99 * 1000:g}ms"
+                )
+            lines.extend(f"{name}: {value:g}" for name, value in sorted(self.counters.items()))
+        return "\n".join(lines)
+
+    def _histogram(self, stage: str) -> Histogram:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        return histogram
+
+
+# Process-wide registry
+metrics = Metrics()
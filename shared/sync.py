@@ -0,0 +1,46 @@
+"""
+Copy the modules shared between services into each service directory.
+Every service is built from its own Docker context, so the copies are committed;
+run with --check to fail when a copy differs from its source here.
+
+    python shared/sync.py [--check]
+"""
+import argparse
+import shutil
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Shared module and the service directories it is copied into
+MODULES = {
+    "codec.py": ["agent/src", "edge", "hub", "store"],
+    "metrics.py": ["edge", "hub", "store"],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="report differing copies instead of overwriting them")
+    args = parser.parse_args()
+
+    stale = []
+    for module, directories in MODULES.items():
+        source = ROOT / "shared" / module
+        for directory in directories:
+            copy = ROOT / directory / module
+            if copy.exists() and copy.read_bytes() == source.read_bytes():
+                continue
+            stale.append(copy.relative_to(ROOT))
+            if not args.check:
+                shutil.copyfile(source, copy)
+
+    for path in stale:
+        print(f"{path} differs from shared/{path.name}" if args.check else f"Updated {path}")
+    if args.check and stale:
+        print("Run python shared/sync.py to update the copies")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
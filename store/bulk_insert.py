@@ -0,0 +1,75 @@
+from typing import Any, Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from db import processed_agent_data
+from models import ProcessedAgentData, ProcessedAgentDataInDB
+from spatial import grid_cell
+
+
+def to_row(item: ProcessedAgentData) -> Dict[str, Any]:
+    return {
+        "road_state": item.road_state,
+        "x": item.agent_data.accelerometer.x,
+        "y": item.agent_data.accelerometer.y,
+        "z": item.agent_data.accelerometer.z,
+        "latitude": item.agent_data.gps.latitude,
+        "longitude": item.agent_data.gps.longitude,
+        "timestamp": item.agent_data.timestamp,
+        "grid_cell": grid_cell(item.agent_data.gps.latitude, item.agent_data.gps.longitude),
+    }
+
+
+async def insert_processed_agent_data(
+    conn: AsyncConnection, data: List[ProcessedAgentData], copy_threshold: int
+) -> List[ProcessedAgentDataInDB]:
+    """
+    Insert a batch of processed agent data on an open transaction.
+    Parameters:
+        conn (AsyncConnection): Connection inside the transaction of the batch.
+        data (List[ProcessedAgentData]): Records to insert.
+        copy_threshold (int): Batches of at least this many rows are written with PostgreSQL COPY.
+    Returns:
+        List[ProcessedAgentDataInDB]: The inserted records with their ids, in the order of `data`.
+    """
+    if not data:
+        return []
+    rows = [to_row(item) for item in data]
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "asyncpg" and len(rows) >= copy_threshold:
+        ids = await _copy(conn, rows)
+    else:
+        ids = await _insert_returning(conn, rows)
+    return [ProcessedAgentDataInDB(id=id, **row) for id, row in zip(ids, rows)]
+
+
+async def _insert_returning(conn: AsyncConnection, rows: List[Dict[str, Any]]) -> List[int]:
+    # SQLAlchemy batches executemany into multi-row INSERT ... VALUES ... RETURNING statements,
+    # sorting by parameter order keeps the returned ids aligned with the rows
+    result = await conn.execute(
+        processed_agent_data.insert().returning(processed_agent_data.c.id, sort_by_parameter_order=True),
+        rows,
+    )
+    return list(result.scalars())
+
+
+async def _copy(conn: AsyncConnection, rows: List[Dict[str, Any]]) -> List[int]:
+    # COPY returns nothing, so the ids are drawn from the sequence first and written with the rows.
+    # The sequence query also opens the transaction COPY then runs in
+    result = await conn.execute(
+        text("SELECT nextval(pg_get_serial_sequence('processed_agent_data', 'id')) FROM generate_series(1, :count)"),
+        {"count": len(rows)},
+    )
+    ids = list(result.scalars())
+
+    # COPY bypasses the column types, so the Timestamp offset handling is repeated here
+    columns = list(rows[0])
+    records = [
+        (id, *(row[column].replace(tzinfo=None) if column == "timestamp" else row[column] for column in columns))
+        for id, row in zip(ids, rows)
+    ]
+    raw_connection = await conn.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        "processed_agent_data", records=records, columns=["id", *columns]
+    )
+    return ids
@@ -0,0 +1,302 @@
+"""
+Wire codecs for agent and processed agent data.
+Copied into agent, edge, hub and store from shared/codec.py by shared/sync.py, edit that file instead.
+
+A codec turns a list of records (plain dicts shaped like AgentData or
+ProcessedAgentData) into bytes and back. The codec is selected by name,
+"<format>[+<compression>]", e.g. "json", "msgpack+zlib", "json+gzip" or "struct+zstd".
+Over MQTT the name is the topic suffix, the bare topic carries legacy JSON.
+Agents publish every vehicle on its own topic, "<topic>/vehicles/<shard>/<user_id>[/<suffix>]",
+so each edge process subscribes to a fixed set of shards and sees all samples of its vehicles.
+Over HTTP it is negotiated by Content-Type and Content-Encoding headers.
+"""
+import gzip
+import json
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def _timestamp(value) -> float:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+class DecodeError(Exception):
+    """A payload could not be decoded, whatever format or compression error caused it"""
+
+
+class Codec(ABC):
+    name: str
+    content_type: str
+    content_encoding: Optional[str] = None
+
+    @abstractmethod
+    def encode(self, records: List[dict]) -> bytes:
+        pass
+
+    def decode(self, payload: bytes) -> List[dict]:
+        """Decode a payload into records, raises DecodeError for truncated or corrupt payloads"""
+        try:
+            records = self._decode(payload)
+        except DecodeError:
+            raise
+        except Exception as e:
+            raise DecodeError(f"Invalid {self.name} payload: {e}") from e
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise DecodeError(f"Invalid {self.name} payload: expected a record or a list of records")
+        return records
+
+    @abstractmethod
+    def _decode(self, payload: bytes) -> List[dict]:
+        pass
+
+
+class JsonCodec(Codec):
+    name = "json"
+    content_type = "application/json"
+
+    def encode(self, records: List[dict]) -> bytes:
+        # A single record is sent as an object to stay compatible with legacy consumers
+        data = records[0] if len(records) == 1 else records
+        return json.dumps(data, default=_default, separators=(",", ":")).encode("utf-8")
+
+    def _decode(self, payload: bytes) -> List[dict]:
+        data = json.loads(payload)
+        return [data] if isinstance(data, dict) else data
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    content_type = "application/msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ValueError("msgpack codec requires the msgpack package")
+
+    def encode(self, records: List[dict]) -> bytes:
+        return msgpack.packb(records, default=_default)
+
+    def _decode(self, payload: bytes) -> List[dict]:
+        data = msgpack.unpackb(payload)
+        return [data] if isinstance(data, dict) else data
+
+
+class StructCodec(Codec):
+    """
+    Fixed-layout little-endian records.
+    Header: record kind (2 agent data, 3 processed agent data) and record count.
+    Agent data: x, y, z, latitude, longitude, gps timestamp, timestamp as doubles, user id as a signed
+    64-bit integer (-1 for none) and the trace as an entry count byte followed by the entries,
+    each a name length byte, the UTF-8 name and the time as a double.
+    Processed agent data: road state code as a byte followed by agent data.
+    Kinds 0 and 1 are the same records without user id and trace, sent by older agents and edges.
+    Timestamps are Unix times and decode as UTC.
+    """
+    name = "struct"
+    content_type = "application/x-road-vision-struct"
+
+    HEADER = struct.Struct("<BI")
+    AGENT_DATA = struct.Struct("<7d")
+    PROCESSED_AGENT_DATA = struct.Struct("<B7d")
+    USER_ID = struct.Struct("<q")
+    TRACE_COUNT = struct.Struct("<B")
+    TRACE_TIME = struct.Struct("<d")
+    NO_USER_ID = -1
+    ROAD_STATES = ["Smooth", "Bumpy"]
+    LEGACY_KINDS = 2
+
+    def encode(self, records: List[dict]) -> bytes:
+        processed = "road_state" in records[0]
+        layout = self.PROCESSED_AGENT_DATA if processed else self.AGENT_DATA
+        buffer = bytearray(self.HEADER.pack(self.LEGACY_KINDS + int(processed), len(records)))
+
+        for record in records:
+            agent_data = record["agent_data"] if processed else record
+            values = (
+                agent_data["accelerometer"]["x"],
+                agent_data["accelerometer"]["y"],
+                agent_data["accelerometer"]["z"],
+                agent_data["gps"]["latitude"],
+                agent_data["gps"]["longitude"],
+                _timestamp(agent_data["gps"]["timestamp"]),
+                _timestamp(agent_data["timestamp"]),
+            )
+            if processed:
+                buffer += layout.pack(self.ROAD_STATES.index(record["road_state"]), *values)
+            else:
+                buffer += layout.pack(*values)
+            user_id = agent_data.get("user_id")
+            buffer += self.USER_ID.pack(self.NO_USER_ID if user_id is None else user_id)
+            trace = agent_data.get("trace") or {}
+            buffer += self.TRACE_COUNT.pack(len(trace))
+            for hop, sent in trace.items():
+                hop = hop.encode("utf-8")
+                buffer += self.TRACE_COUNT.pack(len(hop)) + hop + self.TRACE_TIME.pack(sent)
+        return bytes(buffer)
+
+    def _decode(self, payload: bytes) -> List[dict]:
+        kind, count = self.HEADER.unpack_from(payload, 0)
+        legacy = kind < self.LEGACY_KINDS
+        processed = kind % self.LEGACY_KINDS == 1
+        layout = self.PROCESSED_AGENT_DATA if processed else self.AGENT_DATA
+        if legacy and len(payload) != self.HEADER.size + layout.size * count:
+            raise ValueError(f"{count} records need {self.HEADER.size + layout.size * count} bytes, got {len(payload)}")
+
+        records = []
+        offset = self.HEADER.size
+        for _ in range(count):
+            values = layout.unpack_from(payload, offset)
+            offset += layout.size
+            if processed:
+                road_state, values = self.ROAD_STATES[values[0]], values[1:]
+            x, y, z, latitude, longitude, gps_timestamp, timestamp = values
+            agent_data = {
+                "accelerometer": {"x": x, "y": y, "z": z},
+                "gps": {
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "timestamp": datetime.fromtimestamp(gps_timestamp, tz=timezone.utc),
+                },
+                "timestamp": datetime.fromtimestamp(timestamp, tz=timezone.utc),
+            }
+            if not legacy:
+                agent_data["user_id"], agent_data["trace"], offset = self._decode_extras(payload, offset)
+            records.append({"road_state": road_state, "agent_data": agent_data} if processed else agent_data)
+        if offset != len(payload):
+            raise ValueError(f"{len(payload) - offset} bytes after {count} records")
+        return records
+
+    def _decode_extras(self, payload: bytes, offset: int) -> Tuple[Optional[int], Optional[dict], int]:
+        """Decode the user id and trace of a record, returns them and the offset of the next record"""
+        (user_id,) = self.USER_ID.unpack_from(payload, offset)
+        offset += self.USER_ID.size
+        (entries,) = self.TRACE_COUNT.unpack_from(payload, offset)
+        offset += self.TRACE_COUNT.size
+        trace = {}
+        for _ in range(entries):
+            (length,) = self.TRACE_COUNT.unpack_from(payload, offset)
+            offset += self.TRACE_COUNT.size
+            hop = payload[offset:offset + length].decode("utf-8")
+            offset += length
+            (trace[hop],) = self.TRACE_TIME.unpack_from(payload, offset)
+            offset += self.TRACE_TIME.size
+        return None if user_id == self.NO_USER_ID else user_id, trace or None, offset
+
+
+class CompressedCodec(Codec):
+    def __init__(self, codec: Codec, compression: str):
+        if compression == "zlib":
+            self.compress, self.decompress = zlib.compress, zlib.decompress
+            self.content_encoding = "deflate"
+        elif compression == "gzip":
+            self.compress, self.decompress = gzip.compress, gzip.decompress
+            self.content_encoding = "gzip"
+        elif compression == "zstd":
+            if zstandard is None:
+                raise ValueError("zstd compression requires the zstandard package")
+            self.compress = zstandard.ZstdCompressor().compress
+            self.decompress = zstandard.ZstdDecompressor().decompress
+            self.content_encoding = "zstd"
+        else:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.codec = codec
+        self.name = f"{codec.name}+{compression}"
+        self.content_type = codec.content_type
+
+    def encode(self, records: List[dict]) -> bytes:
+        return self.compress(self.codec.encode(records))
+
+    def _decode(self, payload: bytes) -> List[dict]:
+        return self.codec.decode(self.decompress(payload))
+
+
+CODECS = {
+    JsonCodec.name: JsonCodec,
+    MsgpackCodec.name: MsgpackCodec,
+    StructCodec.name: StructCodec,
+}
+COMPRESSIONS = {"deflate": "zlib", "gzip": "gzip", "zstd": "zstd"}
+
+
+def get_codec(name: str) -> Codec:
+    """Create a codec from its name, e.g. "msgpack+zlib"."""
+    codec_name, _, compression = name.partition("+")
+    if codec_name not in CODECS:
+        raise ValueError(f"Unknown codec: {codec_name}")
+    codec = CODECS[codec_name]()
+    return CompressedCodec(codec, compression) if compression else codec
+
+
+def topic_for(topic: str, codec: Codec) -> str:
+    """MQTT topic a codec publishes to, JSON keeps the bare legacy topic."""
+    return topic if codec.name == JsonCodec.name else f"{topic}/{codec.name}"
+
+
+def codec_for_topic(topic: str, base_topic: str) -> Codec:
+    """Codec of a message received on the base topic or one of its codec suffixes."""
+    suffix = topic[len(base_topic) + 1:] if topic != base_topic else JsonCodec.name
+    return get_codec(suffix)
+
+
+# Topic level of per-vehicle agent data, distinct from codec names and the batch and road_* suffixes
+VEHICLES = "vehicles"
+
+
+def vehicle_topic(topic: str, user_id: int, shards: int) -> str:
+    """Base topic of one vehicle's agent data, codec and batch suffixes are appended to it."""
+    return f"{topic}/{VEHICLES}/{user_id % shards}/{user_id}"
+
+
+def shard_subscription(topic: str, shard: Optional[int] = None) -> str:
+    """Subscription to every vehicle topic of a shard, or of all shards."""
+    return f"{topic}/{VEHICLES}/{'+' if shard is None else shard}/#"
+
+
+def parse_vehicle_topic(topic: str, base_topic: str) -> Optional[Tuple[int, str]]:
+    """
+    Split a per-vehicle topic into the user id and the equivalent shared topic,
+    e.g. "agent/vehicles/3/67/batch" into 67 and "agent/batch". None for other topics.
+    """
+    prefix = f"{base_topic}/{VEHICLES}/"
+    if not topic.startswith(prefix):
+        return None
+    _, _, rest = topic[len(prefix):].partition("/")
+    user_id, _, suffix = rest.partition("/")
+    return int(user_id), f"{base_topic}/{suffix}" if suffix else base_topic
+
+
+def codec_for_http(content_type: Optional[str], content_encoding: Optional[str] = None) -> Codec:
+    """Codec of an HTTP body with the given Content-Type and Content-Encoding headers."""
+    media_type = (content_type or JsonCodec.content_type).split(";")[0].strip()
+    for codec_class in CODECS.values():
+        if codec_class.content_type == media_type:
+            codec = codec_class()
+            break
+    else:
+        raise ValueError(f"Unsupported content type: {media_type}")
+
+    if content_encoding and content_encoding != "identity":
+        if content_encoding not in COMPRESSIONS:
+            raise ValueError(f"Unsupported content encoding: {content_encoding}")
+        codec = CompressedCodec(codec, COMPRESSIONS[content_encoding])
+    return codec
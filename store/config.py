@@ -12,3 +12,47 @@ POSTGRES_PORT = try_parse(int, os.environ.get("POSTGRES_PORT")) or 5432
 POSTGRES_USER = os.environ.get("POSTGRES_USER") or "user"
 POSTGRES_PASSWORD = os.environ.get("POSTGRES_PASS") or "pass"
 POSTGRES_DB = os.environ.get("POSTGRES_DB") or "test_db"
+
+# Configuration for the database connection, DATABASE_URL overrides the POSTGRES settings,
+# e.g. sqlite+aiosqlite:///:memory: as a stand-in for tests
+DATABASE_URL = (
+    os.environ.get("DATABASE_URL")
+    or f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+)
+DATABASE_ECHO = (os.environ.get("DATABASE_ECHO") or "false").lower() == "true"
+
+# Configuration for the connection pool, up to DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW connections
+DATABASE_POOL_SIZE = try_parse(int, os.environ.get("DATABASE_POOL_SIZE")) or 10
+DATABASE_MAX_OVERFLOW = try_parse(int, os.environ.get("DATABASE_MAX_OVERFLOW")) or 20
+DATABASE_POOL_TIMEOUT = try_parse(float, os.environ.get("DATABASE_POOL_TIMEOUT")) or 30
+DATABASE_POOL_RECYCLE = try_parse(int, os.environ.get("DATABASE_POOL_RECYCLE")) or 1800
+DATABASE_POOL_PRE_PING = (os.environ.get("DATABASE_POOL_PRE_PING") or "true").lower() == "true"
+
+# Configuration for statement caching, prepared statements per connection and compiled SQL per engine
+DATABASE_STATEMENT_CACHE_SIZE = try_parse(int, os.environ.get("DATABASE_STATEMENT_CACHE_SIZE")) or 256
+DATABASE_QUERY_CACHE_SIZE = try_parse(int, os.environ.get("DATABASE_QUERY_CACHE_SIZE")) or 500
+
+# Configuration for bulk inserts, batches of at least BULK_COPY_THRESHOLD rows are written with COPY
+BULK_COPY_THRESHOLD = try_parse(int, os.environ.get("BULK_COPY_THRESHOLD")) or 1000
+
+# Configuration for listing processed agent data, pages of up to PAGE_MAX_SIZE rows,
+# NDJSON exports fetch STREAM_BATCH_SIZE rows at a time from a server-side cursor
+PAGE_SIZE = try_parse(int, os.environ.get("PAGE_SIZE")) or 1000
+PAGE_MAX_SIZE = try_parse(int, os.environ.get("PAGE_MAX_SIZE")) or 10000
+STREAM_BATCH_SIZE = try_parse(int, os.environ.get("STREAM_BATCH_SIZE")) or 1000
+
+# Configuration for spatial queries, GRID_CELL_SIZE in degrees of the indexed grid cells
+# (changing it requires recomputing grid_cell of stored rows), bounding boxes spanning more
+# than SPATIAL_MAX_RANGES rows of cells are read as one index range, nearest-K searches stop
+# widening at NEAREST_MAX_RADIUS meters
+GRID_CELL_SIZE = try_parse(float, os.environ.get("GRID_CELL_SIZE")) or 0.01
+SPATIAL_MAX_RANGES = try_parse(int, os.environ.get("SPATIAL_MAX_RANGES")) or 64
+NEAREST_MAX_K = try_parse(int, os.environ.get("NEAREST_MAX_K")) or 1000
+NEAREST_MAX_RADIUS = try_parse(float, os.environ.get("NEAREST_MAX_RADIUS")) or 50000
+
+# Configuration for rollups, per-minute/hour/day sums kept in step with every insert, update and delete.
+# Queries use the coarsest bucket that still splits the requested range into ROLLUP_MIN_BUCKETS buckets,
+# with 24 a day is read in hours and a month in days. Rows stored before rollups existed or while they were
+# turned off are added when the store starts with ROLLUPS on
+ROLLUPS = (os.environ.get("ROLLUPS") or "true").lower() == "true"
+ROLLUP_MIN_BUCKETS = try_parse(int, os.environ.get("ROLLUP_MIN_BUCKETS")) or 24
@@ -1,10 +1,53 @@
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Float, DateTime
-from config import POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB
+from sqlalchemy import MetaData, Table, Column, Index, Integer, BigInteger, String, Float, DateTime, TypeDecorator
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import StaticPool
+from config import (
+    DATABASE_URL,
+    DATABASE_ECHO,
+    DATABASE_POOL_SIZE,
+    DATABASE_MAX_OVERFLOW,
+    DATABASE_POOL_TIMEOUT,
+    DATABASE_POOL_RECYCLE,
+    DATABASE_POOL_PRE_PING,
+    DATABASE_STATEMENT_CACHE_SIZE,
+    DATABASE_QUERY_CACHE_SIZE,
+)
+
+
+def create_engine(url: str) -> AsyncEngine:
+    if url.startswith("sqlite"):
+        # SQLite stand-in for tests, an in-memory database lives only as long as its one connection
+        if ":memory:" in url:
+            return create_async_engine(url, echo=DATABASE_ECHO, poolclass=StaticPool)
+        return create_async_engine(url, echo=DATABASE_ECHO)
+    return create_async_engine(
+        url,
+        echo=DATABASE_ECHO,
+        pool_size=DATABASE_POOL_SIZE,
+        max_overflow=DATABASE_MAX_OVERFLOW,
+        pool_timeout=DATABASE_POOL_TIMEOUT,
+        pool_recycle=DATABASE_POOL_RECYCLE,
+        pool_pre_ping=DATABASE_POOL_PRE_PING,
+        query_cache_size=DATABASE_QUERY_CACHE_SIZE,
+        connect_args={"prepared_statement_cache_size": DATABASE_STATEMENT_CACHE_SIZE},
+    )
+
+
+class Timestamp(TypeDecorator):
+    """
+    DateTime without time zone. Offsets are dropped and the wall-clock time kept,
+    as PostgreSQL does for timestamp literals, asyncpg would reject aware datetimes.
+    """
+
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return value.replace(tzinfo=None) if value is not None and value.tzinfo else value
 
 
 # SQLAlchemy setup
-DATABASE_URL =f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_engine(DATABASE_URL)
 metadata = MetaData()
 
 # Define the ProcessedAgentData table
@@ -18,9 +61,93 @@ processed_agent_data = Table(
     Column("z", Float),
     Column("latitude", Float),
     Column("longitude", Float),
-    Column("timestamp", DateTime),
+    Column("timestamp", Timestamp),
+    # Spatial queries, see spatial.grid_cell
+    Column("grid_cell", BigInteger, index=True),
+    # Keyset pagination in timestamp order
+    Index("ix_processed_agent_data_timestamp_id", "timestamp", "id"),
+)
+
+# Columns of a processed agent data record as the API returns it
+processed_agent_data_columns = [
+    processed_agent_data.c[name] for name in ["id", "road_state", "x", "y", "z", "latitude", "longitude", "timestamp"]
+]
+
+# Define the RoadEvent table, road defects clustered by the edge
+road_events = Table(
+    "road_events",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("latitude", Float),
+    Column("longitude", Float),
+    Column("start_timestamp", Timestamp),
+    Column("end_timestamp", Timestamp),
+    Column("hit_count", Integer),
+    Column("severity", Float),
+)
+
+# Define the RoadSummary table, periodic sample counts from the edge
+road_summaries = Table(
+    "road_summaries",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("start_timestamp", Timestamp),
+    Column("end_timestamp", Timestamp),
+    Column("smooth_count", Integer),
+    Column("bumpy_count", Integer),
+    Column("event_count", Integer),
+)
+
+# Define the RoadSegment table, runs of equal road state compressed by the edge
+road_segments = Table(
+    "road_segments",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("road_state", String),
+    Column("start_timestamp", Timestamp),
+    Column("end_timestamp", Timestamp),
+    Column("start_latitude", Float),
+    Column("start_longitude", Float),
+    Column("end_latitude", Float),
+    Column("end_longitude", Float),
+    Column("sample_count", Integer),
+    Column("min_z", Float),
+    Column("max_z", Float),
+    Column("mean_z", Float),
+)
+
+
+
+def rollup_table(name: str) -> Table:
+    # Processed agent data summed per time bucket, grid cell and road state, see rollups.py
+    return Table(
+        name,
+        metadata,
+        Column("bucket_start", Timestamp, primary_key=True),
+        Column("grid_cell", BigInteger, primary_key=True),
+        Column("road_state", String, primary_key=True),
+        Column("sample_count", Integer),
+        Column("min_z", Float),
+        Column("max_z", Float),
+        Column("sum_z", Float),
+    )
+
+
+# Define the rollup tables, one per bucket size
+road_rollups_minute = rollup_table("road_rollups_minute")
+road_rollups_hour = rollup_table("road_rollups_hour")
+road_rollups_day = rollup_table("road_rollups_day")
+
+# Holds one row while the rollups cover every stored row, see rollups.backfill_rollups
+rollup_state = Table(
+    "rollup_state",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("backfilled_at", Timestamp),
 )
 
-# Create the table
-metadata.create_all(engine)
+
+async def create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
 
@@ -1,13 +1,73 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from models import ProcessedAgentData, ProcessedAgentDataInDB
-from db import engine, processed_agent_data
-from typing import List, Set
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import TypeAdapter
+from models import (
+    ProcessedAgentData,
+    ProcessedAgentDataInDB,
+    ProcessedAgentDataNearby,
+    RoadEvent,
+    RoadEventInDB,
+    RoadSummary,
+    RoadSummaryInDB,
+    RoadSegment,
+    RoadSegmentInDB,
+    RoadRollups,
+)
+from bulk_insert import insert_processed_agent_data
+from config import (
+    BULK_COPY_THRESHOLD,
+    PAGE_SIZE,
+    PAGE_MAX_SIZE,
+    STREAM_BATCH_SIZE,
+    NEAREST_MAX_K,
+    NEAREST_MAX_RADIUS,
+    GRID_CELL_SIZE,
+    ROLLUPS,
+)
+from db import create_tables, engine, processed_agent_data, road_events, road_summaries, road_segments
+from codec import DecodeError, codec_for_http
+from metrics import metrics
+from rollups import (
+    backfill_rollups,
+    invalidate_rollups,
+    pick_resolution,
+    remove_rollups,
+    rollup_query,
+    update_rollups,
+)
+from pagination import decode_cursor, encode_cursor, page_query, to_json_row
+from spatial import (
+    METERS_PER_DEGREE,
+    bbox_around,
+    bbox_query,
+    box_ranges,
+    cell_box,
+    grid_cell,
+    nearest_query,
+    radius_query,
+)
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Literal, Optional, Set
+import asyncio
 import json
 import logging
 
 
+# Tables are created at startup, the pooled connections closed at shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await create_tables()
+    async with engine.begin() as conn:
+        await (backfill_rollups(conn) if ROLLUPS else invalidate_rollups(conn))
+    yield
+    await engine.dispose()
+
+
 # FastAPI app setup
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+processed_agent_data_list = TypeAdapter(List[ProcessedAgentData])
 
 # WebSocket subscriptions
 subscriptions: Set[WebSocket] = set()
@@ -22,83 +82,178 @@ async def websocket_endpoint(websocket: WebSocket):
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
-        subscriptions.remove(websocket)
+        subscriptions.discard(websocket)
 
 
-# Function to send data to subscribed users
+# Function to send data to subscribed users, one message per batch encoded once for all of them
 async def send_data_to_subscribers(data):
-    for websocket in subscriptions:
-        await websocket.send_json(json.dumps(data))
+    if not subscriptions or not data:
+        return
+    message = json.dumps(data)
+    websockets = list(subscriptions)
+    results = await asyncio.gather(
+        *(websocket.send_text(message) for websocket in websockets), return_exceptions=True
+    )
+    for websocket, result in zip(websockets, results):
+        if isinstance(result, Exception):
+            subscriptions.discard(websocket)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    return metrics.render("store")
 
 
 # FastAPI CRUDL endpoints
 @app.post("/processed_agent_data/", response_model=List[ProcessedAgentDataInDB])
-async def create_processed_agent_data(data: List[ProcessedAgentData]):
-    conn = engine.connect()
-    return_data = []
-    for item in data:
-        stmt = processed_agent_data.insert().values(
-            road_state=item.road_state,
-            x=item.agent_data.accelerometer.x,
-            y=item.agent_data.accelerometer.y,
-            z=item.agent_data.accelerometer.z,
-            latitude=item.agent_data.gps.latitude,
-            longitude=item.agent_data.gps.longitude,
-            timestamp=item.agent_data.timestamp
-        )
+async def create_processed_agent_data(request: Request):
+    # The body codec is negotiated by Content-Type and Content-Encoding headers
+    try:
+        with metrics.timer("decode"):
+            codec = codec_for_http(request.headers.get("content-type"), request.headers.get("content-encoding"))
+            data = processed_agent_data_list.validate_python(codec.decode(await request.body()))
+    except (DecodeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    metrics.observe_hops(
+        [item.agent_data.trace for item in data],
+        {"agent": "end_to_end", "edge": "edge_to_store", "hub": "hub_to_store"},
+    )
 
-        result = conn.execute(stmt)
-        conn.commit()
-        returned_id = result.inserted_primary_key[0]
-
-        returned_item = ProcessedAgentDataInDB(
-            id=returned_id,
-            road_state=item.road_state,
-            x=item.agent_data.accelerometer.x,
-            y=item.agent_data.accelerometer.y,
-            z=item.agent_data.accelerometer.z,
-            latitude=item.agent_data.gps.latitude,
-            longitude=item.agent_data.gps.longitude,
-            timestamp=item.agent_data.timestamp
-        )
+    # One transaction per batch, a failed batch leaves nothing behind for the hub to retry
+    with metrics.timer("insert"):
+        async with engine.begin() as conn:
+            return_data = await insert_processed_agent_data(conn, data, BULK_COPY_THRESHOLD)
+            if ROLLUPS:
+                with metrics.timer("rollup_update"):
+                    await update_rollups(conn, return_data)
 
-        return_data.append(returned_item)
-        await send_data_to_subscribers(returned_item.model_dump())
+    with metrics.timer("websocket"):
+        await send_data_to_subscribers([item.model_dump(mode="json") for item in return_data])
 
-    conn.close()
+    metrics.count("records_inserted", len(return_data))
     logging.info("Data created successfully")
     return return_data
 
 
 @app.get("/processed_agent_data/", response_model=List[ProcessedAgentDataInDB])
-def list_processed_agent_data():
-    conn = engine.connect()
-    stmt = processed_agent_data.select()
-    result = conn.execute(stmt)
-
-    return_data = []
-    for item in result:
-        return_data.append(ProcessedAgentDataInDB(
-            id=item.id,
-            road_state=item.road_state,
-            x=item.x,
-            y=item.y,
-            z=item.z,
-            latitude=item.latitude,
-            longitude=item.longitude,
-            timestamp=item.timestamp
-        ))
-    conn.close()
+async def list_processed_agent_data(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    order: Literal["id", "timestamp"] = "id",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    road_state: Optional[str] = None,
+    format: Optional[Literal["json", "ndjson"]] = None,
+):
+    # Pages of `limit` rows after `cursor`, the next cursor is in the X-Next-Cursor header.
+    # Without `limit` and `cursor` every matching row is streamed as one JSON array, as before paging.
+    # NDJSON, by `format` or the Accept header, streams every matching row unless `limit` is given
+    try:
+        after = decode_cursor(order, cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "ndjson" or (format is None and "application/x-ndjson" in request.headers.get("accept", "")):
+        stmt = page_query(order, after, start, end, road_state, limit)
+        return StreamingResponse(stream_processed_agent_data(stmt), media_type="application/x-ndjson")
+
+    if limit is None and cursor is None:
+        stmt = page_query(order, None, start, end, road_state)
+        return StreamingResponse(stream_processed_agent_data_array(stmt), media_type="application/json")
+
+    limit = limit or PAGE_SIZE
+    async with engine.connect() as conn:
+        # One row past the page tells whether there is a next one
+        result = await conn.execute(page_query(order, after, start, end, road_state, limit + 1))
+        rows = result.all()
+
+    headers = {"X-Next-Cursor": encode_cursor(order, rows[limit - 1])} if len(rows) > limit else {}
+    # Rows are already in the response shape, skip validating them again
+    return JSONResponse([to_json_row(row) for row in rows[:limit]], headers=headers)
 
-    return return_data
+
+async def stream_processed_agent_data(stmt):
+    async with engine.connect() as conn:
+        result = await conn.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield "".join(json.dumps(to_json_row(row)) + "\n" for row in rows).encode("utf-8")
+
+
+async def stream_processed_agent_data_array(stmt):
+    """Stream selected rows as one JSON array from a server-side cursor"""
+    separator = "["
+    async with engine.connect() as conn:
+        result = await conn.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield (separator + ",".join(json.dumps(to_json_row(row)) for row in rows)).encode("utf-8")
+            separator = ","
+    yield b"]" if separator == "," else b"[]"
+
+
+@app.get("/processed_agent_data/bbox/", response_model=List[ProcessedAgentDataInDB])
+async def list_processed_agent_data_in_bbox(
+    min_latitude: float = Query(..., ge=-90, le=90),
+    min_longitude: float = Query(..., ge=-180, le=180),
+    max_latitude: float = Query(..., ge=-90, le=90),
+    max_longitude: float = Query(..., ge=-180, le=180),
+    limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_MAX_SIZE),
+):
+    if min_latitude > max_latitude or min_longitude > max_longitude:
+        raise HTTPException(status_code=400, detail="Bounding box minimum exceeds its maximum")
+    stmt = bbox_query(min_latitude, min_longitude, max_latitude, max_longitude)
+    async with engine.connect() as conn:
+        result = await conn.execute(stmt.order_by(processed_agent_data.c.id).limit(limit))
+        return JSONResponse([to_json_row(row) for row in result])
+
+
+@app.get("/processed_agent_data/radius/", response_model=List[ProcessedAgentDataNearby])
+async def list_processed_agent_data_in_radius(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    radius: float = Query(..., gt=0, le=NEAREST_MAX_RADIUS),
+    limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_MAX_SIZE),
+):
+    # Candidates come from the bounding box of the circle, the database orders them by distance and cuts the page
+    async with engine.connect() as conn:
+        result = await conn.execute(radius_query(latitude, longitude, radius, limit))
+        return JSONResponse([to_json_row(row) for row in result])
+
+
+@app.get("/processed_agent_data/nearest/", response_model=List[ProcessedAgentDataNearby])
+async def list_nearest_processed_agent_data(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=NEAREST_MAX_K),
+):
+    # The search circle starts at one grid cell and doubles until it holds `k` rows, every step reads
+    # the `k` nearest rows of the cells of its bounding box that were not read in full before.
+    # Once `k` rows are known the circle through the farthest one holds the answer, one more step reads it.
+    radius = GRID_CELL_SIZE * METERS_PER_DEGREE
+    nearest = []
+    scanned = None
+    async with engine.connect() as conn:
+        while True:
+            box = cell_box(*bbox_around(latitude, longitude, radius))
+            ranges = box_ranges(box, scanned)
+            rows = (await conn.execute(nearest_query(latitude, longitude, ranges, k))).all() if ranges else []
+            # A collapsed wide range may read cells again, rows are merged by id
+            merged = {row.id: row for row in nearest + rows}
+            nearest = sorted(merged.values(), key=lambda row: (row.distance, row.id))[:k]
+            if len(nearest) >= k and nearest[-1].distance <= radius or radius >= NEAREST_MAX_RADIUS:
+                return JSONResponse([to_json_row(row) for row in nearest if row.distance <= radius])
+            if len(rows) < k:
+                # Every row of the box is known now
+                scanned = box
+            radius = min(nearest[-1].distance if len(nearest) >= k else radius * 2, NEAREST_MAX_RADIUS)
 
 
 @app.get("/processed_agent_data/{processed_agent_data_id}", response_model=ProcessedAgentDataInDB)
-def read_processed_agent_data(processed_agent_data_id: int):
-    conn = engine.connect()
-    stmt = processed_agent_data.select().where(processed_agent_data.c.id == processed_agent_data_id)
-    result = conn.execute(stmt)
-    item = result.first()
+async def read_processed_agent_data(processed_agent_data_id: int):
+    async with engine.connect() as conn:
+        stmt = processed_agent_data.select().where(processed_agent_data.c.id == processed_agent_data_id)
+        result = await conn.execute(stmt)
+        item = result.first()
     return_data = ProcessedAgentDataInDB(
         id=item.id,
         road_state=item.road_state,
@@ -109,14 +264,12 @@ def read_processed_agent_data(processed_agent_data_id: int):
         longitude=item.longitude,
         timestamp=item.timestamp
     )
-    conn.close()
 
     return return_data
 
 
 @app.put("/processed_agent_data/{processed_agent_data_id}", response_model=ProcessedAgentDataInDB)
-def update_processed_agent_data(processed_agent_data_id: int, data: ProcessedAgentData):
-    conn = engine.connect()
+async def update_processed_agent_data(processed_agent_data_id: int, data: ProcessedAgentData):
     stmt = processed_agent_data.update().where(processed_agent_data.c.id == processed_agent_data_id).values(
         road_state=data.road_state,
         x=data.agent_data.accelerometer.x,
@@ -124,13 +277,10 @@ def update_processed_agent_data(processed_agent_data_id: int, data: ProcessedAge
         z=data.agent_data.accelerometer.z,
         latitude=data.agent_data.gps.latitude,
         longitude=data.agent_data.gps.longitude,
-        timestamp=data.agent_data.timestamp
+        timestamp=data.agent_data.timestamp,
+        grid_cell=grid_cell(data.agent_data.gps.latitude, data.agent_data.gps.longitude),
     )
 
-    result = conn.execute(stmt)
-    conn.commit()
-    conn.close()
-
     return_data = ProcessedAgentDataInDB(
         id=processed_agent_data_id,
         road_state=data.road_state,
@@ -142,21 +292,137 @@ def update_processed_agent_data(processed_agent_data_id: int, data: ProcessedAge
         timestamp=data.agent_data.timestamp
     )
 
+    # The rollups move the old row out and the new one in on the transaction that updates it
+    async with engine.begin() as conn:
+        old_data = await lock_processed_agent_data(conn, processed_agent_data_id)
+        await conn.execute(stmt)
+        if ROLLUPS:
+            await remove_rollups(conn, [old_data])
+            await update_rollups(conn, [return_data])
+
     return return_data
 
 
 @app.delete("/processed_agent_data/{processed_agent_data_id}", response_model=ProcessedAgentDataInDB)
-def delete_processed_agent_data(processed_agent_data_id: int):
-    conn = engine.connect()
-    return_data = read_processed_agent_data(processed_agent_data_id)
+async def delete_processed_agent_data(processed_agent_data_id: int):
     stmt = processed_agent_data.delete().where(processed_agent_data.c.id == processed_agent_data_id)
-    result = conn.execute(stmt)
-    conn.commit()
-    conn.close()
-    
+    async with engine.begin() as conn:
+        return_data = await lock_processed_agent_data(conn, processed_agent_data_id)
+        await conn.execute(stmt)
+        if ROLLUPS:
+            await remove_rollups(conn, [return_data])
+
     return return_data
 
 
+async def lock_processed_agent_data(conn, processed_agent_data_id: int) -> ProcessedAgentDataInDB:
+    """Read a row for a change on the same transaction, so concurrent changes see it and its rollups consistently"""
+    stmt = processed_agent_data.select().where(processed_agent_data.c.id == processed_agent_data_id).with_for_update()
+    item = (await conn.execute(stmt)).first()
+    if item is None:
+        raise HTTPException(status_code=404, detail="Processed agent data not found")
+    return ProcessedAgentDataInDB(
+        id=item.id,
+        road_state=item.road_state,
+        x=item.x,
+        y=item.y,
+        z=item.z,
+        latitude=item.latitude,
+        longitude=item.longitude,
+        timestamp=item.timestamp
+    )
+
+
+@app.post("/road_events/", response_model=List[RoadEventInDB])
+async def create_road_events(data: List[RoadEvent]):
+    if not data:
+        return []
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            road_events.insert().returning(road_events.c.id),
+            [item.model_dump() for item in data],
+        )
+        ids = result.scalars().all()
+    return [RoadEventInDB(id=returned_id, **item.model_dump()) for returned_id, item in zip(ids, data)]
+
+
+@app.get("/road_events/", response_model=List[RoadEventInDB])
+async def list_road_events():
+    async with engine.connect() as conn:
+        result = await conn.execute(road_events.select().order_by(road_events.c.id))
+        return [RoadEventInDB(**item._mapping) for item in result]
+
+
+@app.post("/road_summaries/", response_model=List[RoadSummaryInDB])
+async def create_road_summaries(data: List[RoadSummary]):
+    if not data:
+        return []
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            road_summaries.insert().returning(road_summaries.c.id),
+            [item.model_dump() for item in data],
+        )
+        ids = result.scalars().all()
+    return [RoadSummaryInDB(id=returned_id, **item.model_dump()) for returned_id, item in zip(ids, data)]
+
+
+@app.get("/road_summaries/", response_model=List[RoadSummaryInDB])
+async def list_road_summaries():
+    async with engine.connect() as conn:
+        result = await conn.execute(road_summaries.select().order_by(road_summaries.c.id))
+        return [RoadSummaryInDB(**item._mapping) for item in result]
+
+
+@app.post("/road_segments/", response_model=List[RoadSegmentInDB])
+async def create_road_segments(data: List[RoadSegment]):
+    if not data:
+        return []
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            road_segments.insert().returning(road_segments.c.id),
+            [item.model_dump() for item in data],
+        )
+        ids = result.scalars().all()
+    return [RoadSegmentInDB(id=returned_id, **item.model_dump()) for returned_id, item in zip(ids, data)]
+
+
+@app.get("/road_segments/", response_model=List[RoadSegmentInDB])
+async def list_road_segments():
+    async with engine.connect() as conn:
+        result = await conn.execute(road_segments.select().order_by(road_segments.c.id))
+        return [RoadSegmentInDB(**item._mapping) for item in result]
+
+
+
+@app.get("/road_rollups/", response_model=RoadRollups)
+async def list_road_rollups(
+    start: datetime,
+    end: datetime,
+    resolution: Optional[Literal["minute", "hour", "day"]] = None,
+    road_state: Optional[str] = None,
+    min_latitude: Optional[float] = Query(None, ge=-90, le=90),
+    min_longitude: Optional[float] = Query(None, ge=-180, le=180),
+    max_latitude: Optional[float] = Query(None, ge=-90, le=90),
+    max_longitude: Optional[float] = Query(None, ge=-180, le=180),
+):
+    # Offsets are dropped as for stored timestamps, see db.Timestamp
+    start, end = start.replace(tzinfo=None), end.replace(tzinfo=None)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="Range start must be before its end")
+    bbox = (min_latitude, min_longitude, max_latitude, max_longitude)
+    if any(value is None for value in bbox):
+        if any(value is not None for value in bbox):
+            raise HTTPException(status_code=400, detail="Bounding box needs all four bounds")
+        bbox = None
+    elif min_latitude > max_latitude or min_longitude > max_longitude:
+        raise HTTPException(status_code=400, detail="Bounding box minimum exceeds its maximum")
+
+    resolution = resolution or pick_resolution(start, end)
+    async with engine.connect() as conn:
+        result = await conn.execute(rollup_query(resolution, start, end, road_state, bbox))
+        return RoadRollups(resolution=resolution, buckets=[dict(row._mapping) for row in result])
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, field_validator, Field
 from datetime import datetime
+from typing import Dict, List, Optional
 
 
 # FastAPI models
@@ -19,6 +20,8 @@ class AgentData(BaseModel):
     accelerometer: AccelerometerData
     gps: GpsData
     timestamp: datetime
+    # Unix time each hop sent the record, see metrics.py
+    trace: Optional[Dict[str, float]] = None
 
     @classmethod
     @field_validator('timestamp', mode='before')
@@ -45,3 +48,65 @@ class ProcessedAgentDataInDB(BaseModel):
     latitude: float
     longitude: float
     timestamp: datetime
+
+
+class ProcessedAgentDataNearby(ProcessedAgentDataInDB):
+    # Meters from the queried point
+    distance: float
+
+
+class RoadEvent(BaseModel):
+    latitude: float
+    longitude: float
+    start_timestamp: datetime
+    end_timestamp: datetime
+    hit_count: int
+    severity: float
+
+
+class RoadEventInDB(RoadEvent):
+    id: int
+
+
+class RoadSummary(BaseModel):
+    start_timestamp: datetime
+    end_timestamp: datetime
+    smooth_count: int
+    bumpy_count: int
+    event_count: int
+
+
+class RoadSummaryInDB(RoadSummary):
+    id: int
+
+
+class RoadSegment(BaseModel):
+    road_state: str
+    start_timestamp: datetime
+    end_timestamp: datetime
+    start_latitude: float
+    start_longitude: float
+    end_latitude: float
+    end_longitude: float
+    sample_count: int
+    min_z: float
+    max_z: float
+    mean_z: float
+
+
+class RoadSegmentInDB(RoadSegment):
+    id: int
+
+
+class RoadRollup(BaseModel):
+    bucket_start: datetime
+    road_state: str
+    sample_count: int
+    min_z: float
+    max_z: float
+    mean_z: float
+
+
+class RoadRollups(BaseModel):
+    resolution: str
+    buckets: List[RoadRollup]
@@ -0,0 +1,76 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import Select, literal, select, tuple_
+
+from db import processed_agent_data, processed_agent_data_columns
+
+# Keyset orders of the processed agent data list, each ends with the id to break ties
+ORDERS = {
+    "id": [processed_agent_data.c.id],
+    "timestamp": [processed_agent_data.c.timestamp, processed_agent_data.c.id],
+}
+
+
+def encode_cursor(order: str, row) -> str:
+    """Opaque cursor pointing after `row` in `order`"""
+    values = [row.timestamp.isoformat(), row.id] if order == "timestamp" else [row.id]
+    return base64.urlsafe_b64encode(json.dumps([order, *values]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(order: str, cursor: str) -> Tuple[Any, ...]:
+    """Keyset values of a cursor, raises ValueError for a malformed cursor or one from another order"""
+    try:
+        cursor_order, *values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if cursor_order != order or len(values) != len(ORDERS[order]):
+            raise ValueError
+        if order == "timestamp":
+            return datetime.fromisoformat(values[0]), int(values[1])
+        return (int(values[0]),)
+    except Exception:
+        raise ValueError(f"Invalid cursor for order {order}")
+
+
+def page_query(
+    order: str,
+    after: Optional[Tuple[Any, ...]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    road_state: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Select:
+    """
+    Select processed agent data in keyset order.
+    Parameters:
+        order (str): "id" or "timestamp".
+        after (Tuple): Keyset values of the last row already seen, see `decode_cursor`.
+        start (datetime): Inclusive lower bound of the timestamp.
+        end (datetime): Exclusive upper bound of the timestamp.
+        road_state (str): Only rows with this road state.
+        limit (int): Maximum number of rows, all by default.
+    Returns:
+        Select: The query, served by the primary key or the (timestamp, id) index.
+    """
+    keys = ORDERS[order]
+    stmt = select(*processed_agent_data_columns)
+    if after is not None:
+        values = [literal(value, key.type) for key, value in zip(keys, after)]
+        stmt = stmt.where(tuple_(*keys) > tuple_(*values) if len(keys) > 1 else keys[0] > values[0])
+    if start is not None:
+        stmt = stmt.where(processed_agent_data.c.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(processed_agent_data.c.timestamp < end)
+    if road_state is not None:
+        stmt = stmt.where(processed_agent_data.c.road_state == road_state)
+    stmt = stmt.order_by(*keys)
+    return stmt.limit(limit) if limit is not None else stmt
+
+
+def to_json_row(row) -> Dict[str, Any]:
+    """A selected row as JSON-ready values, the shape of ProcessedAgentDataInDB"""
+    item = dict(row._mapping)
+    if item["timestamp"] is not None:
+        item["timestamp"] = item["timestamp"].isoformat()
+    return item
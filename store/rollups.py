@@ -0,0 +1,234 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Select, Table, bindparam, case, delete, func, or_, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from config import ROLLUP_MIN_BUCKETS, STREAM_BATCH_SIZE
+from db import processed_agent_data, road_rollups_day, road_rollups_hour, road_rollups_minute, rollup_state
+from models import ProcessedAgentDataInDB
+from spatial import cell_ranges, grid_cell
+
+# Bucket sizes from the coarsest to the finest, with their tables
+RESOLUTIONS = {
+    "day": (road_rollups_day, timedelta(days=1)),
+    "hour": (road_rollups_hour, timedelta(hours=1)),
+    "minute": (road_rollups_minute, timedelta(minutes=1)),
+}
+
+
+def bucket_start(timestamp: datetime, resolution: str) -> datetime:
+    """Start of the bucket holding `timestamp`, offsets are dropped as the Timestamp column does"""
+    timestamp = timestamp.replace(tzinfo=None, second=0, microsecond=0)
+    if resolution == "minute":
+        return timestamp
+    if resolution == "hour":
+        return timestamp.replace(minute=0)
+    return timestamp.replace(hour=0, minute=0)
+
+
+def _upsert(conn: AsyncConnection, table: Table):
+    insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.bucket_start, table.c.grid_cell, table.c.road_state],
+        set_={
+            "sample_count": table.c.sample_count + stmt.excluded.sample_count,
+            "min_z": case((stmt.excluded.min_z < table.c.min_z, stmt.excluded.min_z), else_=table.c.min_z),
+            "max_z": case((stmt.excluded.max_z > table.c.max_z, stmt.excluded.max_z), else_=table.c.max_z),
+            "sum_z": table.c.sum_z + stmt.excluded.sum_z,
+        },
+    )
+
+
+def _sums(data: List[ProcessedAgentDataInDB], cells: List[int], resolution: str) -> dict:
+    """Sample count, min, max and sum of z per bucket start, grid cell and road state"""
+    sums = {}
+    for item, cell in zip(data, cells):
+        key = (bucket_start(item.timestamp, resolution), cell, item.road_state)
+        bucket = sums.get(key)
+        if bucket is None:
+            sums[key] = [1, item.z, item.z, item.z]
+        else:
+            bucket[0] += 1
+            bucket[1] = min(bucket[1], item.z)
+            bucket[2] = max(bucket[2], item.z)
+            bucket[3] += item.z
+    return sums
+
+
+async def update_rollups(conn: AsyncConnection, data: List[ProcessedAgentDataInDB]):
+    """
+    Add inserted records to the rollups on the transaction that inserted them.
+    Records are summed per bucket first, so a batch costs one upsert per bucket, cell and road state.
+    """
+    if not data:
+        return
+    cells = [grid_cell(item.latitude, item.longitude) for item in data]
+    for resolution, (table, _) in RESOLUTIONS.items():
+        sums = _sums(data, cells, resolution)
+        # Upserting in key order keeps concurrent batches from deadlocking on each other's rows
+        await conn.execute(_upsert(conn, table), [
+            {
+                "bucket_start": key[0],
+                "grid_cell": key[1],
+                "road_state": key[2],
+                "sample_count": count,
+                "min_z": min_z,
+                "max_z": max_z,
+                "sum_z": sum_z,
+            }
+            for key, (count, min_z, max_z, sum_z) in sorted(sums.items())
+        ])
+
+
+def _bucket_z(table: Table, aggregate):
+    """Aggregate of z over the processed agent data in a rollup bucket"""
+    return select(aggregate(processed_agent_data.c.z)).where(
+        processed_agent_data.c.grid_cell == table.c.grid_cell,
+        processed_agent_data.c.road_state == table.c.road_state,
+        processed_agent_data.c.timestamp >= bindparam("b_bucket_start"),
+        processed_agent_data.c.timestamp < bindparam("b_bucket_end"),
+    ).scalar_subquery()
+
+
+def _subtract(table: Table):
+    # Bind parameter names must differ from column names in an UPDATE
+    return update(table).where(
+        table.c.bucket_start == bindparam("b_bucket_start"),
+        table.c.grid_cell == bindparam("b_grid_cell"),
+        table.c.road_state == bindparam("b_road_state"),
+    ).values(
+        sample_count=table.c.sample_count - bindparam("b_sample_count"),
+        sum_z=table.c.sum_z - bindparam("b_sum_z"),
+        # Extremes cannot be subtracted, they are read back from the remaining rows when a removed one held them
+        min_z=case(
+            (table.c.min_z < bindparam("b_min_z"), table.c.min_z),
+            else_=_bucket_z(table, func.min),
+        ),
+        max_z=case(
+            (table.c.max_z > bindparam("b_max_z"), table.c.max_z),
+            else_=_bucket_z(table, func.max),
+        ),
+    )
+
+
+async def remove_rollups(conn: AsyncConnection, data: List[ProcessedAgentDataInDB]):
+    """
+    Remove updated or deleted records from the rollups, on the transaction that already changed them.
+    Counts and sums get the reverse delta, buckets left without samples are deleted.
+    """
+    if not data:
+        return
+    cells = [grid_cell(item.latitude, item.longitude) for item in data]
+    for resolution, (table, size) in RESOLUTIONS.items():
+        sums = _sums(data, cells, resolution)
+        await conn.execute(_subtract(table), [
+            {
+                "b_bucket_start": key[0],
+                "b_bucket_end": key[0] + size,
+                "b_grid_cell": key[1],
+                "b_road_state": key[2],
+                "b_sample_count": count,
+                "b_min_z": min_z,
+                "b_max_z": max_z,
+                "b_sum_z": sum_z,
+            }
+            for key, (count, min_z, max_z, sum_z) in sorted(sums.items())
+        ])
+        await conn.execute(
+            delete(table).where(
+                table.c.bucket_start == bindparam("b_bucket_start"),
+                table.c.grid_cell == bindparam("b_grid_cell"),
+                table.c.road_state == bindparam("b_road_state"),
+                table.c.sample_count <= 0,
+            ),
+            [{"b_bucket_start": key[0], "b_grid_cell": key[1], "b_road_state": key[2]} for key in sorted(sums)],
+        )
+
+
+async def backfill_rollups(conn: AsyncConnection):
+    """
+    Rebuild the rollups from every stored row, unless they were kept in step since the last rebuild.
+    Rows stored before rollups existed, or while they were turned off, are counted this way,
+    so later updates and deletes never subtract them from buckets that did not count them.
+    The rollup state row is claimed first, so of several stores starting at once only one rebuilds.
+    """
+    insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+    result = await conn.execute(
+        insert(rollup_state).values(id=1, backfilled_at=datetime.now(timezone.utc)).on_conflict_do_nothing()
+    )
+    if result.rowcount == 0:
+        return
+    if conn.dialect.name == "postgresql":
+        # Rows changed during the rebuild would be counted twice or not at all
+        await conn.execute(text("LOCK TABLE processed_agent_data IN SHARE MODE"))
+
+    for table, _ in RESOLUTIONS.values():
+        await conn.execute(delete(table))
+    columns = [processed_agent_data.c[name] for name in ["id", "road_state", "z", "latitude", "longitude", "timestamp"]]
+    last_id = 0
+    while True:
+        result = await conn.execute(
+            select(*columns)
+            .where(processed_agent_data.c.id > last_id)
+            .order_by(processed_agent_data.c.id)
+            .limit(STREAM_BATCH_SIZE)
+        )
+        rows = result.all()
+        if not rows:
+            return
+        await update_rollups(conn, rows)
+        last_id = rows[-1].id
+
+
+async def invalidate_rollups(conn: AsyncConnection):
+    """Mark the rollups for a rebuild, rows stored while they are turned off are not counted"""
+    await conn.execute(delete(rollup_state))
+
+
+def pick_resolution(start: datetime, end: datetime) -> str:
+    """The coarsest bucket size that splits the range into at least ROLLUP_MIN_BUCKETS buckets"""
+    for resolution, (_, size) in RESOLUTIONS.items():
+        if (end - start) / size >= ROLLUP_MIN_BUCKETS:
+            return resolution
+    return "minute"
+
+
+def rollup_query(
+    resolution: str,
+    start: datetime,
+    end: datetime,
+    road_state: Optional[str] = None,
+    bbox: Optional[Tuple[float, float, float, float]] = None,
+) -> Select:
+    """
+    Select rollups of a time range summed over grid cells.
+    Parameters:
+        resolution (str): "minute", "hour" or "day".
+        start (datetime): Inclusive start, the bucket holding it is included whole.
+        end (datetime): Exclusive end.
+        road_state (str): Only buckets of this road state.
+        bbox (Tuple[float, float, float, float]): Minimum latitude, minimum longitude, maximum latitude
+            and maximum longitude. Whole grid cells intersecting it are included.
+    Returns:
+        Select: Rows of bucket_start, road_state, sample_count, min_z, max_z and mean_z.
+    """
+    table, _ = RESOLUTIONS[resolution]
+    stmt = select(
+        table.c.bucket_start,
+        table.c.road_state,
+        func.sum(table.c.sample_count).label("sample_count"),
+        func.min(table.c.min_z).label("min_z"),
+        func.max(table.c.max_z).label("max_z"),
+        (func.sum(table.c.sum_z) / func.sum(table.c.sample_count)).label("mean_z"),
+    ).where(
+        table.c.bucket_start >= bucket_start(start, resolution),
+        table.c.bucket_start < end.replace(tzinfo=None),
+    )
+    if road_state is not None:
+        stmt = stmt.where(table.c.road_state == road_state)
+    if bbox is not None:
+        stmt = stmt.where(or_(*(table.c.grid_cell.between(first, last) for first, last in cell_ranges(*bbox))))
+    return stmt.group_by(table.c.bucket_start, table.c.road_state).order_by(table.c.bucket_start, table.c.road_state)
@@ -0,0 +1,130 @@
+import math
+from typing import List, Optional, Tuple
+
+from sqlalchemy import ColumnElement, Select, and_, func, or_, select
+
+from config import GRID_CELL_SIZE, SPATIAL_MAX_RANGES
+from db import processed_agent_data, processed_agent_data_columns
+
+EARTH_RADIUS = 6371008.8
+# Meters per degree of latitude
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+GRID_COLUMNS = math.ceil(360 / GRID_CELL_SIZE)
+
+# First row, last row, first column and last column of a box of grid cells
+CellBox = Tuple[int, int, int, int]
+
+
+def _row(latitude: float) -> int:
+    return int((min(max(latitude, -90.0), 90.0) + 90) // GRID_CELL_SIZE)
+
+
+def _column(longitude: float) -> int:
+    return min(int((min(max(longitude, -180.0), 180.0) + 180) // GRID_CELL_SIZE), GRID_COLUMNS - 1)
+
+
+def grid_cell(latitude: float, longitude: float) -> int:
+    """
+    Grid cell of a point, cells are GRID_CELL_SIZE degrees square and numbered row by row
+    from the south-west, so the cells of one row in a bounding box form a contiguous range.
+    """
+    return _row(latitude) * GRID_COLUMNS + _column(longitude)
+
+
+def cell_box(min_latitude: float, min_longitude: float, max_latitude: float, max_longitude: float) -> CellBox:
+    """First and last row and first and last column of the grid cells covering a bounding box"""
+    return _row(min_latitude), _row(max_latitude), _column(min_longitude), _column(max_longitude)
+
+
+def cell_ranges(
+    min_latitude: float, min_longitude: float, max_latitude: float, max_longitude: float
+) -> List[Tuple[int, int]]:
+    """Inclusive grid cell ranges covering a bounding box, one per row of cells"""
+    return box_ranges(cell_box(min_latitude, min_longitude, max_latitude, max_longitude))
+
+
+def box_ranges(box: CellBox, scanned: Optional[CellBox] = None) -> List[Tuple[int, int]]:
+    """
+    Inclusive grid cell ranges covering a box of cells, one per row of cells,
+    or two where a row crosses the `scanned` box, whose cells are left out.
+    """
+    first_row, last_row, first_column, last_column = box
+    if last_row - first_row + 1 > SPATIAL_MAX_RANGES:
+        # One wide range still uses the index, the exact bounds filter the extra columns
+        return [(first_row * GRID_COLUMNS + first_column, last_row * GRID_COLUMNS + last_column)]
+    ranges = []
+    for row in range(first_row, last_row + 1):
+        columns = [(first_column, last_column)]
+        if scanned is not None and scanned[0] <= row <= scanned[1]:
+            # The columns left and right of the scanned box
+            columns = [
+                (first_column, min(last_column, scanned[2] - 1)),
+                (max(first_column, scanned[3] + 1), last_column),
+            ]
+        for first, last in columns:
+            if first <= last:
+                ranges.append((row * GRID_COLUMNS + first, row * GRID_COLUMNS + last))
+    return ranges
+
+
+def bbox_query(min_latitude: float, min_longitude: float, max_latitude: float, max_longitude: float) -> Select:
+    """Select processed agent data inside a bounding box through the grid cell index"""
+    return select(*processed_agent_data_columns).where(
+        or_(*(
+            processed_agent_data.c.grid_cell.between(first, last)
+            for first, last in cell_ranges(min_latitude, min_longitude, max_latitude, max_longitude)
+        )),
+        and_(
+            processed_agent_data.c.latitude.between(min_latitude, max_latitude),
+            processed_agent_data.c.longitude.between(min_longitude, max_longitude),
+        ),
+    )
+
+
+def bbox_around(latitude: float, longitude: float, radius: float) -> Tuple[float, float, float, float]:
+    """Bounding box of a circle of `radius` meters, longitudes are not wrapped at the antimeridian"""
+    latitude_delta = radius / METERS_PER_DEGREE
+    cos_latitude = math.cos(math.radians(min(abs(latitude) + latitude_delta, 90.0)))
+    longitude_delta = 180.0 if cos_latitude < 1e-9 else min(180.0, latitude_delta / cos_latitude)
+    return (
+        max(-90.0, latitude - latitude_delta),
+        max(-180.0, longitude - longitude_delta),
+        min(90.0, latitude + latitude_delta),
+        min(180.0, longitude + longitude_delta),
+    )
+
+
+def distance_to(latitude: float, longitude: float) -> ColumnElement:
+    """Great-circle distance in meters of a processed agent data row to a point"""
+    phi = math.radians(latitude)
+    row_phi = func.radians(processed_agent_data.c.latitude)
+    a = (
+        func.power(func.sin((row_phi - phi) / 2), 2)
+        + math.cos(phi) * func.cos(row_phi)
+        * func.power(func.sin(func.radians(processed_agent_data.c.longitude - longitude) / 2), 2)
+    )
+    return 2 * EARTH_RADIUS * func.asin(func.sqrt(a))
+
+
+def radius_query(latitude: float, longitude: float, radius: float, limit: int) -> Select:
+    """Select up to `limit` rows no more than `radius` meters away with their distance, nearest first"""
+    row_distance = distance_to(latitude, longitude)
+    return (
+        bbox_query(*bbox_around(latitude, longitude, radius))
+        .add_columns(row_distance.label("distance"))
+        .where(row_distance <= radius)
+        .order_by(row_distance, processed_agent_data.c.id)
+        .limit(limit)
+    )
+
+
+def nearest_query(latitude: float, longitude: float, ranges: List[Tuple[int, int]], limit: int) -> Select:
+    """Select up to `limit` rows of grid cell ranges with their distance, nearest first"""
+    row_distance = distance_to(latitude, longitude)
+    return (
+        select(*processed_agent_data_columns, row_distance.label("distance"))
+        .where(or_(*(processed_agent_data.c.grid_cell.between(first, last) for first, last in ranges)))
+        .order_by(row_distance, processed_agent_data.c.id)
+        .limit(limit)
+    )